@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+Measure how long taxitrips.py takes to start up, as a whole (with --help) and
+for each of its commands.
+
+Each command imports what it needs when it runs, so the startup time of a
+command is measured by starting a fresh interpreter that loads the script and
+then runs just the import statements in the command's body -- everything a
+command does before getting to work. Imports made only with some options (like
+normalize --validate) are included, so the times are for the slowest case.
+
+    python bench_startup.py [--repeat N] [--imports]
+
+With --imports, also list the slowest modules each command imports, from
+python -X importtime.
+"""
+
+import ast
+import click
+import inspect
+import os
+import statistics
+import subprocess
+import sys
+import textwrap
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+HELP_CODE = 'import sys; sys.argv = ["taxitrips.py", "--help"]\n' \
+            'import taxitrips\n' \
+            'try:\n' \
+            '    taxitrips.cli()\n' \
+            'except SystemExit:\n' \
+            '    pass\n'
+
+
+def command_imports():
+    """
+    Return a dictionary of the import statements in the body of each command,
+    as source code.
+    """
+    from taxitrips import cli
+    imports = {}
+    for name, command in sorted(cli.commands.items()):
+        tree = ast.parse(textwrap.dedent(inspect.getsource(command.callback)))
+        statements = [ast.unparse(node) for node in ast.walk(tree)
+                      if isinstance(node, (ast.Import, ast.ImportFrom))]
+        imports[name] = '\n'.join(statements)
+    return imports
+
+
+def run(code, *options, **kwargs):
+    return subprocess.run([sys.executable] + list(options) + ['-c', code],
+                          cwd=HERE, check=True, **kwargs)
+
+
+def time_code(code, repeat):
+    """Return the wall times, in seconds, of repeat runs of the code."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(code, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def slowest_imports(code, top):
+    """Return the top (cumulative microseconds, module) pairs for the code."""
+    result = run(code, '-X', 'importtime', stdout=subprocess.DEVNULL,
+                 stderr=subprocess.PIPE, universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        # Only count top-level imports (not those nested under another module)
+        if module.startswith('  '):
+            continue
+        imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+@click.command()
+@click.option('--repeat', '-n', type=int, default=5, help='Number of times to start each command. Default is 5')
+@click.option('--imports', is_flag=True, help='Also list the slowest top-level imports of each command')
+def main(repeat, imports):
+    benchmarks = [('--help', HELP_CODE)]
+    benchmarks += [(name, 'import taxitrips\n' + statements)
+                   for name, statements in command_imports().items()]
+
+    # Get any bytecode compilation out of the way first.
+    for _, code in benchmarks:
+        run(code, stdout=subprocess.DEVNULL)
+
+    print('{:<15} {:>10} {:>10}'.format('command', 'median ms', 'min ms'))
+    for name, code in benchmarks:
+        times = time_code(code, repeat)
+        print('{:<15} {:>10.1f} {:>10.1f}'.format(
+            name, 1000 * statistics.median(times), 1000 * min(times)))
+        if imports:
+            for cumulative, module in slowest_imports(code, 5):
+                print('    {:<30} {:>8.1f} ms'.format(module, cumulative / 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,20 @@
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 from datetime import datetime
-import datum
+from glob import glob
+from multiprocessing import Pool
 import functools
-from itertools import combinations
-import numpy
 import os
 import phila_taxitrips.petl_ext as petl
-from phila_taxitrips.petl_ext import asnormpaytype, asisodatetime, asmoney
+from phila_taxitrips.petl_ext import asnormpaytype, asisodatetime, asmoney, moneytext, moneydecimal
+from phila_taxitrips.batching import AdaptiveBatchSize
+from phila_taxitrips.checkpoint import Checkpoint
+from phila_taxitrips import errors, localdb, partition
 import re
 
+# The database driver (datum) and the modules that use numpy (geometry, rowhash
+# and stats) are imported only where they're needed, since they're slow to
+# load and many steps don't use them.
+
 
 # Prevent cx_Oracle from converting everything to ASCII.
 os.environ['NLS_LANG'] = '.UTF8'
@@ -20,8 +26,30 @@ RAW_COLUMNS_CSV = ['Operator Name', 'Medallion', 'Chauffeur #',  'Meter On Datet
 RAW_COLUMNS_DB  = ['Operator_Name', 'Medallion', 'Chauffeur_No', 'Meter_On_Datetime', 'Meter_Off_Datetime', 'Trip_Length', 'Pickup_Latitude', 'Pickup_Longitude', 'Pickup_Location', 'Dropoff_Latitude', 'Dropoff_Longitude', 'Dropoff_Location', 'Fare', 'Tax', 'Tips', 'Tolls', 'Surcharge', 'Trip_Total', 'Payment_Type', 'Street_or_Dispatch', 'Data_Source']
 PUBLIC_COLUMNS_CSV = ['Operator Name', 'Anonymized Medallion', 'Anonymized Chauffeur #',  'Pickup General Time', 'Dropoff General Time', 'Trip Length', 'Pickup Zip Code', 'Pickup Region Centroid Latitude', 'Pickup Region Centroid Longitude', 'Pickup Region ID', 'Dropoff Zip Code', 'Dropoff Region Centroid Latitude', 'Dropoff Region Centroid Longitude', 'Dropoff Region ID', 'Region Map Version', 'Fare', 'Tax', 'Tips', 'Tolls', 'Surcharge', 'Trip Total', 'Payment Type', 'Street/Dispatch',    'Data Source']
 PUBLIC_COLUMNS_DB  = ['Operator_Name', 'Anonymized_Medallion_ID', 'Anonymized_Driver_ID', 'Pickup_General_Time', 'Dropoff_General_Time', 'Trip_Length', 'Pickup_Zip_Code', 'Pickup_Region_Centroid_Lat',      'Pickup_Region_Centroid_Long',      'Pickup_Region_ID', 'Dropoff_Zip_Code', 'Dropoff_Region_Centroid_Lat',      'Dropoff_Region_Centroid_Long',      'Dropoff_Region_ID', 'Region_Map_Version', 'Fare', 'Tax', 'Tips', 'Tolls', 'Surcharge', 'Trip_Total', 'Payment_Type', 'Street_or_Dispatch', 'Data_Source']
-
-def normalize(verifone_filenames, cmt_filenames):
+MONEY_COLUMNS_CSV = ['Fare', 'Tax', 'Tips', 'Tolls', 'Surcharge', 'Trip Total']
+MONEY_COLUMNS_DB  = ['Fare', 'Tax', 'Tips', 'Tolls', 'Surcharge', 'Trip_Total']
+
+# Indexes built on the public table after a full refresh (see
+# petl_ext.todb_swap), as (name, columns) pairs. The names are kept short
+# enough for Oracle (30 characters) with a _new suffix.
+PUBLIC_INDEXES = [
+    ('pub_trips_pickup_time', ['Pickup_General_Time']),
+    ('pub_trips_pickup_region', ['Pickup_Region_ID']),
+    ('pub_trips_dropoff_region', ['Dropoff_Region_ID']),
+]
+
+# Tables to create when working against a local SQLite database (see localdb),
+# mirroring the ones described in SCHEMA.md.
+LOCAL_TABLES = {
+    'taxi_trips': (RAW_COLUMNS_DB, petl.UPSERT_ID_COLUMNS),
+    'public_taxi_trips': (PUBLIC_COLUMNS_DB, None),
+}
+LOCAL_ID_TABLES = {
+    'chauffeur_no_ids': 'Chauffeur_No',
+    'medallion_ids': 'Medallion',
+}
+
+def normalize(verifone_filenames, cmt_filenames, geometry=False, processes=None):
     """
     1. Combine CMT/Verifone data
     2. Add a new column that specifies whether each trip came from CMT or
@@ -30,37 +58,72 @@ def normalize(verifone_filenames, cmt_filenames):
     4. Remove Device Type column.
     5. Format Columns R, S, T, U, V, and W to be 2 decimal points and currency.
     6. Round minutes to the nearest 15 minutes.
+
+    With geometry set, also add the straight-line distance, heading and
+    cardinal direction of each trip (see add_geometry).
+
+    With more than one process, each file is split into pieces that are read
+    and normalized in that many processes at once (see petl_ext.fromcsvs), so
+    that even a single large file is normalized on several cores. The trips
+    come out in the same order either way.
+
+    Dates and amounts that can't be read are left empty, and rows with the
+    wrong number of fields are left out; both are counted in errors.collector.
     """
+    # Either list of files may be empty (e.g., when normalizing one file at a
+    # time -- see normalize_partitioned)
+    tables = []
+
     # Load and normalize Verifone tables
     ver_fieldnames = ['Shift #', 'Trip #', 'Operator Name', 'Medallion', 'Device Type', 'Chauffeur #', 'Meter On Datetime', 'Meter Off Datetime', 'Trip Length', 'Pickup Latitude', 'Pickup Longitude', 'Pickup Location', 'Dropoff Latitude', 'Dropoff Longitude', 'Dropoff Location', 'Fare', 'Tax', 'Tips', 'Tolls', 'Surcharge', 'Trip Total', 'Payment Type', 'Street/Dispatch']
-    ver_table = petl.fromcsvs(verifone_filenames, fieldnames=ver_fieldnames,
-                              encoding='windows-1252')\
+    if verifone_filenames:
+        tables.append(petl.fromcsvs(verifone_filenames, fieldnames=ver_fieldnames,
+                                    encoding='windows-1252', processes=processes,
+                                    transform=functools.partial(_normalize_verifone, geometry=geometry)))
+
+    # Load and normalize CMT tables
+    if cmt_filenames:
+        tables.append(petl.fromcsvs(cmt_filenames, processes=processes,
+                                    transform=functools.partial(_normalize_cmt, geometry=geometry)))
+
+    # Concatenate verifone and cmt tables
+    return petl.cat(*[t for t in tables if t is not None])
+
+
+# The normalization is split into module-level functions of a table, so that
+# it can be done to pieces of the files in other processes.
+
+def _normalize_verifone(table, geometry=False):
+    table = errors.checklength(table)\
         .addfield('Data Source', 'verifone')\
         .convert('Payment Type', asnormpaytype)\
         .convert('Meter On Datetime', lambda val: val[:19] if val else '')\
         .convert('Meter Off Datetime', lambda val: val[:19] if val else '')
+    return _normalize_trips(table, geometry)
 
-    # Load and normalize CMT tables
-    cmt_table = petl.fromcsvs(cmt_filenames)\
+
+def _normalize_cmt(table, geometry=False):
+    table = errors.checklength(table)\
         .addfield('Data Source', 'cmt')\
-        .convert('Meter On Datetime', asisodatetime)\
-        .convert('Meter Off Datetime', asisodatetime)
+        .convert({
+            'Meter On Datetime': errors.checked(asisodatetime, 'Meter On Datetime', 'bad date'),
+            'Meter Off Datetime': errors.checked(asisodatetime, 'Meter Off Datetime', 'bad date'),
+        })
+    return _normalize_trips(table, geometry)
 
-    # Concatenate verifone and cmt tables, and do further transformations
-    concat_table = petl.cat(ver_table, cmt_table)\
+
+def _normalize_trips(table, geometry=False):
+    # Further transformations, the same for both vendors
+    table = table\
         .cutout('Trip #')\
         .cutout('Shift #')\
         .cutout('Device Type')\
-        .convert('Fare', asmoney)\
-        .convert('Tax', asmoney)\
-        .convert('Tips', asmoney)\
-        .convert('Tolls', asmoney)\
-        .convert('Surcharge', asmoney)\
-        .convert('Trip Total', asmoney)\
+        .convert({column: errors.checked(asmoney, column, 'bad amount')
+                  for column in MONEY_COLUMNS_CSV})
 
     # Additional data suggested by Tom Swanson
     dt_pattern = '%Y-%m-%d %H:%M:%S'
-    concat_table = concat_table\
+    table = table\
         .addfields(
             ('_pickup_dt', petl.parsedate('Meter On Datetime', dt_pattern)),
             ('_dropoff_dt', petl.parsedate('Meter Off Datetime', dt_pattern)))\
@@ -82,7 +145,22 @@ def normalize(verifone_filenames, cmt_filenames):
         .addfield('Trip Duration (minutes)', lambda row: int((row._dropoff_dt - row._pickup_dt).total_seconds() / 60) if row._pickup_dt and row._dropoff_dt else None, index=5)\
         .cutout('_pickup_dt', '_dropoff_dt')
 
-    return concat_table
+    if geometry:
+        table = add_geometry(table)
+
+    return table
+
+
+def add_geometry(table, batch_size=10000):
+    """
+    Add the straight-line distance (in miles), heading (in degrees) and
+    cardinal direction from each trip's pickup location to its dropoff
+    location. The values are computed with numpy over batches of batch_size
+    trips, since doing the trigonometry row by row is slow over a year of
+    trips.
+    """
+    from phila_taxitrips.geometry import GEOMETRY_FIELDS, trip_geometry
+    return table.addbatchfields(GEOMETRY_FIELDS, trip_geometry, batch_size=batch_size)
 
 
 def load_shapes(geojson_file):
@@ -177,12 +255,46 @@ def rematch(pattern, field, matchgroup=1):
     return _getmatch
 
 
-def fuzzy(csvfile, regionfile):
-    region_collection, idx = load_shapes(regionfile)
+def as_table(source):
+    """
+    Return the source as a table: a CSV file name is read as a CSV table, a list
+    of them as one table of all the files, and anything else is assumed to be
+    a table already. This lets the steps of the
+    process be chained together in memory, as well as run on files.
+    """
+    if isinstance(source, str):
+        return petl.fromcsv(source)
+    if isinstance(source, (list, tuple)):
+        return petl.fromcsvs(source)
+    return source
+
+
+def echo(table, filename):
+    """
+    Also write the rows of the table to a CSV file as they go by (see
+    petl_ext.tee), e.g. to keep an intermediate step's output.
+    """
+    return table.tee(petl.CSVSink(filename))
+
+
+def fuzzy(csvfile, regionfile, geometry=False):
+    # The regions can be given as an open file or a file name (which, unlike an
+    # open file, can be passed to another process -- see pipeline).
+    if isinstance(regionfile, str):
+        with open(regionfile) as regions:
+            region_collection, idx = load_shapes(regions)
+    else:
+        region_collection, idx = load_shapes(regionfile)
+
+    # The exact locations are cut out below, so any geometry has to be
+    # calculated first.
+    table = as_table(csvfile)
+    if geometry:
+        table = add_geometry(table)
 
     # Generalize the locations
     zip_pattern = re.compile('.*[^\d](\d+)$')
-    table = petl.fromcsv(csvfile)\
+    table = table\
         .addfields(
             ('pickup_region', find_feature('Pickup Latitude', 'Pickup Longitude', region_collection, idx)),
             ('dropoff_region', find_feature('Dropoff Latitude', 'Dropoff Longitude', region_collection, idx)))\
@@ -203,32 +315,231 @@ def fuzzy(csvfile, regionfile):
     return table
 
 
+def _normalize_part(args):
+    verifone_filenames, cmt_filenames, outdir, name, months, geometry = args
+    # Collect the file's problems on their own, to hand back with its counts
+    # (see errors).
+    errors.collector = errors.ErrorCollector(interval=None, keep_rejects=True)
+    table = normalize(verifone_filenames, cmt_filenames, geometry=geometry)
+    counts = partition.write_partitions(table, outdir, name, months)
+    return name, counts, errors.collector.state()
+
+
+def normalize_partitioned(verifone_filenames, cmt_filenames, outdir,
+                          months=None, geometry=False, processes=None):
+    """
+    Normalize the vendor files into a directory partitioned by pickup month
+    (see partition), normalizing the files in parallel over a pool of
+    processes. Each input file becomes one part of each month it has trips in.
+
+    If months (a list of YYYY-MM strings) is given, only those partitions are
+    written, replacing what was there before; the others are left alone.
+    """
+    verifone_filenames = [f for p in verifone_filenames for f in sorted(glob(p))]
+    cmt_filenames = [f for p in cmt_filenames for f in sorted(glob(p))]
+    months = set(months) if months else None
+    work = [([f], [], outdir, 'part-{:04d}'.format(i), months, geometry)
+            for i, f in enumerate(verifone_filenames)]
+    work += [([], [f], outdir, 'part-{:04d}'.format(len(work) + i), months, geometry)
+             for i, f in enumerate(cmt_filenames)]
+
+    manifest = partition.Manifest(outdir)
+    manifest.clear(months)
+    with Pool(processes) as pool:
+        for name, counts, error_state in sorted(pool.imap_unordered(_normalize_part, work)):
+            manifest.add(name, counts)
+            errors.collector.merge(error_state)
+    manifest.save()
+    return manifest
+
+
+def _fuzzy_part(args):
+    source, regionfile, outdir, name, months, geometry = args
+    table = fuzzy(source, regionfile, geometry=geometry)
+    return name, partition.write_partitions(table, outdir, name, months)
+
+
+def fuzzy_partitioned(source, regionfile, outdir, months=None, geometry=False,
+                      processes=None):
+    """
+    Fuzzy trips into a directory partitioned by pickup month (see partition).
+    The source is either a CSV file or a partitioned directory, such as the
+    output of normalize_partitioned; in the latter case, the months are fuzzied
+    in parallel over a pool of processes. The regionfile must be a file name,
+    so that it can be passed to the other processes.
+
+    If months (a list of YYYY-MM strings) is given, only those partitions are
+    written, replacing what was there before; the others are left alone.
+    """
+    months = set(months) if months else None
+    if os.path.isdir(source) and partition.Manifest.exists(source):
+        inputs = partition.Manifest(source)
+        work = [(inputs.files(month), regionfile, outdir, 'part-0000', {month}, geometry)
+                for month in inputs.months()
+                if months is None or month in months]
+    else:
+        work = [(source, regionfile, outdir, 'part-0000', months, geometry)]
+
+    manifest = partition.Manifest(outdir)
+    manifest.clear(months)
+    with Pool(processes) as pool:
+        for name, counts in pool.imap_unordered(_fuzzy_part, work):
+            manifest.add(name, counts)
+    manifest.save()
+    return manifest
+
+
 def upload(csvfile, db_conn_string, table_name, csv_fields, db_fields,
-           wrap_table=lambda t: t, group_size=100000):
+           wrap_table=lambda t: t, group_size=100000, pipeline=0,
+           connections=1, index_file=None, checkpoint_every=0, resume=False,
+           echo=None, monitor=None, dedupe=None, sort_buffersize=None,
+           typed_money=False, strategy='merge', indexes=()):
     """
-    Load a merged taxi trips table from a CSV file into the database (first step
-    in anonymization process). Only insert new data.
+    Load a merged taxi trips table from a CSV file (or a table already in
+    memory) into the database (first step in anonymization process). Only
+    insert new data.
 
     The wrap_table function can be used to modify the table before passing it
-    along to the upsert function. For example:
+    along to the upsert function. For example, to count the rows uploaded with a
+    telemetry Monitor:
 
-        upload(..., wrap_table=lambda t: t.progress())
+        upload(..., wrap_table=monitor.view, monitor=monitor)
 
     You can specify how many upsert statements are sent to the server at a time
-    with the group_size keyword.
+    with the group_size keyword. Set group_size to 'auto' to have the size
+    adjusted as the upload runs, based on the measured throughput. With pipeline set to a positive number, up to
+    that many groups are read from the CSV file on a background thread while the
+    server works on the current one.
+
+    With more than one connection, rows are partitioned on their identifying
+    columns and sent over that many connections in parallel, each fed from
+    the reading thread, so they can't be combined with pipeline. The
+    connections are committed one after the other at the end, or all rolled
+    back if any one of them fails before then (see
+    petl_ext.todb_upsert_partitioned).
+
+    If an index_file is given, a hash of every uploaded row is kept there, and
+    rows that are identical to ones uploaded before are not sent again. The
+    index is only updated as the upload is committed.
+
+    With checkpoint_every set, the upload is committed every that many groups,
+    and its progress is recorded in a sidecar file next to the CSV file. If the
+    upload fails, calling upload again with resume=True will start reading the
+    CSV file right after the last committed row; resume without checkpoint_every
+    is an error, rather than a fresh upload from the start. Checkpoints cannot
+    be combined with multiple connections, which are committed all at once.
+
+    If echo is given, every row read is also written to that CSV file (or to
+    stdout, if echo is '-') in the same pass, with the database field names.
+
+    If a telemetry Monitor is given, the time taken by each group sent to the
+    database is recorded with it.
+
+    With dedupe set to 'first' or 'last', the rows are sorted on the trip's
+    identifying columns (on whole rows, for tables without them) and only the
+    first or last row read for each trip is sent, so that the server doesn't
+    have to resolve duplicates from overlapping deliveries one MERGE at a time.
+    The sort spills to temporary files beyond sort_buffersize rows (see
+    petl_ext.dedupe). Deduplicated uploads cannot be checkpointed, since the
+    rows are no longer sent in the order they were read.
+
+    Money columns are sent as text, like '8.22', unless typed_money is set, in
+    which case they are sent as Decimal numbers, for NUMBER(10,2) columns (see
+    SCHEMA.md). Amounts that can't be read as numbers are then sent as NULL,
+    and counted in errors.collector.
+
+    With strategy set to 'swap', the table's contents are replaced rather than
+    merged into: the rows are bulk-inserted into a shadow copy of the table,
+    the indexes (as (name, columns) pairs) are built on it, and it is swapped
+    in for the live table (see petl_ext.todb_swap). This is for tables like
+    the public one, which have no identifying columns to MERGE on, and are
+    reloaded in full. Swaps use a single connection, and send every row, so
+    they can't be combined with connections, index_file or checkpoint_every.
     """
-    with db_conn(db_conn_string) as db:
-        t = petl.fromcsv(csvfile)\
-            .cut(csv_fields)\
-            .setheader(db_fields)
-        petl.todb_upsert(wrap_table(t), 'taxi_trips', db, group_size=group_size)
+    if strategy not in ('merge', 'swap'):
+        raise ValueError('Unknown upload strategy: {}'.format(strategy))
+    if strategy == 'swap' and (connections > 1 or index_file or checkpoint_every):
+        raise ValueError('Swap uploads must use a single connection, and send every row without checkpoints')
+    if resume and not checkpoint_every:
+        raise ValueError('Only checkpointed uploads can be resumed; give the same checkpoint_every as the upload being resumed')
+    if pipeline and connections > 1:
+        raise ValueError('Uploads over several connections are already read ahead; they can\'t be combined with pipeline')
+    if checkpoint_every and connections > 1:
+        raise ValueError('Checkpointed uploads must use a single connection')
+    if checkpoint_every and not isinstance(csvfile, str):
+        raise ValueError('Checkpointed uploads must read from a CSV file')
+    if checkpoint_every and dedupe:
+        raise ValueError('Deduplicated uploads cannot be checkpointed')
+
+    if checkpoint_every:
+        checkpoint = Checkpoint(csvfile, checkpoint_every)
+        source = checkpoint.open(resume=resume)
+    else:
+        checkpoint = None
+        source = as_table(csvfile)
+
+    t = source\
+        .cut(csv_fields)\
+        .setheader(db_fields)
+    if echo is not None:
+        t = t.tee(petl.CSVSink(None if echo == '-' else echo))
+    if dedupe:
+        key = [c for c in petl.UPSERT_ID_COLUMNS if c in db_fields] or list(db_fields)
+        t = t.dedupe(key, keep=dedupe, buffersize=sort_buffersize)
+    money_columns = [c for c in MONEY_COLUMNS_DB if c in db_fields]
+    if typed_money:
+        # As in normalize, amounts that can't be read are counted, and sent as
+        # NULL, rather than failing the upload.
+        t = t.convert({c: errors.checked(moneydecimal, c, 'bad amount') for c in money_columns})
+    else:
+        t = t.convert(money_columns, moneytext)
+
+    if index_file:
+        from phila_taxitrips.rowhash import RowHashIndex
+        index = RowHashIndex(index_file)
+    else:
+        index = None
+    if group_size == 'auto':
+        group_size = AdaptiveBatchSize()
+
+    if strategy == 'swap':
+        with db_conn(db_conn_string) as db:
+            petl.todb_swap(wrap_table(t), table_name, db, indexes=indexes,
+                           group_size=group_size, pipeline=pipeline,
+                           monitor=monitor)
+    elif connections > 1:
+        with ExitStack() as stack:
+            dbs = [stack.enter_context(db_conn(db_conn_string))
+                   for _ in range(connections)]
+            petl.todb_upsert_partitioned(wrap_table(t), table_name, dbs,
+                                         group_size=group_size, index=index,
+                                         monitor=monitor)
+    else:
+        with db_conn(db_conn_string) as db:
+            petl.todb_upsert(wrap_table(t), table_name, db, group_size=group_size,
+                             pipeline=pipeline, index=index, checkpoint=checkpoint,
+                             monitor=monitor)
+
+    if index is not None:
+        index.save()
+    if checkpoint is not None:
+        checkpoint.clear()
 
     return t
 
 
 @contextmanager
 def db_conn(db_conn_string):
-    db = datum.connect(db_conn_string)
+    """
+    Connect to the database. Connection strings starting with sqlite: connect
+    to a local stand-in for the Oracle database instead (see localdb).
+    """
+    if localdb.is_local(db_conn_string):
+        db = localdb.connect(db_conn_string)
+        db.create_tables(LOCAL_TABLES, LOCAL_ID_TABLES)
+    else:
+        import datum
+        db = datum.connect(db_conn_string)
     yield db
     db.save()
     db.close()
@@ -268,7 +579,23 @@ def update_anon(db_conn_str, table_name, column_table_pairs):
                    column_name=column_name,
                    ids_table_name=ids_table_name)
 
+    # SQLite has no MERGE, but inserting only the missing values does the same.
+    make_sqlite_sql = lambda column_name, ids_table_name: '''
+        INSERT INTO {ids_table_name} ({column_name})
+            SELECT ts.{column_name}
+                FROM {table_name} ts
+                LEFT JOIN {ids_table_name} ids
+                ON ts.{column_name} = ids.{column_name}
+                WHERE ids.id IS NULL
+                AND ts.{column_name} IS NOT NULL
+                GROUP BY ts.{column_name}
+        '''.format(table_name=table_name,
+                   column_name=column_name,
+                   ids_table_name=ids_table_name)
+
     with db_conn(db_conn_str) as db:
+        if getattr(db, 'dialect', 'oracle') == 'sqlite':
+            make_sql = make_sqlite_sql
         for col, ids in column_table_pairs:
             logger.info('Updating anonymization table {}'.format(ids))
             sql = make_sql(col, ids)
@@ -285,7 +612,7 @@ def anonymize(csvfile, db_conn_str, field_tuples):
             anon_mapping[table] = {result[1]: result[0] for result in queryresults}
 
     # add an anonymized field for each of the fields
-    table = petl.fromcsv(csvfile)
+    table = as_table(csvfile)
     for csvfield, tablename, dbfield in field_tuples:
         logger.info('Setting up anonymization for {}'.format(csvfield))
         table = table.addfield('Anonymized ' + csvfield, lambda row, t=tablename, f=csvfield: anon_mapping[t][row[f]] if row[f] else None)
@@ -293,27 +620,8 @@ def anonymize(csvfile, db_conn_str, field_tuples):
     return table
 
 
-def filter_outliers(values, scale=2):
-    """
-    Filtering outliers of a sample, particularly a non-symetric one, is fraught
-    with gotchas. For a comprehensive run down of the complications, see
-    http://eurekastatistics.com/using-the-median-absolute-deviation-to-find-outliers/.
-
-    Here, use a median absolute difference (MAD) approach, which should be good
-    enough to alert us of problems, even if it's not entirely rigorous.
-    """
-    median = numpy.median(values)
-    dists = tuple(abs(val - median) for val in values)
-    median_dist = numpy.median(dists)
-
-    def lte_mad(val):
-        dist = abs(val - median)
-        return dist <= (median_dist * scale)
-
-    return tuple(filter(lte_mad, values))
-
-
-def validate_trip_lengths(csvfile):
+def validate_trip_lengths(csvfile, length_field='Trip_Length',
+                          source_field='Data_Source'):
     """
     Check that the averages of the data sources are all within a standard
     deviation of each other. Do this by:
@@ -324,28 +632,14 @@ def validate_trip_lengths(csvfile):
     4. Finding the mean and standard deviation of these "normal" groups, and
     5. Ensuring that each pair of sources is within one standard deviation of
        each other's mean.
+
+    The trip lengths are streamed into a compact array per source (see
+    TripLengthStats), so memory use stays at a few bytes per trip.
     """
-    table = petl.fromcsv(csvfile)\
-                .cut('Trip_Length', 'Data_Source')\
-                .convert('Trip_Length', float)\
-                .aggregate('Data_Source', {'Trip_Lengths': ('Trip_Length', tuple)})\
-                .convert('Trip_Lengths', filter_outliers)\
-                .addfields(
-                    ('mean', lambda row: numpy.mean(row['Trip_Lengths'])),
-                    ('std', lambda row: numpy.std(row['Trip_Lengths'])))\
-                .cutout('Trip_Lengths')\
-                .cache()
-
-    errors = []
-    for source1, source2 in combinations(table.records(), 2):
-        # get the distance between the means
-        dist = abs(source1.mean - source2.mean)
-
-        # check that the distance is within the standard error (i.e. 1 standard
-        # deviation) of each sample
-        if dist <= min(source1.std, source2.std):
-            continue
-        else:
-            errors.append('{} and {} samples are farther apart than expected'.format(source1.Data_Source, source2.Data_Source))
+    from phila_taxitrips.stats import TripLengthStats
+    stats = TripLengthStats(length_field, source_field)
+    for length, source in petl.fromcsv(csvfile).cut(length_field, source_field).data():
+        stats.add(source, float(length))
 
-    return table, errors
+    table = stats.table().cache()
+    return table, stats.errors(table)
@@ -0,0 +1,143 @@
+"""
+Controllers for how many rows are sent to the database in each executemany
+call.
+
+The best batch size depends on how wide the rows are and how busy the server
+is, so rather than picking one by hand, AdaptiveBatchSize measures the
+throughput of each call and searches for the size that moves rows fastest,
+without letting a single batch grow past a memory budget.
+"""
+
+from collections import OrderedDict
+from itertools import islice
+from threading import Lock
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def batches(sizer, iterable):
+    """
+    Yield lists of rows from the iterable, asking the sizer how large each one
+    should be (e.g., batches(FixedBatchSize(3), 'ABCDEFG') --> ABC DEF G).
+    """
+    it = iter(iterable)
+    first = True
+    while True:
+        batch = list(islice(it, sizer.size))
+        if not batch:
+            return
+        if first:
+            sizer.fit(batch)
+            first = False
+        yield batch
+
+
+class FixedBatchSize:
+    """Always use the same batch size."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def fit(self, sample_rows):
+        pass
+
+    def record(self, num_rows, seconds, size=None):
+        pass
+
+    def report(self):
+        return []
+
+
+class AdaptiveBatchSize:
+    """
+    Grow or shrink the batch size based on measured throughput.
+
+    The controller does a simple hill climb: after every `window` calls at a
+    given size, it compares the rows per second against the previous size. If
+    throughput went up, it keeps moving the size in the same direction by a
+    factor of `step`; otherwise it turns around and halves the step (down to
+    `min_step`), so that the size settles near the fastest setting. The size
+    always stays between `minimum` and `maximum` rows, and a batch is never
+    allowed to take more than roughly `max_bytes` of memory, based on the size
+    of the first rows seen.
+    """
+
+    def __init__(self, initial=1000, minimum=100, maximum=200000,
+                 max_bytes=256 * 1024 * 1024, step=2.0, min_step=1.1, window=3):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_bytes = max_bytes
+        self.step = step
+        self.min_step = min_step
+        self.window = window
+
+        self.direction = 1
+        self.previous_rate = None
+        self.window_rows = 0
+        self.window_seconds = 0.0
+        self.window_calls = 0
+        self.history = OrderedDict()
+        self.sizes = {initial}
+        self.lock = Lock()
+
+    def fit(self, sample_rows):
+        """Cap the batch size based on the memory taken by the sample rows."""
+        row_bytes = sum(
+            sum(len(str(v)) for v in row) + 16 * len(row) + 64
+            for row in sample_rows) / len(sample_rows)
+        self.maximum = max(self.minimum, min(self.maximum, int(self.max_bytes / row_bytes)))
+        self.size = min(self.size, self.maximum)
+        self.sizes.add(self.size)
+
+    def record(self, num_rows, seconds, size=None):
+        """
+        Record that sending num_rows took the given number of seconds. The size
+        is that of the batch the rows were sent from, if some of them were
+        filtered out (by default, num_rows). Batches may have been built ahead
+        of time at an earlier size, so the history is kept by the size of each
+        batch rather than the current setting; batches of a size that was
+        never set, like the short last one, are left out of it.
+        """
+        if size is None:
+            size = num_rows
+        with self.lock:
+            if size in self.sizes:
+                calls, rows, total = self.history.get(size, (0, 0, 0.0))
+                self.history[size] = (calls + 1, rows + num_rows, total + seconds)
+
+            self.window_calls += 1
+            self.window_rows += num_rows
+            self.window_seconds += seconds
+            if self.window_calls < self.window:
+                return
+
+            rate = self.window_rows / self.window_seconds if self.window_seconds else float('inf')
+            if self.previous_rate is not None and rate < self.previous_rate:
+                self.direction = -self.direction
+                self.step = max(self.min_step, 1 + (self.step - 1) / 2)
+            self.previous_rate = rate
+            self.window_calls = self.window_rows = 0
+            self.window_seconds = 0.0
+
+            if self.direction > 0:
+                size = int(self.size * self.step)
+            else:
+                size = int(self.size / self.step)
+            self.size = max(self.minimum, min(self.maximum, size))
+            self.sizes.add(self.size)
+
+    def report(self):
+        """
+        Log and return a list of (batch size, calls, rows, rows per second) for
+        each batch size that was tried, in the order they were first tried.
+        """
+        summary = [(size, calls, rows, rows / seconds if seconds else float('inf'))
+                   for size, (calls, rows, seconds) in self.history.items()]
+        for size, calls, rows, rate in summary:
+            logger.info('Batch size {}: {} calls, {} rows, {:.0f} rows/sec'.format(size, calls, rows, rate))
+        if summary:
+            best = max(summary, key=lambda s: s[3])
+            logger.info('Best batch size was {} at {:.0f} rows/sec'.format(best[0], best[3]))
+        return summary
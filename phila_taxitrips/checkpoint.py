@@ -0,0 +1,146 @@
+"""
+Support for resuming a long upload after a failure, without re-reading or
+re-sending the part of the input that has already been committed.
+
+While uploading, the database is committed every so many row groups, and the
+byte offset in the input file just past the last committed row is written to a
+sidecar file next to the input. On resume, the input is opened directly at that
+offset.
+"""
+
+import csv
+from hashlib import sha1
+import io
+import json
+import os
+from petl import Table
+from .streams import infer_compression, open_stream
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(path, sample_size=1024 * 1024):
+    """
+    Identify the contents of a file by its size, modification time, and a hash
+    of its first sample_size bytes.
+    """
+    stat = os.stat(path)
+    with open(path, 'rb') as infile:
+        digest = sha1(infile.read(sample_size)).hexdigest()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': digest}
+
+
+class CSVOffsetView(Table):
+    """
+    A CSV table that keeps track of the byte offset in the file just past the
+    last row it has produced. If start is given, the header is still read from
+    the top of the file, but the data rows are read from that offset onward.
+    """
+
+    def __init__(self, path, start=0, encoding='utf-8', **csvargs):
+        self.path = path
+        self.start = start
+        self.encoding = encoding
+        self.csvargs = csvargs
+        self.offset = start
+
+    def _lines(self, infile):
+        # Advance the offset one physical line at a time, as the csv reader
+        # asks for them, so that it always falls on a record boundary between
+        # rows.
+        for line in iter(infile.readline, b''):
+            self.offset += len(line)
+            yield line.decode(self.encoding)
+
+    def __iter__(self):
+        # Read through a counting stream, so that the bytes read are reported
+        # (see telemetry) as they are for other inputs. The rows are read a
+        # line at a time anyway, and a small buffer keeps the reads that only
+        # want the header from counting much more than that.
+        with open_stream(self.path, 'rb', compression='none',
+                         buffer_size=io.DEFAULT_BUFFER_SIZE) as infile:
+            self.offset = 0
+            reader = csv.reader(self._lines(infile), **self.csvargs)
+
+            hdr = next(reader)
+            if hdr:
+                hdr[0] = hdr[0].lstrip('\ufeff')
+            yield tuple(hdr)
+
+            if self.start > self.offset:
+                infile.seek(self.start)
+                self.offset = self.start
+
+            for row in reader:
+                yield tuple(row)
+
+
+class Checkpoint:
+    """
+    Record of how far an upload of csvfile has been committed, kept in a JSON
+    sidecar file. The upload commits every `every` row groups.
+    """
+
+    def __init__(self, csvfile, every, path=None):
+        self.csvfile = csvfile
+        self.every = every
+        self.path = path or csvfile + '.checkpoint'
+        self.reader = None
+        self.fingerprint = None
+        self.rows = 0
+
+    def load(self):
+        """
+        Return the offset to resume the upload of the input from, or 0 if there
+        is no checkpoint. Raises a ValueError if the input file has changed
+        since the checkpoint was written.
+        """
+        if not os.path.exists(self.path):
+            logger.warning('No checkpoint found at {}; starting from the beginning'.format(self.path))
+            return 0
+
+        with open(self.path) as infile:
+            state = json.load(infile)
+
+        if state['fingerprint'] != self.fingerprint:
+            raise ValueError('{} has changed since the checkpoint in {} was written'.format(self.csvfile, self.path))
+
+        self.rows = state['rows']
+        logger.info('Resuming upload of {} after {} committed rows'.format(self.csvfile, self.rows))
+        return state['offset']
+
+    def open(self, resume=False, **csvargs):
+        """
+        Open the input as a CSVOffsetView, starting after the last committed
+        row if resume is True. Compressed inputs can't be resumed at an offset,
+        so they can't be checkpointed.
+        """
+        if infer_compression(self.csvfile) is not None:
+            raise ValueError('Checkpointed uploads cannot read compressed files')
+        self.fingerprint = fingerprint(self.csvfile)
+        start = self.load() if resume else 0
+        self.reader = CSVOffsetView(self.csvfile, start=start, **csvargs)
+        return self.reader
+
+    def position(self):
+        """The offset in the input just past the last row read."""
+        return self.reader.offset
+
+    def save(self, offset, rows):
+        """Record that everything before offset has been committed."""
+        self.rows += rows
+        state = {
+            'fingerprint': self.fingerprint,
+            'offset': offset,
+            'rows': self.rows,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(state, outfile)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Remove the checkpoint once the whole input has been committed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
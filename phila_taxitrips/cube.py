@@ -0,0 +1,198 @@
+"""
+An origin-destination cube of trip counts and money totals, by pickup region,
+dropoff region, pickup hour and pickup day of week, built from the output of
+fuzzy, so that rollups (e.g., trips from each region by hour) can be served
+without scanning every trip again.
+
+With a few thousand regions, most of the region x region x hour x day cells
+are empty, so only the non-empty cells are kept: each cell has a single int64
+code that combines its four coordinates, and the measures are int64 arrays
+alongside the sorted codes (money in whole cents). Trips are accumulated a
+large batch of rows at a time, by computing the codes of the whole batch at
+once and summing the measures per code with numpy.unique and bincount.
+
+Cell codes depend only on the region IDs themselves (not on which regions have
+been seen so far), so a new week of trips is added by merging its cells into
+the existing ones. The names of the batches that have been added are kept in
+the cube, so that the same week isn't counted twice.
+
+The cube is stored as a single .npz file.
+"""
+
+import numpy
+import os
+from . import petl_ext as petl
+from .itertools_ext import chunks
+
+import logging
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('pickup_region', 'dropoff_region', 'hour', 'dow')
+MEASURES = ('trips', 'fare_cents', 'tips_cents', 'total_cents')
+
+# Region IDs are stored shifted up by one, so that 0 can stand for trips that
+# started or ended outside of every region.
+REGION_CODES = 2 ** 20
+SHAPE = (REGION_CODES, REGION_CODES, 24, 7)
+
+BATCH_SIZE = 100000
+
+FIELDS = {
+    'pickup_region': 'Pickup Region ID',
+    'dropoff_region': 'Dropoff Region ID',
+    'hour': 'Pickup Hour',
+    'dow': 'Pickup DOW',
+    'fare_cents': 'Fare',
+    'tips_cents': 'Tips',
+    'total_cents': 'Trip Total',
+}
+
+
+def _region_code(value):
+    if value is None or value == '':
+        return 0
+    region = int(value)
+    if not 0 <= region < REGION_CODES - 1:
+        raise ValueError('Region ID out of range: {}'.format(value))
+    return region + 1
+
+
+def _cents(value):
+    try:
+        return int(petl.asmoney(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _merge(codes, measures):
+    """
+    Sum the measures (a 2D array, one row per code) of equal codes, returning
+    the unique codes, sorted, and their totals.
+    """
+    cells, index = numpy.unique(codes, return_inverse=True)
+    totals = numpy.empty((len(cells), measures.shape[1]), dtype=numpy.int64)
+    for m in range(measures.shape[1]):
+        # bincount sums in float64, which is exact up to 2**53.
+        totals[:, m] = numpy.bincount(index, weights=measures[:, m], minlength=len(cells))
+    return cells, totals
+
+
+class Cube:
+    """
+    The non-empty cells of the cube, as a sorted array of cell codes with a
+    row of MEASURES for each, and the names of the batches added to it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.codes = numpy.empty(0, dtype=numpy.int64)
+        self.measures = numpy.empty((0, len(MEASURES)), dtype=numpy.int64)
+        self.batches = []
+        if path is not None and os.path.exists(path):
+            with numpy.load(path) as data:
+                self.codes = data['codes']
+                self.measures = data['measures']
+                self.batches = data['batches'].tolist()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def add(self, table, batch, batch_size=BATCH_SIZE):
+        """
+        Add the trips in the table (with the fields of fuzzy's output) to the
+        cube, as the batch with the given name. Returns the number of trips
+        added; trips without a pickup hour are skipped.
+        """
+        if batch in self.batches:
+            raise ValueError('Batch {} has already been added to the cube'.format(batch))
+
+        fields = [FIELDS[name] for name in DIMENSIONS + MEASURES[1:]]
+        codes = [self.codes]
+        measures = [self.measures]
+        added = skipped = 0
+        for rows in chunks(batch_size, table.values(fields)):
+            num_rows = len(rows)
+            rows = [row for row in rows if row[2] not in (None, '')]
+            skipped += num_rows - len(rows)
+            if not rows:
+                continue
+            pickup, dropoff, hour, dow = (
+                numpy.fromiter((_region_code(row[0]) for row in rows), dtype=numpy.int64, count=len(rows)),
+                numpy.fromiter((_region_code(row[1]) for row in rows), dtype=numpy.int64, count=len(rows)),
+                numpy.fromiter((int(row[2]) for row in rows), dtype=numpy.int64, count=len(rows)),
+                numpy.fromiter((int(row[3]) for row in rows), dtype=numpy.int64, count=len(rows)))
+            chunk_measures = numpy.empty((len(rows), len(MEASURES)), dtype=numpy.int64)
+            chunk_measures[:, 0] = 1
+            for m in range(1, len(MEASURES)):
+                chunk_measures[:, m] = numpy.fromiter(
+                    (_cents(row[3 + m]) for row in rows), dtype=numpy.int64, count=len(rows))
+
+            chunk_codes, chunk_measures = _merge(
+                numpy.ravel_multi_index((pickup, dropoff, hour, dow), SHAPE), chunk_measures)
+            codes.append(chunk_codes)
+            measures.append(chunk_measures)
+            added += len(rows)
+
+        self.codes, self.measures = _merge(numpy.concatenate(codes), numpy.concatenate(measures))
+        self.batches.append(batch)
+        logger.info('Added {} trips in batch {} ({} without a pickup time skipped); '
+                    'the cube now has {} cells'.format(added, batch, skipped, len(self)))
+        return added
+
+    def coordinates(self):
+        """The DIMENSIONS of each cell, as a dictionary of arrays."""
+        pickup, dropoff, hour, dow = numpy.unravel_index(self.codes, SHAPE)
+        return {
+            'pickup_region': pickup - 1,
+            'dropoff_region': dropoff - 1,
+            'hour': hour,
+            'dow': dow,
+        }
+
+    def rollup(self, by=DIMENSIONS):
+        """
+        Sum the cube over every dimension not in by. Returns the values of the
+        by dimensions (a dictionary of arrays) and the totals of the MEASURES
+        for each combination of them, in order. Region IDs are -1 for trips
+        outside of every region.
+        """
+        coordinates = self.coordinates()
+        if not by:
+            return {}, self.measures.sum(axis=0, keepdims=True)
+
+        dims = [coordinates[name] for name in by]
+        shape = [REGION_CODES if name.endswith('_region') else SHAPE[DIMENSIONS.index(name)]
+                 for name in by]
+        regions = [name.endswith('_region') for name in by]
+        codes = numpy.ravel_multi_index(
+            [d + 1 if region else d for d, region in zip(dims, regions)], shape)
+        cells, totals = _merge(codes, self.measures)
+        values = numpy.unravel_index(cells, shape)
+        return ({name: v - 1 if region else v for name, v, region in zip(by, values, regions)},
+                totals)
+
+    def save(self, path=None):
+        path = path or self.path
+        # Write to a temporary file first, so that a failure part way through
+        # doesn't leave a corrupt cube behind.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as outfile:
+            numpy.savez_compressed(outfile, codes=self.codes, measures=self.measures,
+                                   batches=numpy.array(self.batches, dtype=str))
+        os.replace(tmp_path, path)
+
+
+def rollup_table(cube, by=DIMENSIONS):
+    """
+    A petl table of a rollup of the cube (see Cube.rollup), with a column for
+    each of the by dimensions and each of the MEASURES, money as dollars.
+    Trips outside of every region have an empty region ID, as in fuzzy's
+    output.
+    """
+    values, totals = cube.rollup(by)
+    columns = [[None if name.endswith('_region') and v == -1 else v for v in values[name].tolist()]
+               for name in by]
+    columns += [totals[:, 0].tolist()]
+    columns += [[petl.Cents(v) for v in totals[:, m].tolist()] for m in range(1, len(MEASURES))]
+    header = list(by) + ['trips', 'fare', 'tips', 'total']
+    return petl.fromcolumns(columns, header=header)
@@ -0,0 +1,189 @@
+"""
+Counting, rather than logging, the problems found in the vendors' data, so
+that a dirty delivery doesn't slow normalize down (or abort it) with a warning
+for every bad value.
+
+The problems go to the ErrorCollector in `collector`:
+
+* A value that can't be converted (see checked) is counted by column and type
+  of error, and the first few distinct examples of each are kept. The value
+  is left empty, and the rest of the row goes on as usual.
+* A row that can't be normalized at all, like one with the wrong number of
+  fields (see checklength), is left out, counted, and written to the
+  collector's reject file, if it has one, as it was read.
+
+A summary of the counts so far is logged every `interval` seconds while there
+are new problems, and once more when the collector is closed.
+
+Worker processes (see splitcsv) collect into a collector of their own, and
+hand its counts, examples and rejected rows back with their rows, to be merged
+into the collector of the main process.
+"""
+
+import csv
+import io
+from time import perf_counter
+from petl import Table
+from .streams import open_stream
+
+import logging
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 5
+INTERVAL = 60.0
+
+WRONG_LENGTH = 'wrong number of fields'
+
+
+class ErrorCollector:
+    """
+    Counts of the problems found, by (column, error type), with up to
+    sample_size example values of each. Rejected rows are written to the CSV
+    file at reject_path, if given, or with keep_rejects, kept in `rejected`
+    (for a worker process to hand back).
+    """
+
+    def __init__(self, reject_path=None, sample_size=SAMPLE_SIZE, interval=INTERVAL,
+                 keep_rejects=False):
+        self.reject_path = reject_path
+        self.sample_size = sample_size
+        self.interval = interval
+        self.keep_rejects = keep_rejects
+        self.counts = {}
+        self.samples = {}
+        self.rejected = []
+        self._reject_file = None
+        self._reject_writer = None
+        self._last_log = perf_counter()
+        self._logged_total = 0
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def record(self, column, error_type, value):
+        """Count a value of the column that couldn't be converted."""
+        key = (column, error_type)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        samples = self.samples.setdefault(key, [])
+        if len(samples) < self.sample_size and value not in samples:
+            samples.append(value)
+        self._maybe_log()
+
+    def reject(self, row, reason):
+        """Count a row that has been left out, and write it to the reject file."""
+        self.record('(row)', reason, '{} fields'.format(len(row)))
+        self._write_rejects([(reason,) + tuple(row)])
+
+    def _write_rejects(self, rows):
+        if self.keep_rejects:
+            self.rejected.extend(rows)
+        if self.reject_path is None:
+            return
+        if self._reject_writer is None:
+            self._reject_file = io.TextIOWrapper(open_stream(self.reject_path, 'wb'),
+                                                 encoding='utf-8', newline='')
+            self._reject_writer = csv.writer(self._reject_file)
+        self._reject_writer.writerows(rows)
+
+    def state(self):
+        """The counts, examples and rejected rows, for merge."""
+        return self.counts, self.samples, self.rejected
+
+    def merge(self, state):
+        """Add the state of another collector (e.g., a worker's) to this one."""
+        counts, samples, rejected = state
+        for key, count in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+            own = self.samples.setdefault(key, [])
+            for value in samples.get(key, []):
+                if len(own) < self.sample_size and value not in own:
+                    own.append(value)
+        if rejected:
+            self._write_rejects(rejected)
+        self._maybe_log()
+
+    def _maybe_log(self):
+        if self.interval is None or perf_counter() - self._last_log < self.interval:
+            return
+        self.log_summary()
+
+    def summary(self):
+        """Lines describing the problems found so far, most common first."""
+        lines = []
+        for (column, error_type), count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            lines.append('{}: {} ({}), e.g. {}'.format(
+                column, error_type, count,
+                ', '.join(repr(v) for v in self.samples.get((column, error_type), []))))
+        return lines
+
+    def log_summary(self):
+        """Log the problems found, if there are any new ones since the last time."""
+        self._last_log = perf_counter()
+        total = self.total
+        if total == self._logged_total:
+            return
+        self._logged_total = total
+        logger.warning('{} problems found in the data so far:\n  {}'.format(
+            total, '\n  '.join(self.summary())))
+
+    def close(self):
+        """Log a final summary, and close the reject file."""
+        self.log_summary()
+        if self._reject_file is not None:
+            self._reject_file.close()
+            self._reject_file = self._reject_writer = None
+
+
+collector = ErrorCollector()
+
+
+def record(column, error_type, value):
+    collector.record(column, error_type, value)
+
+
+def reject(row, reason):
+    collector.reject(row, reason)
+
+
+def checked(converter, column, error_type):
+    """
+    Wrap a converter so that a ValueError (or TypeError) is counted against the
+    column, with the value, and the value is converted to None. Empty values
+    are taken as missing rather than bad, and become None without being
+    counted.
+    """
+    def _checked(value):
+        if value is None or value == '':
+            return None
+        try:
+            return converter(value)
+        except (ValueError, TypeError):
+            collector.record(column, error_type, value)
+            return None
+    return _checked
+
+
+def checklength(table):
+    """
+    Leave out (and reject) the rows of the table that don't have as many fields
+    as its header.
+    """
+    return CheckLengthView(table)
+
+
+class CheckLengthView(Table):
+
+    def __init__(self, source):
+        self.source = source
+
+    def __iter__(self):
+        it = iter(self.source)
+        hdr = next(it)
+        yield tuple(hdr)
+        length = len(hdr)
+        for row in it:
+            if len(row) == length:
+                yield tuple(row)
+            else:
+                collector.reject(row, WRONG_LENGTH)
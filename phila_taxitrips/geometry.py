@@ -0,0 +1,90 @@
+"""
+Straight-line trip metrics, computed over whole batches of trips at once with
+numpy: the haversine distance between the pickup and dropoff points, the
+compass heading from one to the other, and the nearest cardinal direction.
+"""
+
+import numpy
+
+EARTH_RADIUS_MILES = 3959
+
+CARDINAL_DIRECTIONS = numpy.array(['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'])
+
+GEOMETRY_FIELDS = ('Straight Line Distance', 'Heading', 'Cardinal Direction')
+
+
+def coordinates(values):
+    """
+    Convert a sequence of coordinate values (strings or numbers) to a float
+    array. Values that are blank, not numbers, or exactly 0 (which the vendors
+    use for a missing location) become NaN.
+    """
+    def _tofloat(value):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return numpy.nan
+        return value if value != 0 else numpy.nan
+    return numpy.fromiter(map(_tofloat, values), dtype=numpy.float64, count=len(values))
+
+
+def haversine(lat1, lng1, lat2, lng2, radius=EARTH_RADIUS_MILES):
+    """
+    Great-circle distance between arrays of points, in miles by default. The
+    result is NaN wherever a coordinate is NaN.
+    """
+    lat1, lng1, lat2, lng2 = map(numpy.radians, (lat1, lng1, lat2, lng2))
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 \
+        + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lng2 - lng1) / 2) ** 2
+    return 2 * radius * numpy.arcsin(numpy.sqrt(a))
+
+
+def heading(lat1, lng1, lat2, lng2):
+    """
+    Initial compass heading from the first points to the second, in degrees
+    clockwise from north, in the range [0, 360).
+    """
+    lat1, lng1, lat2, lng2 = map(numpy.radians, (lat1, lng1, lat2, lng2))
+    dlng = lng2 - lng1
+    y = numpy.sin(dlng) * numpy.cos(lat2)
+    x = numpy.cos(lat1) * numpy.sin(lat2) - numpy.sin(lat1) * numpy.cos(lat2) * numpy.cos(dlng)
+    return numpy.degrees(numpy.arctan2(y, x)) % 360
+
+
+def cardinal(headings):
+    """
+    Nearest of the eight cardinal directions (N, NE, E, ...) for an array of
+    headings in degrees. NaN headings give an empty string.
+    """
+    headings = numpy.asarray(headings, dtype=numpy.float64)
+    valid = ~numpy.isnan(headings)
+    index = numpy.zeros(len(headings), dtype=numpy.intp)
+    index[valid] = numpy.floor((headings[valid] + 22.5) / 45).astype(numpy.intp) % 8
+    return numpy.where(valid, CARDINAL_DIRECTIONS[index], '')
+
+
+def trip_geometry(rows, pickup=('Pickup Latitude', 'Pickup Longitude'),
+                  dropoff=('Dropoff Latitude', 'Dropoff Longitude')):
+    """
+    Compute the straight-line distance (in miles, to 2 places), heading (in
+    whole degrees) and cardinal direction of each of a batch of trip records.
+    Returns a column of values for each of GEOMETRY_FIELDS, with None for
+    trips that are missing a location or have no distance to speak of.
+    """
+    lat1 = coordinates([row[pickup[0]] for row in rows])
+    lng1 = coordinates([row[pickup[1]] for row in rows])
+    lat2 = coordinates([row[dropoff[0]] for row in rows])
+    lng2 = coordinates([row[dropoff[1]] for row in rows])
+
+    distances = numpy.round(haversine(lat1, lng1, lat2, lng2), 2)
+    headings = heading(lat1, lng1, lat2, lng2)
+    headings[~(distances > 0)] = numpy.nan
+    directions = cardinal(headings)
+
+    has_distance = ~numpy.isnan(distances)
+    has_heading = ~numpy.isnan(headings)
+    return (
+        [float(d) if ok else None for d, ok in zip(distances, has_distance)],
+        [int(h) if ok else None for h, ok in zip(headings, has_heading)],
+        [str(c) if ok else None for c, ok in zip(directions, has_heading)],
+    )
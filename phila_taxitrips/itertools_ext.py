@@ -1,4 +1,6 @@
-from itertools import zip_longest
+from itertools import islice, zip_longest
+from queue import Queue
+from threading import Thread
 
 
 def grouper(n, iterable, fillvalue=None):
@@ -11,3 +13,53 @@ def grouper(n, iterable, fillvalue=None):
     return zip_longest(fillvalue=fillvalue, *args)
 
 
+def chunks(n, iterable):
+    """
+    Yield lists of at most n elements from the iterable (e.g.,
+    chunks(3, 'ABCDEFG') --> ABC DEF G). Unlike grouper, the last chunk is not
+    padded, so there is nothing to filter out afterwards.
+    """
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+_DONE = object()
+
+
+def prefetch(iterable, maxsize=2):
+    """
+    Consume the iterable on a background thread, keeping up to maxsize items
+    ready ahead of the caller. This lets whatever work produces the items (e.g.,
+    parsing a CSV into batches) overlap with whatever work consumes them (e.g.,
+    sending the batches to the database).
+
+    An exception raised while producing items is re-raised in the consuming
+    thread.
+    """
+    queue = Queue(maxsize)
+
+    def _produce():
+        try:
+            for item in iterable:
+                queue.put((item, None))
+        except BaseException as exc:
+            queue.put((_DONE, exc))
+        else:
+            queue.put((_DONE, None))
+
+    thread = Thread(target=_produce, daemon=True)
+    thread.start()
+
+    while True:
+        item, exc = queue.get()
+        if item is _DONE:
+            break
+        yield item
+
+    thread.join()
+    if exc is not None:
+        raise exc
@@ -0,0 +1,151 @@
+"""
+An SQLite stand-in for the Oracle database, for running and benchmarking the
+upload and anonymization steps on a single machine.
+
+Connect with a connection string like:
+
+    sqlite:///path/to/trips.db?latency=0.005&row_cost=0.00001
+
+The path after sqlite:// is absolute (sqlite:///tmp/trips.db is /tmp/trips.db);
+a path relative to the current directory is written without the slashes, as
+in sqlite:trips.db. A plain sqlite: is an in-memory database.
+
+The latency is a number of seconds added to every round trip to the database,
+and the row_cost is a number of seconds added for each row sent in an
+executemany call, so that batching and pipelining strategies can be compared
+under repeatable, server-like conditions. Both default to 0.
+
+The objects returned by connect() have the parts of the datum database
+interface that this package uses (execute, save, close, and the _c cursor),
+along with a `dialect` attribute of 'sqlite', which the SQL-building code uses
+to emulate Oracle's MERGE statements with SQLite's INSERT ... ON CONFLICT.
+
+Connections to the same database file share a single underlying SQLite
+connection, since SQLite only allows one writer at a time. The injected
+latency is spent outside of the shared lock, so round trips over several
+connections still overlap the way they would against a real server.
+"""
+
+from decimal import Decimal
+import sqlite3
+from threading import Lock
+from time import sleep
+from urllib.parse import urlparse, parse_qs
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# SQLite has no exact decimal type; store typed money (see upload) as its text,
+# the same as untyped uploads.
+sqlite3.register_adapter(Decimal, str)
+
+_shared = {}
+_shared_lock = Lock()
+
+
+def _shared_connection(path):
+    with _shared_lock:
+        if path not in _shared:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            _shared[path] = (conn, Lock())
+        return _shared[path]
+
+
+class LocalCursor:
+    """A cursor that injects round-trip latency and a per-row cost."""
+
+    def __init__(self, db):
+        self.connection = db
+        self._db = db
+
+    def _delay(self, num_rows):
+        seconds = self._db.latency + self._db.row_cost * num_rows
+        if seconds:
+            sleep(seconds)
+
+    def execute(self, sql, params=()):
+        self._delay(1)
+        with self._db._lock:
+            self._result = self._db._conn.execute(sql, params).fetchall()
+        return self
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        self._delay(len(rows))
+        with self._db._lock:
+            self._db._conn.executemany(sql, rows)
+
+    def fetchall(self):
+        return self._result
+
+
+class LocalDatabase:
+    dialect = 'sqlite'
+
+    def __init__(self, path, latency=0.0, row_cost=0.0):
+        self.path = path
+        self.latency = latency
+        self.row_cost = row_cost
+        self._conn, self._lock = _shared_connection(path)
+        self._c = LocalCursor(self)
+
+    def execute(self, sql, params=()):
+        return self._c.execute(sql, params).fetchall()
+
+    def save(self):
+        self._c._delay(0)
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._conn.rollback()
+
+    def close(self):
+        pass
+
+    def create_tables(self, tables, id_tables):
+        """
+        Create any tables that don't exist yet. The tables argument maps table
+        names to a (columns, unique_columns) pair; unique_columns, if not None,
+        get a unique index so that rows can be upserted on them. The id_tables
+        argument maps anonymization table names to the column they anonymize.
+        """
+        with self._lock:
+            for table_name, (columns, unique_columns) in tables.items():
+                self._conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(
+                    table_name, ', '.join('{} TEXT'.format(c) for c in columns)))
+                if unique_columns:
+                    self._conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS {0}_unique_id ON {0} ({1})'.format(
+                        table_name, ', '.join(unique_columns)))
+
+            for table_name, column_name in id_tables.items():
+                self._conn.execute('CREATE TABLE IF NOT EXISTS {} (ID INTEGER PRIMARY KEY AUTOINCREMENT, {} TEXT)'.format(
+                    table_name, column_name))
+            self._conn.commit()
+
+
+def is_local(db_conn_string):
+    return db_conn_string.startswith('sqlite:')
+
+
+def connect(db_conn_string):
+    """
+    Connect to a local database with a connection string of the form
+    sqlite:///path/to/file.db?latency=<seconds>&row_cost=<seconds>, or
+    sqlite:relative/path.db?... for a path relative to the current directory.
+    """
+    url = urlparse(db_conn_string)
+    if url.netloc:
+        # e.g., sqlite://trips.db, which would otherwise quietly open an
+        # in-memory database.
+        raise ValueError('A local database has no host ({!r} in {!r}); write sqlite:///{} for '
+                         'an absolute path, or sqlite:{} for a relative one'.format(
+                             url.netloc, db_conn_string, url.netloc + url.path, url.netloc + url.path))
+    params = parse_qs(url.query)
+    path = url.path or ':memory:'
+    latency = float(params.get('latency', ['0'])[0])
+    row_cost = float(params.get('row_cost', ['0'])[0])
+    logger.debug('Connecting to local database {} (latency={}, row_cost={})'.format(path, latency, row_cost))
+    return LocalDatabase(path, latency=latency, row_cost=row_cost)
@@ -0,0 +1,119 @@
+"""
+Split the output of a step into one directory per month of pickup time, with a
+manifest.json listing the files and row counts for each month, so that months
+can be processed in parallel, and a single month can be re-run without redoing
+the rest.
+
+A partitioned output directory looks like:
+
+    outdir/
+        manifest.json
+        2015-06/part-0000.csv
+        2015-06/part-0001.csv
+        2015-07/part-0000.csv
+        ...
+
+where each part comes from one unit of work (e.g., one input file).
+"""
+
+import json
+import os
+from .petl_ext import CSVSink
+
+import logging
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+UNKNOWN = 'unknown'
+
+
+def month_of(row, year_field='Pickup Year', month_field='Pickup Month'):
+    """
+    The partition of a row: its pickup year and month, as YYYY-MM, or 'unknown'
+    if the row has no pickup time.
+    """
+    try:
+        return '{:04d}-{:02d}'.format(int(row[year_field]), int(row[month_field]))
+    except (TypeError, ValueError):
+        return UNKNOWN
+
+
+def write_partitions(table, outdir, name, months=None, partition_of=month_of):
+    """
+    Write the rows of the table to outdir/<month>/<name>.csv, for each month
+    found in the table (or only for the given months). Returns a dictionary of
+    the number of rows written for each month.
+    """
+    sinks = {}
+    counts = {}
+    try:
+        for row in table.records():
+            month = partition_of(row)
+            if months is not None and month not in months:
+                continue
+            if month not in sinks:
+                os.makedirs(os.path.join(outdir, month), exist_ok=True)
+                sinks[month] = CSVSink(os.path.join(outdir, month, name + '.csv'))
+                counts[month] = 0
+            sinks[month](row)
+            counts[month] += 1
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    return counts
+
+
+class Manifest:
+    """
+    The list of files and row counts in each partition of an output directory,
+    kept in outdir/manifest.json.
+    """
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.path = os.path.join(outdir, MANIFEST)
+        self.partitions = {}
+        if os.path.exists(self.path):
+            with open(self.path) as infile:
+                self.partitions = json.load(infile)['partitions']
+
+    @classmethod
+    def exists(cls, outdir):
+        return os.path.exists(os.path.join(outdir, MANIFEST))
+
+    def months(self):
+        return sorted(self.partitions)
+
+    def files(self, month):
+        """The full paths of the files in a partition."""
+        return [os.path.join(self.outdir, f) for f in self.partitions[month]['files']]
+
+    def clear(self, months=None):
+        """
+        Remove the files of the given partitions (or of all of them), before
+        they're written again.
+        """
+        for month in list(self.partitions if months is None else months):
+            if month not in self.partitions:
+                continue
+            for path in self.files(month):
+                if os.path.exists(path):
+                    os.remove(path)
+            del self.partitions[month]
+
+    def add(self, name, counts):
+        """Record the part written as name (see write_partitions)."""
+        for month, rows in counts.items():
+            partition = self.partitions.setdefault(month, {'files': [], 'rows': 0})
+            partition['files'].append(os.path.join(month, name + '.csv'))
+            partition['rows'] += rows
+
+    def save(self):
+        state = {
+            'partition_by': 'month',
+            'partitions': {month: self.partitions[month] for month in sorted(self.partitions)},
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(state, outfile, indent=2)
+        os.replace(tmp_path, self.path)
@@ -1,25 +1,101 @@
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from glob import iglob
-from itertools import chain
+from itertools import chain, groupby
+from operator import itemgetter
 from petl import *
+import csv  # after petl's *, which exports its own csv module
 from petl.compat import text_type
-from .itertools_ext import grouper
-
-
-def fromcsvs(filepatterns, fieldnames=None, encoding=None, errors='strict', **csvargs):
+from petl.io.csv import fromcsv as _fromcsv
+from petl.util.base import asindices
+import io
+from queue import Queue
+from threading import Thread
+from .batching import batches, FixedBatchSize
+from .errors import record as record_error
+from .itertools_ext import chunks, prefetch
+from .streams import infer_compression, open_stream, StreamSource
+from time import perf_counter
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def fromcsvs(filepatterns, fieldnames=None, encoding=None, errors='strict',
+             processes=None, transform=None, **csvargs):
     """
     Create a table from a list of file names. Fieldnames is an iterable which,
-    when specified, is pushed on as the header for the table.
+    when specified, is pushed on as the header for the table. If a transform
+    is given, each file's table is passed through it (as transform(table))
+    before they are concatenated, so that it sees each file's rows as they
+    were read (cat pads or cuts rows to fit the combined header).
+
+    With more than one process, each file is split into pieces on record
+    boundaries, and the pieces are parsed and transformed in that many worker
+    processes (see splitcsv), so that even a single large file is read on
+    several cores. The transform must then be picklable, and work the same on
+    any piece of the files as on all of them (e.g., a row-by-row conversion).
+    Compressed files can't be split.
     """
+    filenames = list(chain.from_iterable(iglob(p) for p in filepatterns))
+    if processes is not None and processes > 1:
+        from .splitcsv import piece_tables, ParallelPiecesView
+        if 'escapechar' in csvargs:
+            raise ValueError('Files with an escapechar can\'t be split')
+        if any(infer_compression(f) for f in filenames):
+            raise ValueError('Compressed files can\'t be split')
+        if not filenames:
+            return None
+        pieces = [(t if fieldnames is None else t.setheader(fieldnames), size)
+                  for fname in filenames
+                  for t, size in piece_tables(fname, encoding=encoding, errors=errors, **csvargs)]
+        return ParallelPiecesView(pieces, transform, processes)
+
     t = None
-    for fname in chain.from_iterable(iglob(p) for p in filepatterns):
+    for fname in filenames:
         t_partial = fromcsv(fname, encoding=encoding, errors=errors, **csvargs)
         if fieldnames is not None:
             t_partial = t_partial.setheader(fieldnames)
+        if transform is not None:
+            t_partial = transform(t_partial)
         t = t_partial if t is None else t.cat(t_partial)
     return t
 
 
+def fromcsv(source=None, encoding=None, errors='strict', header=None,
+            compression=None, **csvargs):
+    """
+    Like petl's fromcsv, but reading through a large buffer, and decompressing
+    .gz and .zst files on a background thread (see streams). A source of None
+    or '-' reads from stdin.
+    """
+    if isinstance(source, str) or source is None:
+        source = StreamSource(source, compression)
+    return _fromcsv(source, encoding=encoding, errors=errors, header=header, **csvargs)
+
+
+def tocsv(table, source=None, encoding=None, errors='strict', write_header=True,
+          compression=None, batch_size=1000, **csvargs):
+    """
+    Like petl's tocsv, but writing rows batch_size at a time through a large
+    buffer, and compressing .gz and .zst files on a background thread (see
+    streams). A source of None or '-' writes to stdout.
+    """
+    csvargs.setdefault('dialect', 'excel')
+    it = iter(table)
+    hdr = next(it, None)
+    with io.TextIOWrapper(open_stream(source, 'wb', compression), encoding=encoding,
+                          errors=errors, newline='') as outfile:
+        writer = csv.writer(outfile, **csvargs)
+        if hdr is not None and write_header:
+            writer.writerow(hdr)
+        for rows in chunks(batch_size, it):
+            writer.writerows(rows)
+
+
+Table.tocsv = tocsv
+
+
 def addfields(table, *field_tuples): #field, value=None, index=None, missing=None):
     """
     Add fields with fixed or calculated values. E.g.::
@@ -70,11 +146,12 @@ class AddFieldsView(Table):
     def __init__(self, source, *fields, missing=None):
         # ensure rows are all the same length
         self.source = stack(source, missing=missing)
-        # convert tuples to FieldDefinitions, if necessary
-        self.fields = (field
-                       if isinstance(field, FieldDefinition)
-                       else FieldDefinition(*field)
-                       for field in fields)
+        # convert tuples to FieldDefinitions, if necessary (into a tuple rather
+        # than a generator, so that the view can be iterated more than once)
+        self.fields = tuple(field
+                            if isinstance(field, FieldDefinition)
+                            else FieldDefinition(*field)
+                            for field in fields)
 
     def __iter__(self):
         return iteraddfields(self.source, *self.fields)
@@ -110,20 +187,248 @@ def iteraddfields(source, *fields):
         yield tuple(outrow)
 
 
+def addbatchfields(table, fieldnames, func, batch_size=10000):
+    """
+    Add fields whose values are calculated for a whole batch of rows at a time,
+    for calculations that are much faster over arrays than one row at a time.
+    The func is called with a list of up to batch_size records, and should
+    return a sequence of columns -- one per field name, each with a value for
+    every record in the batch. E.g.::
+
+        table.addbatchfields(('double', 'triple'),
+                             lambda rows: ([r.bar * 2 for r in rows],
+                                           [r.bar * 3 for r in rows]))
+
+    """
+
+    return AddBatchFieldsView(table, fieldnames, func, batch_size=batch_size)
+
+
+Table.addbatchfields = addbatchfields
+
+
+class AddBatchFieldsView(Table):
+
+    def __init__(self, source, fieldnames, func, batch_size=10000):
+        self.source = source
+        self.fieldnames = tuple(fieldnames)
+        self.func = func
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        it = iter(self.source)
+        hdr = next(it)
+        flds = list(map(text_type, hdr))
+        yield tuple(hdr) + self.fieldnames
+
+        for batch in chunks(self.batch_size, it):
+            columns = self.func([Record(row, flds) for row in batch])
+            for row, values in zip(batch, zip(*columns)):
+                yield tuple(row) + values
+
+
+def dedupe(table, key, keep='last', buffersize=None, tempdir=None):
+    """
+    Sort the table on the key fields, and keep only one row for each key: the
+    first or the last of the rows with that key, in input order (keep='first'
+    or 'last').
+
+    The sort is petl's external merge sort, which holds at most buffersize rows
+    in memory (petl.config.sort_buffersize by default), spilling sorted runs to
+    temporary files in tempdir beyond that, and merging them back as the table
+    is iterated. The sort is stable, so rows with equal keys stay in input
+    order. Nothing is cached, so iterating the table again sorts it again.
+    """
+    if keep not in ('first', 'last'):
+        raise ValueError('keep must be first or last, not {}'.format(keep))
+    sorted_table = table.sort(key, buffersize=buffersize, tempdir=tempdir, cache=False)
+    return DedupeView(sorted_table, key, keep)
+
+
+Table.dedupe = dedupe
+
+
+class DedupeView(Table):
+
+    def __init__(self, source, key, keep='last'):
+        self.source = source
+        self.key = key
+        self.keep = keep
+
+    def __iter__(self):
+        it = iter(self.source)
+        hdr = next(it)
+        yield hdr
+
+        getkey = itemgetter(*asindices(hdr, self.key))
+        if self.keep == 'first':
+            for _, rows in groupby(it, getkey):
+                yield next(rows)
+        else:
+            for _, rows in groupby(it, getkey):
+                for row in rows:
+                    pass
+                yield row
+
+
+def tee(table, *sinks):
+    """
+    Pass each data row of the table (as a record) to each of the sinks as the
+    table is iterated, so that several outputs can be fed from a single scan.
+    A sink is any callable that takes a record; if it has a close method, that
+    is called once the last row has gone by. E.g.::
+
+        stats = TripLengthStats('Trip Length', 'Data Source')
+        table.tee(stats, CSVSink('copy.csv')).tocsv('out.csv')
+
+    The sinks see the rows every time the table is iterated, so tee should
+    generally be the last step before the table is written out.
+    """
+
+    return TeeView(table, *sinks)
+
+
+Table.tee = tee
+
+
+class TeeView(Table):
+
+    def __init__(self, source, *sinks):
+        self.source = source
+        self.sinks = sinks
+
+    def __iter__(self):
+        it = iter(self.source)
+        hdr = next(it)
+        flds = list(map(text_type, hdr))
+        yield hdr
+
+        sinks = self.sinks
+        for row in it:
+            rec = Record(row, flds)
+            for sink in sinks:
+                sink(rec)
+            yield row
+
+        for sink in sinks:
+            close = getattr(sink, 'close', None)
+            if close is not None:
+                close()
+
+
+class CSVSink:
+    """
+    A sink for tee that writes the rows it is given to a CSV file (compressed,
+    if the name ends in .gz or .zst), or to stdout if no filename is given. The
+    header is written along with the first row.
+    """
+
+    def __init__(self, filename=None, encoding='utf-8', compression=None):
+        self.filename = filename
+        self.encoding = encoding
+        self.compression = compression
+        self.file = None
+        self.writer = None
+
+    def __call__(self, row):
+        if self.writer is None:
+            self.file = io.TextIOWrapper(
+                open_stream(self.filename, 'wb', self.compression),
+                encoding=self.encoding, newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(row.flds)
+        self.writer.writerow(row)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = self.writer = None
+
+
+class Cents(int):
+    """
+    An amount of money as a whole number of cents, so that it is carried
+    through the pipeline exactly. It prints, and so is written to CSV files, as
+    dollars with two decimal places. Arithmetic on Cents gives plain ints.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        dollars, cents = divmod(abs(int(self)), 100)
+        return '{}{}.{:02d}'.format('-' if self < 0 else '', dollars, cents)
+
+    def __repr__(self):
+        return 'Cents({})'.format(int(self))
+
+    def decimal(self):
+        """The amount in dollars, as a Decimal with two places."""
+        return Decimal(int(self)).scaleb(-2)
+
+
+def _isdigits(s):
+    return s.isascii() and s.isdigit()
+
 def asmoney(value):
-    """Represent the given value as currency"""
-    return '{:.2f}'.format(round(float(value), 2))
+    """
+    Parse the given value as currency, in whole Cents. Decimal strings like
+    '12.345' are read digit by digit, rounding half away from zero, rather than
+    by way of a float (which would round '1.005' down). Raises ValueError if
+    the value isn't a number.
+    """
+    if isinstance(value, Cents):
+        return value
+    # Nearly every value has exactly two decimal places, and is read with a
+    # single int() once the point is taken out.
+    whole, _, frac = value.partition('.')
+    if len(frac) == 2 and frac.isdigit():
+        try:
+            return Cents(int(whole + frac))
+        except ValueError:
+            pass
+
+    s = value.strip()
+    negative = s[:1] == '-'
+    if s[:1] in ('-', '+'):
+        s = s[1:]
+    whole, _, frac = s.partition('.')
+    if not (whole or frac) \
+            or (whole and not _isdigits(whole)) \
+            or (frac and not _isdigits(frac)):
+        return _asmoney_decimal(value)
+
+    cents = int(whole or '0') * 100 + int((frac + '00')[:2])
+    if frac[2:3] >= '5':
+        cents += 1
+    return Cents(-cents if negative else cents)
+
+def _asmoney_decimal(value):
+    # The slow path, for anything else Decimal can read, like '1E+2'
+    try:
+        amount = Decimal(value.strip()).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return Cents(int(amount.scaleb(2)))
+    except (InvalidOperation, ValueError, OverflowError):
+        raise ValueError('Not an amount of money: {!r}'.format(value))
+
+def moneytext(value):
+    """Money for a text column: Cents as dollars, anything else as is."""
+    return str(value) if isinstance(value, Cents) else value
+
+def moneydecimal(value):
+    """Money for a numeric column: a Decimal, or None if there's no amount."""
+    if value is None or value == '':
+        return None
+    return asmoney(value).decimal()
 
 def asisodatetime(value):
-    """Convert a date as YYYY-MM-DD HH:MM:SS"""
-    try:
-        return datetime\
-            .strptime(value.strip(), '%m/%d/%Y %H:%M')\
-            .strftime('%Y-%m-%d %H:%M:00')
-    except ValueError:
-        if value:
-            logger.warn('Could not parse date: {}'.format(value))
+    """
+    Convert a date as YYYY-MM-DD HH:MM:SS. Empty values are returned as they
+    are; raises ValueError for anything else that isn't MM/DD/YYYY HH:MM.
+    """
+    if not value:
         return value
+    return datetime\
+        .strptime(value.strip(), '%m/%d/%Y %H:%M')\
+        .strftime('%Y-%m-%d %H:%M:00')
 
 def asnormpaytype(value):
     if value and value == 'CASH':
@@ -134,18 +439,44 @@ def asnormpaytype(value):
         return value
 
 def parsedate(field, pattern):
+    """
+    A function of a row that parses its field as a datetime, or returns None
+    if the field is empty or doesn't match the pattern. Values that don't
+    match are counted (see errors).
+    """
     def _parsedate_from_row(row):
+        value = row[field]
+        if not value:
+            return None
         try:
-            return datetime.strptime(row[field], pattern)
+            return datetime.strptime(value, pattern)
         except ValueError:
+            record_error(field, 'bad date', value)
             return None
     return _parsedate_from_row
 
-def todb_upsert(table, table_name, db, group_size=1000):
-    # Create a list of the column names
-    columns = table.fieldnames()
-    id_columns = {'Medallion', 'Chauffeur_No', 'Meter_On_Datetime', 'Meter_Off_Datetime'}
-    non_id_columns = set(columns) - id_columns
+UPSERT_ID_COLUMNS = ('Medallion', 'Chauffeur_No', 'Meter_On_Datetime', 'Meter_Off_Datetime')
+
+def upsert_sql(table_name, columns, id_columns=UPSERT_ID_COLUMNS, dialect='oracle'):
+    """
+    Build a MERGE statement that inserts a row of the given columns into
+    table_name, or updates the existing record with matching id_columns.
+
+    With the 'sqlite' dialect (see localdb), the same thing is done with an
+    INSERT ... ON CONFLICT statement, which relies on a unique index over the
+    id_columns. If the columns don't include all of the id_columns, rows are
+    simply inserted.
+    """
+    non_id_columns = [c for c in columns if c not in id_columns]
+
+    if dialect == 'sqlite':
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            table_name, ', '.join(columns), ', '.join('?' for c in columns))
+        if all(c in columns for c in id_columns):
+            sql += ' ON CONFLICT ({}) DO UPDATE SET {}'.format(
+                ', '.join(id_columns),
+                ', '.join('{0} = excluded.{0}'.format(c) for c in non_id_columns))
+        return sql
 
     # Build the clauses for the SQL statement
     select_clause = 'SELECT {} FROM DUAL'.format(
@@ -157,7 +488,7 @@ def todb_upsert(table, table_name, db, group_size=1000):
         ', '.join('orig.{}'.format(c) for c in columns),
         ', '.join('new.{}'.format(c) for c in columns))
 
-    sql = '''
+    return '''
     MERGE INTO {} orig
         USING ({}) new
         ON ({})
@@ -165,10 +496,346 @@ def todb_upsert(table, table_name, db, group_size=1000):
         WHEN NOT MATCHED THEN {}
     '''.format(table_name, select_clause, on_clause, update_clause, insert_clause)
 
-    for row_group in grouper(group_size, table.values(columns)):
-        row_group = filter(None, row_group)
-        list_of_rows = list(row_group)
+def _batch_sizer(group_size):
+    if isinstance(group_size, int):
+        return FixedBatchSize(group_size)
+    return group_size
+
+def _key_indexes(columns, id_columns):
+    # Tables without the identifying columns are keyed on whole rows.
+    return [columns.index(c) for c in id_columns if c in columns] \
+        or list(range(len(columns)))
+
+def todb_upsert(table, table_name, db, group_size=1000, pipeline=0,
+                index=None, checkpoint=None, monitor=None):
+    """
+    Insert or update the rows of the table in the database table_name, matching
+    existing records on the trip's identifying columns. Rows are sent to the
+    server group_size at a time. The group_size can also be a batch size
+    controller like AdaptiveBatchSize, which is told how long each group took
+    to send and picks the size of the next.
+
+    When pipeline is a positive number, the rows are read and grouped on a
+    background thread that keeps up to that many groups ready, so that building
+    the next group overlaps with the server executing the current one.
+
+    If a RowHashIndex is given, rows that it has already seen unchanged are
+    dropped from each group before it is sent.
+
+    If a Checkpoint is given, the database is committed every checkpoint.every
+    groups, and the position in the input just past the committed rows is
+    recorded, so that an interrupted upload can pick up where it left off.
+
+    If a telemetry Monitor is given, it is told how long each group took.
+    """
+    columns = table.fieldnames()
+    sql = upsert_sql(table_name, columns, dialect=getattr(db, 'dialect', 'oracle'))
+    key_indexes = _key_indexes(columns, UPSERT_ID_COLUMNS)
+    sizer = _batch_sizer(group_size)
+
+    # Note the position in the input as soon as each group has been read,
+    # since with pipelining the reader runs ahead of the database.
+    row_groups = ((list_of_rows, checkpoint.position() if checkpoint else None)
+                  for list_of_rows in batches(sizer, table.values(columns)))
+    if pipeline:
+        row_groups = prefetch(row_groups, pipeline)
+
+    uncommitted = 0
+    for group_num, (list_of_rows, position) in enumerate(row_groups, 1):
+        num_read = len(list_of_rows)
+        uncommitted += num_read
+        # Filter on this thread, so that the index never holds rows that are
+        # read ahead but not yet sent.
+        if index is not None:
+            list_of_rows = index.filter(list_of_rows, key_indexes)
+        started = perf_counter()
+        if list_of_rows:
+            db._c.executemany(sql, list_of_rows)
+        seconds = perf_counter() - started
+        # Rate the batch size on the rows actually sent, not those filtered
+        # out, and not at all if none were sent.
+        if list_of_rows:
+            sizer.record(len(list_of_rows), seconds, size=num_read)
+        if monitor is not None:
+            monitor.record_batch(len(list_of_rows), seconds)
+
+        if checkpoint and group_num % checkpoint.every == 0:
+            db.save()
+            checkpoint.save(position, uncommitted)
+            if index is not None:
+                index.save()
+            uncommitted = 0
+    db.save()
+    sizer.report()
+
+Table.todb_upsert = todb_upsert
+
+def _filtered_rows(rows, index, key_indexes, sizer):
+    if index is None:
+        return rows
+    return (row
+            for list_of_rows in batches(sizer, rows)
+            for row in index.filter(list_of_rows, key_indexes))
+
+def todb_upsert_partitioned(table, table_name, dbs, group_size=1000,
+                            id_columns=UPSERT_ID_COLUMNS, queue_size=2,
+                            index=None, monitor=None):
+    """
+    Upsert the rows of the table over several database connections at once.
+
+    Rows are hash-partitioned on the id_columns, so all the rows for a given
+    trip go through the same connection and no two connections ever contend
+    for the same record. Each connection is fed groups of rows through its own
+    bounded queue by a worker thread.
+
+    Nothing is committed until every partition has been sent. If any of the
+    connections fails before then, all of them are rolled back and the error
+    is re-raised. The connections are then committed one by one, so the load
+    as a whole is not atomic: if a commit fails, the partitions committed
+    before it stay committed, and the rest are rolled back. Since the rows are
+    upserted, running the same upload again finishes it.
+
+    If a RowHashIndex is given, rows that it has already seen unchanged are
+    not sent.
+
+    As with todb_upsert, group_size can be a number or a batch size controller,
+    and a telemetry Monitor is told how long each group took.
+    """
+    columns = table.fieldnames()
+    sql = upsert_sql(table_name, columns, id_columns,
+                     dialect=getattr(dbs[0], 'dialect', 'oracle'))
+    sizer = _batch_sizer(group_size)
+    key_indexes = _key_indexes(columns, id_columns)
+    num_partitions = len(dbs)
+
+    queues = [Queue(queue_size) for _ in dbs]
+    errors = []
+
+    def _send(db, queue):
+        while True:
+            list_of_rows = queue.get()
+            if list_of_rows is None:
+                break
+            # After a failure anywhere, keep draining the queue so that the
+            # reading thread is never blocked, but send nothing more.
+            if errors:
+                continue
+            try:
+                started = perf_counter()
+                db._c.executemany(sql, list_of_rows)
+                seconds = perf_counter() - started
+                sizer.record(len(list_of_rows), seconds)
+                if monitor is not None:
+                    monitor.record_batch(len(list_of_rows), seconds)
+            except Exception as exc:
+                errors.append(exc)
+
+    workers = [Thread(target=_send, args=(db, queue), daemon=True)
+               for db, queue in zip(dbs, queues)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        buffers = [[] for _ in dbs]
+        for row in _filtered_rows(table.values(columns), index, key_indexes, sizer):
+            partition = hash(tuple(row[i] for i in key_indexes)) % num_partitions
+            buffer = buffers[partition]
+            buffer.append(row)
+            if len(buffer) >= sizer.size:
+                queues[partition].put(buffer)
+                buffers[partition] = []
+                if errors:
+                    break
+        else:
+            for queue, buffer in zip(queues, buffers):
+                if buffer:
+                    queue.put(buffer)
+    except Exception as exc:
+        errors.append(exc)
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    if errors:
+        for db in dbs:
+            db._c.connection.rollback()
+        raise errors[0]
+
+    for committed, db in enumerate(dbs):
+        try:
+            db.save()
+        except Exception:
+            for other in dbs[committed:]:
+                try:
+                    other._c.connection.rollback()
+                except Exception:
+                    logger.exception('Failed to roll back a partition')
+            logger.warning('Committing partition {} of {} failed, after {} had been committed; '
+                           'the rest were rolled back. Uploads over several connections are not '
+                           'atomic: run the upload again to finish it.'.format(
+                               committed + 1, num_partitions, committed))
+            raise
+    sizer.report()
+
+def _drop_sql(kind, name, dialect):
+    """Drop a table or index, if it exists."""
+    if dialect == 'sqlite':
+        return 'DROP {} IF EXISTS {}'.format(kind, name)
+    # Oracle has no IF EXISTS; ignore "table or view does not exist" (-942) and
+    # "specified index does not exist" (-1418).
+    return '''
+    BEGIN
+        EXECUTE IMMEDIATE 'DROP {} {}';
+    EXCEPTION
+        WHEN OTHERS THEN
+            IF SQLCODE NOT IN (-942, -1418) THEN
+                RAISE;
+            END IF;
+    END;
+    '''.format(kind, name)
+
+def swap_sql(table_name, shadow_name, old_name, indexes=(), dialect='oracle'):
+    """
+    Build the statements that swap a loaded shadow table in for table_name,
+    as a list of (description, sql) pairs, to be run in order. The indexes
+    are (name, columns) pairs, built on the shadow table before the swap.
+
+    Oracle commits each statement on its own, so the indexes are built under
+    temporary names (the live table still has the real ones), the tables are
+    renamed one after the other in a single PL/SQL block, which renames the
+    live table back if the second rename fails, the grants on the live table
+    are given again on the new one, and the indexes are renamed once the old
+    table and its indexes are gone. SQLite can't rename indexes, but can run
+    all of its statements in one transaction, so the live table's indexes are
+    dropped and the shadow's built under their real names in the same
+    transaction as the renames.
+    """
+    statements = []
+    if dialect == 'sqlite':
+        statements.append(('begin', 'BEGIN'))
+        for name, columns in indexes:
+            statements.append(('drop index ' + name, _drop_sql('INDEX', name, dialect)))
+            statements.append(('index ' + name, 'CREATE INDEX {} ON {} ({})'.format(
+                name, shadow_name, ', '.join(columns))))
+    else:
+        for name, columns in indexes:
+            statements.append(('drop index ' + name + '_new', _drop_sql('INDEX', name + '_new', dialect)))
+            statements.append(('index ' + name, 'CREATE INDEX {}_new ON {} ({})'.format(
+                name, shadow_name, ', '.join(columns))))
+
+    if dialect == 'sqlite':
+        statements += [
+            ('rename', 'ALTER TABLE {} RENAME TO {}'.format(table_name, old_name)),
+            ('swap', 'ALTER TABLE {} RENAME TO {}'.format(shadow_name, table_name)),
+            ('drop', 'DROP TABLE {}'.format(old_name)),
+            ('commit', 'COMMIT'),
+        ]
+    else:
+        statements += [
+            ('rename', '''
+            BEGIN
+                EXECUTE IMMEDIATE 'ALTER TABLE {0} RENAME TO {1}';
+                BEGIN
+                    EXECUTE IMMEDIATE 'ALTER TABLE {2} RENAME TO {0}';
+                EXCEPTION
+                    WHEN OTHERS THEN
+                        EXECUTE IMMEDIATE 'ALTER TABLE {1} RENAME TO {0}';
+                        RAISE;
+                END;
+            END;
+            '''.format(table_name, old_name, shadow_name)),
+            # Grants stay with the renamed table, so copy them from there
+            # before it's dropped.
+            ('grants', '''
+            BEGIN
+                FOR g IN (SELECT grantee, privilege, grantable FROM user_tab_privs_made
+                          WHERE table_name = UPPER('{1}')) LOOP
+                    EXECUTE IMMEDIATE 'GRANT ' || g.privilege || ' ON {0} TO "' || g.grantee || '"'
+                        || CASE WHEN g.grantable = 'YES' THEN ' WITH GRANT OPTION' END;
+                END LOOP;
+            END;
+            '''.format(table_name, old_name)),
+            ('drop', 'DROP TABLE {}'.format(old_name)),
+        ]
+        for name, _ in indexes:
+            statements.append(('rename index ' + name, 'ALTER INDEX {0}_new RENAME TO {0}'.format(name)))
+    return statements
+
+def todb_swap(table, table_name, db, indexes=(), group_size=1000, pipeline=0,
+              monitor=None):
+    """
+    Replace the contents of the database table table_name with the rows of the
+    table, without a MERGE: the rows are bulk-inserted into an empty copy of
+    the table (table_name + '_shadow'), which has no indexes to keep up to date
+    while it loads; then the indexes, as (name, columns) pairs, are built, and
+    the shadow table is renamed to table_name in place of the live one (see
+    swap_sql). Readers see the old rows until the swap, and the new rows
+    after it.
+
+    On SQLite the swap is a single transaction. On Oracle, which commits DDL
+    statements one by one, it is not atomic: table_name doesn't exist for the
+    moment between the two renames, so a query in that window fails rather
+    than seeing either the old rows or the new ones. The renames are run back
+    to back, and the live table is renamed back if the second one fails; the
+    grants on the live table are then given again on the new one.
+
+    If the table has no rows, nothing is swapped, so that a failed step
+    upstream can't empty the live table. A shadow table left behind by a
+    failed load is dropped at the start of the next one. The old table
+    (table_name + '_old') is never dropped before a swap, though: if an Oracle
+    swap is interrupted, it may be the only copy of the live rows, and the
+    next swap stops at the rename until it has been checked and dropped.
+
+    As with todb_upsert, group_size can be a number or a batch size controller,
+    the rows can be read on a background thread ahead of the database with
+    pipeline, and a telemetry Monitor is told how long each group took.
+    """
+    dialect = getattr(db, 'dialect', 'oracle')
+    shadow_name = table_name + '_shadow'
+    old_name = table_name + '_old'
+    columns = table.fieldnames()
+    sizer = _batch_sizer(group_size)
+
+    db.execute(_drop_sql('TABLE', shadow_name, dialect))
+    db.execute('CREATE TABLE {} AS SELECT * FROM {} WHERE 1 = 0'.format(shadow_name, table_name))
+
+    if dialect == 'sqlite':
+        placeholders = ', '.join('?' for c in columns)
+    else:
+        placeholders = ', '.join(':{}'.format(c) for c in columns)
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(shadow_name, ', '.join(columns), placeholders)
+
+    row_groups = batches(sizer, table.values(columns))
+    if pipeline:
+        row_groups = prefetch(row_groups, pipeline)
+    num_rows = 0
+    for list_of_rows in row_groups:
+        started = perf_counter()
         db._c.executemany(sql, list_of_rows)
+        seconds = perf_counter() - started
+        sizer.record(len(list_of_rows), seconds)
+        if monitor is not None:
+            monitor.record_batch(len(list_of_rows), seconds)
+        num_rows += len(list_of_rows)
+    db.save()
+    sizer.report()
+
+    if not num_rows:
+        db.execute(_drop_sql('TABLE', shadow_name, dialect))
+        raise ValueError('No rows to load into {}; leaving it as it is'.format(table_name))
+
+    logger.info('Loaded {} rows into {}; swapping it in'.format(num_rows, shadow_name))
+    try:
+        for description, statement in swap_sql(table_name, shadow_name, old_name, indexes, dialect):
+            logger.debug('Swap step: {}'.format(description))
+            db.execute(statement)
+    except Exception:
+        # Only SQLite can take the swap back; on Oracle, see above.
+        if dialect == 'sqlite':
+            db.rollback()
+        raise
     db.save()
 
-Table.todb_upsert = todb_upsert
\ No newline at end of file
+Table.todb_swap = todb_swap
@@ -0,0 +1,232 @@
+"""
+Run the steps of the process (e.g., normalize, anonymize and fuzzy) each in its
+own process, passing batches of rows from one to the next over bounded queues.
+The steps then work at the same time on different parts of the data, so the
+whole takes about as long as the slowest step, rather than the sum of them.
+
+A pipeline is made of a source, which is called with no arguments and returns
+a table, followed by stages, each of which is called with a table (the output
+of the step before it) and returns a new table. Since they are run in other
+processes, the source and stages have to be picklable: module-level functions,
+or functools.partial objects wrapping them, rather than lambdas or open files.
+For example:
+
+    table = pipeline(partial(normalize, verifone, cmt),
+                     partial(anonymize, db_conn_str=..., field_tuples=...),
+                     partial(fuzzy, regionfile='regions.geojson'))
+    table.tocsv('fuzzied.csv')
+
+The rows themselves must be picklable as well, which rows of strings, numbers,
+datetimes and None all are.
+
+Each step collects the problems it finds in the data in an error collector of
+its own (see errors), and passes it on with the end of its rows, so that the
+counts (and rejected rows) of every step end up in the collector of the
+process reading the pipeline. The bytes each step reads and writes through
+streams are passed along the same way, with each batch, so that they add up
+to the totals of the whole pipeline in the process reading it (see
+telemetry).
+
+The process reading the pipeline keeps an eye on the steps while it waits for
+rows, so that if one of them dies without passing on its end or its error
+(killed, say, or out of memory), a PipelineError is raised rather than waiting
+forever.
+"""
+
+from multiprocessing import Process, Queue
+from queue import Empty
+from traceback import format_exc
+from petl import Table
+from . import errors, streams
+
+import logging
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+QUEUE_SIZE = 8
+POLL_INTERVAL = 1.0
+
+
+def pipeline(source, *stages, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+    """
+    Return a table of the rows that come out of the last stage of the pipeline.
+    The processes are started each time the table is iterated, and each queue
+    holds up to queue_size batches of batch_size rows, so a fast step waits for
+    a slower one after it rather than filling up memory.
+    """
+    return PipelineView(source, stages, batch_size=batch_size, queue_size=queue_size)
+
+
+class chain:
+    """
+    A stage that applies several stages in turn, in a single process -- for
+    steps that are too quick to be worth a process of their own.
+    """
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def __call__(self, table):
+        for stage in self.stages:
+            table = stage(table)
+        return table
+
+
+class QueueView(Table):
+    """
+    A table read from a queue fed by another step of the pipeline. The header
+    can be read any number of times, but the data rows only once.
+
+    If the processes running the steps are given (the last feeding the queue),
+    they're checked on every poll_interval seconds spent waiting, and a
+    PipelineError is raised if one has died.
+    """
+
+    def __init__(self, queue, processes=(), poll_interval=POLL_INTERVAL):
+        self.queue = queue
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.hdr = None
+        self.consumed = False
+
+    def _get(self):
+        while True:
+            try:
+                kind, value = self.queue.get(timeout=self.poll_interval)
+                break
+            except Empty:
+                pass
+            dead = self._dead_step()
+            if dead is None:
+                continue
+            # What a step put on the queue before exiting is already on its
+            # way, so give it one more chance to arrive.
+            try:
+                kind, value = self.queue.get(timeout=self.poll_interval)
+                break
+            except Empty:
+                raise PipelineError('Step {} of the pipeline exited with code {} without finishing'.format(
+                    dead + 1, self.processes[dead].exitcode)) from None
+        if kind == 'error':
+            raise PipelineError(value)
+        if kind in ('rows', 'done'):
+            value, (read, written) = value
+            streams.bytes_read.add(read)
+            streams.bytes_written.add(written)
+        if kind == 'done':
+            errors.collector.merge(value)
+        return kind, value
+
+    def _dead_step(self):
+        # Earlier steps exit normally once they've passed on their rows, but
+        # the last one should still be running while its queue is being read.
+        last = len(self.processes) - 1
+        for i, process in enumerate(self.processes):
+            if process.exitcode is not None and (process.exitcode != 0 or i == last):
+                return i
+        return None
+
+    def __iter__(self):
+        if self.hdr is None:
+            kind, self.hdr = self._get()
+            if kind == 'done':
+                return
+        yield self.hdr
+
+        if self.consumed:
+            raise PipelineError('The rows of a pipeline step can only be read once')
+        self.consumed = True
+
+        while True:
+            kind, rows = self._get()
+            if kind == 'done':
+                return
+            yield from rows
+
+
+class PipelineError(Exception):
+    pass
+
+
+class _ByteCounts:
+    """The bytes read and written through streams since the last take()."""
+
+    def __init__(self):
+        self.read = streams.bytes_read.value
+        self.written = streams.bytes_written.value
+
+    def take(self):
+        read, written = streams.bytes_read.value, streams.bytes_written.value
+        counts = (read - self.read, written - self.written)
+        self.read, self.written = read, written
+        return counts
+
+
+def _send(table, queue, batch_size, byte_counts):
+    it = iter(table)
+    hdr = next(it, None)
+    if hdr is None:
+        queue.put(('done', (errors.collector.state(), byte_counts.take())))
+        return
+    queue.put(('header', tuple(hdr)))
+
+    batch = []
+    for row in it:
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            queue.put(('rows', (batch, byte_counts.take())))
+            batch = []
+    if batch:
+        queue.put(('rows', (batch, byte_counts.take())))
+    queue.put(('done', (errors.collector.state(), byte_counts.take())))
+
+
+def _run_step(step, in_queue, out_queue, batch_size):
+    # Collect the step's problems (and those of the steps before it) on their
+    # own, to pass along with its rows, and likewise the bytes it reads and
+    # writes (which include those of the steps before it, added in as their
+    # batches arrive).
+    errors.collector = errors.ErrorCollector(interval=None, keep_rejects=True)
+    byte_counts = _ByteCounts()
+    try:
+        table = step() if in_queue is None else step(QueueView(in_queue))
+        _send(table, out_queue, batch_size, byte_counts)
+    except PipelineError as exc:
+        # An earlier step failed; pass its error along.
+        out_queue.put(('error', str(exc)))
+    except BaseException:
+        out_queue.put(('error', format_exc()))
+
+
+class PipelineView(Table):
+
+    def __init__(self, source, stages, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        self.source = source
+        self.stages = stages
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def __iter__(self):
+        steps = (self.source,) + tuple(self.stages)
+        queues = [Queue(self.queue_size) for _ in steps]
+        processes = [
+            Process(target=_run_step,
+                    args=(step, queues[i - 1] if i else None, queues[i], self.batch_size),
+                    daemon=True)
+            for i, step in enumerate(steps)]
+
+        for process in processes:
+            process.start()
+        logger.debug('Started a pipeline of {} processes'.format(len(processes)))
+
+        try:
+            yield from QueueView(queues[-1], processes)
+        finally:
+            # If the rows were all read, the steps are finishing up on their
+            # own; otherwise (on an error, or if the reader stopped early)
+            # they may be stuck waiting on a full queue, so stop them.
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
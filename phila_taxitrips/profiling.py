@@ -0,0 +1,208 @@
+"""
+Profile the columns of a trips table in a single streaming pass: for each
+column, count the values, the nulls, the distinct values and the most common
+values.
+
+Low-cardinality columns are counted exactly. High-cardinality columns (like
+medallions or coordinates) use a HyperLogLog sketch for the distinct count and
+a pruned counter for the most common values, so memory stays bounded no matter
+how many distinct values there are.
+
+Profiles are mergeable, so files (or chunks of files) can be profiled in
+parallel and combined afterwards.
+"""
+
+from collections import Counter
+from functools import partial, reduce
+from hashlib import blake2b
+from multiprocessing import Pool
+import numpy
+from . import petl_ext as petl
+
+# Columns of the normalized trips data that have too many distinct values to
+# count exactly.
+HIGH_CARDINALITY_COLUMNS = [
+    'Medallion', 'Chauffeur #',
+    'Meter On Datetime', 'Meter Off Datetime',
+    'Pickup Latitude', 'Pickup Longitude', 'Pickup Location',
+    'Dropoff Latitude', 'Dropoff Longitude', 'Dropoff Location',
+]
+
+
+class HyperLogLog:
+    """
+    Estimate the number of distinct values seen, using 2**p one-byte registers
+    (16KB with the default p=14, for a standard error of about 0.8%).
+    """
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = numpy.zeros(1 << p, dtype=numpy.uint8)
+        self._rest_bits = 64 - p
+        self._rest_mask = (1 << self._rest_bits) - 1
+
+    def add(self, value):
+        h = int.from_bytes(blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'little')
+        index = h >> self._rest_bits
+        rank = self._rest_bits - (h & self._rest_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        numpy.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / numpy.sum(numpy.power(2.0, -self.registers.astype(numpy.float64)))
+        zeros = numpy.count_nonzero(self.registers == 0)
+        # Small range correction
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * numpy.log(m / zeros)
+        return int(round(estimate))
+
+
+class ExactCounter:
+    """Count every distinct value."""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, value):
+        self.counts[value] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def most_common(self, n):
+        return self.counts.most_common(n)
+
+
+class PrunedCounter(ExactCounter):
+    """
+    A counter that keeps only about `capacity` of its most common values. Once
+    it holds twice that many, it drops all but the most common ones. Values
+    that are common overall will come out on top, though their counts may be
+    low by however many times they were seen before being pruned.
+    """
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.capacity = capacity
+
+    def add(self, value):
+        self.counts[value] += 1
+        if len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+    def prune(self):
+        self.counts = Counter(dict(self.counts.most_common(self.capacity)))
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        if len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+
+class ColumnProfile:
+
+    def __init__(self, name, approximate=False, top=10):
+        self.name = name
+        self.approximate = approximate
+        self.top = top
+        self.count = 0
+        self.nulls = 0
+        if approximate:
+            self.values = PrunedCounter(max(1000, 100 * top))
+            self.distinct = HyperLogLog()
+        else:
+            self.values = ExactCounter()
+            self.distinct = None
+
+    def add(self, value):
+        self.count += 1
+        if value is None or value == '':
+            self.nulls += 1
+            return
+        self.values.add(value)
+        if self.distinct is not None:
+            self.distinct.add(value)
+
+    def merge(self, other):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.values.merge(other.values)
+        if self.distinct is not None:
+            self.distinct.merge(other.distinct)
+
+    def distinct_count(self):
+        if self.distinct is not None:
+            return self.distinct.count()
+        return len(self.values)
+
+    def summary(self):
+        null_rate = self.nulls / self.count if self.count else 0.0
+        top_values = '; '.join('{} ({})'.format(value, count)
+                               for value, count in self.values.most_common(self.top))
+        return (self.name, self.count, self.nulls, round(null_rate, 4),
+                self.distinct_count(),
+                'approximate' if self.approximate else 'exact',
+                top_values)
+
+
+class TableProfile:
+    """A ColumnProfile for each field of a table."""
+
+    def __init__(self, fieldnames, approximate_columns=HIGH_CARDINALITY_COLUMNS, top=10):
+        self.fieldnames = list(fieldnames)
+        self.columns = [ColumnProfile(name, name in approximate_columns, top)
+                        for name in self.fieldnames]
+
+    def update(self, rows):
+        """Add each row (a sequence of values in field order) to the profile."""
+        columns = self.columns
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.add(value)
+        return self
+
+    def merge(self, other):
+        if other.fieldnames != self.fieldnames:
+            raise ValueError('Cannot merge profiles of tables with different fields')
+        for column, other_column in zip(self.columns, other.columns):
+            column.merge(other_column)
+        return self
+
+    def table(self):
+        """Return the profile as a table, with one row per column."""
+        header = ('Column', 'Count', 'Nulls', 'Null Rate', 'Distinct',
+                  'Distinct Method', 'Top Values')
+        return petl.wrap([header] + [column.summary() for column in self.columns])
+
+
+def profile_table(table, approximate_columns=HIGH_CARDINALITY_COLUMNS, top=10):
+    """Profile every column of the table in one pass."""
+    return TableProfile(table.fieldnames(), approximate_columns, top)\
+        .update(table.data())
+
+
+def profile_file(csvfile, approximate_columns=HIGH_CARDINALITY_COLUMNS, top=10):
+    return profile_table(petl.fromcsv(csvfile), approximate_columns, top)
+
+
+def profile_files(csvfiles, approximate_columns=HIGH_CARDINALITY_COLUMNS, top=10,
+                  processes=None):
+    """
+    Profile each of the CSV files in its own worker process, and merge the
+    results into a single profile. The files must all have the same fields.
+    """
+    work = partial(profile_file, approximate_columns=approximate_columns, top=top)
+    if processes == 1 or len(csvfiles) == 1:
+        profiles = map(work, csvfiles)
+        return reduce(TableProfile.merge, profiles)
+
+    with Pool(processes) as pool:
+        return reduce(TableProfile.merge, pool.imap(work, csvfiles))
@@ -0,0 +1,106 @@
+"""
+A local, persistent record of what has already been uploaded, so that rows
+that haven't changed since the last upload don't have to be sent to the server
+again.
+
+The index maps a hash of each row's identifying columns to a hash of the whole
+row. Both are 64-bit, and they are kept as a pair of sorted numpy arrays in a
+single .npz file, so a year of trips takes a little over 100MB on disk and can
+be checked in large batches with a binary search.
+"""
+
+from hashlib import blake2b
+import numpy
+import os
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def hash_values(values):
+    """Return a 64-bit integer hash of a sequence of values."""
+    data = '\x1f'.join('' if v is None else str(v) for v in values)
+    return int.from_bytes(blake2b(data.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class RowHashIndex:
+    """
+    Map of row key hashes to row content hashes, stored in the file at path.
+
+    Rows that pass through filter() are remembered as pending, and only become
+    part of the index once save() is called. Call save() only after
+    the rows have been committed to the database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with numpy.load(path) as data:
+                self.keys = data['keys']
+                self.hashes = data['hashes']
+        else:
+            self.keys = numpy.empty(0, dtype=numpy.uint64)
+            self.hashes = numpy.empty(0, dtype=numpy.uint64)
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def filter(self, rows, key_indexes):
+        """
+        Return the list of rows that are new or different from what was
+        recorded in the index, and remember them as pending. Rows are matched
+        on the values at key_indexes. A row that shows up more than once in the
+        same upload is only returned the first time.
+        """
+        keys = numpy.fromiter((hash_values([row[i] for i in key_indexes]) for row in rows),
+                              dtype=numpy.uint64, count=len(rows))
+        hashes = numpy.fromiter((hash_values(row) for row in rows),
+                                dtype=numpy.uint64, count=len(rows))
+
+        positions = numpy.searchsorted(self.keys, keys)
+        positions[positions == len(self.keys)] = 0
+        if len(self.keys):
+            unchanged = (self.keys[positions] == keys) & (self.hashes[positions] == hashes)
+        else:
+            unchanged = numpy.zeros(len(keys), dtype=bool)
+
+        # A key already pending in this upload is compared against what is
+        # pending, not against the index, or a key that shows up twice with
+        # different contents would be sent in a different order on each run.
+        changed_rows = []
+        for i, (key, value) in enumerate(zip(keys.tolist(), hashes.tolist())):
+            pending = self.pending.get(key)
+            if pending is None:
+                if unchanged[i]:
+                    continue
+            elif pending == value:
+                continue
+            self.pending[key] = value
+            changed_rows.append(rows[i])
+        return changed_rows
+
+    def save(self):
+        """Merge the pending rows into the index and write it to disk."""
+        if not self.pending:
+            return
+
+        new_keys = numpy.fromiter(self.pending.keys(), dtype=numpy.uint64, count=len(self.pending))
+        new_hashes = numpy.fromiter(self.pending.values(), dtype=numpy.uint64, count=len(self.pending))
+
+        keep = ~numpy.isin(self.keys, new_keys)
+        keys = numpy.concatenate((self.keys[keep], new_keys))
+        hashes = numpy.concatenate((self.hashes[keep], new_hashes))
+        order = numpy.argsort(keys, kind='stable')
+        self.keys, self.hashes = keys[order], hashes[order]
+
+        # Write to a temporary file first, so that a failure part way through
+        # doesn't leave a corrupt index behind.
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as outfile:
+            numpy.savez(outfile, keys=self.keys, hashes=self.hashes)
+        os.replace(tmp_path, self.path)
+
+        logger.info('Recorded {} changed rows; index now holds {} rows'.format(len(self.pending), len(self.keys)))
+        self.pending = {}
+
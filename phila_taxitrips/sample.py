@@ -0,0 +1,198 @@
+"""
+Draw a random, reproducible sample of the trips in the vendors' files, without
+reading the files through: each draw seeks to a random byte offset in one of
+the files (picked in proportion to its size), skips to the start of the next
+line, and reads that line. The cost of a sample depends on how many lines are
+drawn, not on how big the files are, so a realistic subset of a multi-GB
+delivery takes seconds.
+
+A line is only kept if it parses as a CSV row with the expected number of
+fields, which guards against landing in the middle of a quoted field with a
+line break in it. The first line of each file (CMT's header) is never drawn.
+Since a draw lands in the line before the one it reads, lines that follow long
+lines are slightly more likely to be drawn than others.
+
+The sample is stratified, either by vendor or by the month of the meter-on
+time: lines are drawn until every stratum found has per_stratum lines (or
+until max_draws), so that, e.g., every month of a year-long delivery is
+represented, rather than just January.
+
+The lines are written out as they are in the vendors' files, one file per
+vendor (with the CMT header), so that the sample can be fed to normalize, or
+scrubbed with clean_verifone_sample.py / clean_cmt_sample.py.
+"""
+
+import csv
+from glob import glob
+import io
+import os
+import random
+
+import logging
+logger = logging.getLogger(__name__)
+
+FIELD_COUNT = 23
+METER_ON_FIELD = 6
+STRATA = ('month', 'vendor')
+
+
+def _verifone_month(value):
+    # e.g., 2015-01-01 00:09:00.000
+    return value[:7]
+
+
+def _cmt_month(value):
+    # e.g., 01/01/2015 00:00
+    return '{}-{}'.format(value[6:10], value[:2])
+
+
+MONTH_PARSERS = {
+    'verifone': _verifone_month,
+    'cmt': _cmt_month,
+}
+
+
+def _parse(line):
+    """The fields of a raw line, or None if it isn't a complete row."""
+    # The files are windows-1252, but only the field count and the (ASCII)
+    # meter-on time matter here, so latin-1 will do and never fails.
+    try:
+        rows = list(csv.reader(io.StringIO(line.decode('latin-1'))))
+    except csv.Error:
+        return None
+    if len(rows) != 1 or len(rows[0]) != FIELD_COUNT:
+        return None
+    return rows[0]
+
+
+class VendorFile:
+    """One of a vendor's files, open for random reads."""
+
+    def __init__(self, vendor, path):
+        self.vendor = vendor
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.file = open(path, 'rb')
+        self.header = self.file.readline()
+        self.data_start = self.file.tell()
+
+    def line_at(self, offset):
+        """
+        The (start, line) of the first whole line after the offset, or None if
+        there isn't one.
+        """
+        self.file.seek(offset)
+        self.file.readline()
+        start = max(self.file.tell(), self.data_start)
+        self.file.seek(start)
+        line = self.file.readline()
+        if not line.endswith(b'\n'):
+            # At the end of the file, which may have been cut off mid-line.
+            return None if not line else (start, line + b'\n')
+        return start, line
+
+    def close(self):
+        self.file.close()
+
+
+def sample(verifone_filenames, cmt_filenames, per_stratum, by='month', seed=0,
+           max_draws=None):
+    """
+    Draw up to per_stratum lines for each stratum (month or vendor) found in
+    the files. Returns a list of the (vendor file, offset, line) of each line
+    drawn, in file order. The same seed gives the same sample of the same
+    files.
+    """
+    if by not in STRATA:
+        raise ValueError('Can only stratify by month or vendor, not {}'.format(by))
+    if max_draws is None:
+        max_draws = 100 * per_stratum * (12 if by == 'month' else 2)
+
+    files = [VendorFile('verifone', f) for p in verifone_filenames for f in sorted(glob(p))]
+    files += [VendorFile('cmt', f) for p in cmt_filenames for f in sorted(glob(p))]
+    try:
+        return _draw(files, per_stratum, by, seed, max_draws)
+    finally:
+        for f in files:
+            f.close()
+
+
+def _draw(files, per_stratum, by, seed, max_draws):
+    files = [f for f in files if f.size > f.data_start]
+    if not files:
+        raise ValueError('There are no trips to sample from')
+
+    rng = random.Random(seed)
+    weights = [f.size - f.data_start for f in files]
+    counts = {}
+    if by == 'vendor':
+        counts = {f.vendor: 0 for f in files}
+    drawn = set()
+    lines = []
+    draws = rejected = 0
+    # Keep drawing until every stratum is full, and no new one has turned up
+    # in a while.
+    patience = 10 * per_stratum
+    since_new = 0
+
+    while draws < max_draws:
+        if counts and all(n >= per_stratum for n in counts.values()) and since_new >= patience:
+            break
+        draws += 1
+        since_new += 1
+
+        vendor_file = rng.choices(files, weights)[0]
+        found = vendor_file.line_at(vendor_file.data_start + rng.randrange(vendor_file.size - vendor_file.data_start))
+        if found is None or (vendor_file.path, found[0]) in drawn:
+            continue
+        start, line = found
+        fields = _parse(line)
+        if fields is None:
+            rejected += 1
+            continue
+
+        stratum = vendor_file.vendor if by == 'vendor' \
+            else MONTH_PARSERS[vendor_file.vendor](fields[METER_ON_FIELD])
+        if stratum not in counts:
+            counts[stratum] = 0
+            since_new = 0
+        if counts[stratum] >= per_stratum:
+            continue
+        counts[stratum] += 1
+        drawn.add((vendor_file.path, start))
+        lines.append((vendor_file, start, line))
+
+    logger.info('Drew {} lines in {} draws ({} not whole rows) from {} strata: {}'.format(
+        len(lines), draws, rejected, len(counts),
+        ', '.join('{} {}'.format(k, v) for k, v in sorted(counts.items()))))
+    if draws >= max_draws and any(n < per_stratum for n in counts.values()):
+        logger.warning('Stopped after {} draws, with some strata short of {} lines'.format(
+            max_draws, per_stratum))
+
+    order = {f.path: i for i, f in enumerate(files)}
+    lines.sort(key=lambda item: (order[item[0].path], item[1]))
+    return lines
+
+
+def write_sample(verifone_filenames, cmt_filenames, outdir, per_stratum,
+                 by='month', seed=0, max_draws=None):
+    """
+    Sample the vendors' files (see sample), and write the lines drawn to
+    outdir/verifone.csv and outdir/cmt.csv, as they were. The CMT sample starts
+    with the header of the first CMT file. Returns the number of lines written
+    for each vendor.
+    """
+    lines = sample(verifone_filenames, cmt_filenames, per_stratum,
+                   by=by, seed=seed, max_draws=max_draws)
+    os.makedirs(outdir, exist_ok=True)
+    written = {}
+    for vendor in ('verifone', 'cmt'):
+        vendor_lines = [(f, line) for f, _, line in lines if f.vendor == vendor]
+        if not vendor_lines:
+            continue
+        with open(os.path.join(outdir, vendor + '.csv'), 'wb') as outfile:
+            if vendor == 'cmt':
+                outfile.write(vendor_lines[0][0].header)
+            outfile.writelines(line for _, line in vendor_lines)
+        written[vendor] = len(vendor_lines)
+    return written
@@ -0,0 +1,186 @@
+"""
+Read a single large CSV file on several cores, by splitting it into byte
+ranges that each start and end on a record boundary, and parsing (and
+transforming) the ranges in a pool of worker processes.
+
+The file is memory-mapped to find the boundaries. A newline ends a record only
+if it is outside of quotes, i.e. if an even number of quote characters comes
+before it; with the usual doubled-quote escaping ("") this holds for any CSV
+file. So the quotes are counted up to each candidate split point (which the
+memory map does at close to memory speed, without reading the file into
+Python), and each split is moved forward to the first newline after it with an
+even count.
+
+Each worker reads its range straight from the file, so only the parsed rows
+pass between processes, and the rows come back in file order.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import csv
+import io
+import mmap
+from multiprocessing import Pool
+import os
+from petl import Table
+from petl.io.csv import fromcsv
+from . import errors, streams
+
+import logging
+logger = logging.getLogger(__name__)
+
+PIECE_SIZE = 8 * 1024 * 1024
+COUNT_SIZE = 16 * 1024 * 1024
+
+
+def _count(mm, byte, start, end):
+    # Count in slices, so as not to copy a large part of the file at once.
+    count = 0
+    for pos in range(start, end, COUNT_SIZE):
+        count += mm[pos:min(pos + COUNT_SIZE, end)].count(byte)
+    return count
+
+
+def record_ranges(filename, piece_size=PIECE_SIZE, quotechar='"'):
+    """
+    Split the file into (start, end) byte ranges of about piece_size bytes,
+    each of which starts at the beginning of a record and ends just after a
+    record's final newline.
+    """
+    quote = quotechar.encode('ascii')
+    with open(filename, 'rb') as infile:
+        try:
+            mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file can't be mapped.
+            return []
+        with mm:
+            size = len(mm)
+            ranges = []
+            start = pos = 0
+            odd = False  # whether an odd number of quotes come before pos
+            while size - start > piece_size:
+                target = start + piece_size
+                odd ^= bool(_count(mm, quote, pos, target) & 1)
+                pos = target
+                while True:
+                    newline = mm.find(b'\n', pos)
+                    if newline == -1:
+                        pos = size
+                        break
+                    odd ^= bool(_count(mm, quote, pos, newline) & 1)
+                    pos = newline + 1
+                    if not odd:
+                        break
+                if pos >= size:
+                    break
+                ranges.append((start, pos))
+                start = pos
+            ranges.append((start, size))
+            return ranges
+
+
+class RangeIO(io.RawIOBase):
+    """A raw file that reads from the current position of a file up to end."""
+
+    def __init__(self, file, end):
+        self._file = file
+        self._remaining = end - file.tell()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._remaining <= 0:
+            return 0
+        n = self._file.readinto(memoryview(b)[:self._remaining])
+        self._remaining -= n
+        return n
+
+
+class PieceSource:
+    """A petl source for a byte range of a file."""
+
+    def __init__(self, filename, start, end):
+        self.filename = filename
+        self.start = start
+        self.end = end
+
+    @contextmanager
+    def open(self, mode='rb'):
+        with open(self.filename, 'rb', buffering=0) as infile:
+            infile.seek(self.start)
+            yield io.BufferedReader(RangeIO(infile, self.end), streams.BUFFER_SIZE)
+
+
+def first_record(filename, encoding=None, errors='strict', **csvargs):
+    """The first record of a CSV file (normally its header)."""
+    with open(filename, encoding=encoding, errors=errors, newline='') as infile:
+        return next(csv.reader(infile, **csvargs), [])
+
+
+def piece_tables(filename, encoding=None, errors='strict', piece_size=PIECE_SIZE, **csvargs):
+    """
+    Tables of the records in each of the file's ranges (see record_ranges).
+    The first holds the file's first record, as its header; the others have
+    the same header pushed on, so they all look like the whole file would.
+    """
+    header = None
+    for i, (start, end) in enumerate(record_ranges(filename, piece_size, csvargs.get('quotechar', '"'))):
+        table = fromcsv(PieceSource(filename, start, end), encoding=encoding, errors=errors, **csvargs)
+        if i > 0:
+            if header is None:
+                header = first_record(filename, encoding, errors, **csvargs)
+            table = table.pushheader(header)
+        yield table, end - start
+
+
+def _run_piece(args):
+    table, transform = args
+    # Collect the piece's problems on their own, to hand back with its rows.
+    errors.collector = errors.ErrorCollector(interval=None, keep_rejects=True)
+    if transform is not None:
+        table = transform(table)
+    return [tuple(row) for row in table.data()], errors.collector.state()
+
+
+class ParallelPiecesView(Table):
+    """
+    The rows of transform(table) for each of the (table, size in bytes) pairs,
+    worked out in a pool of processes and put back together in order. At most
+    two pieces per process are in flight at a time, so memory stays bounded
+    even if the rows are read slowly.
+    """
+
+    def __init__(self, tables, transform=None, processes=None):
+        self.tables = tables
+        self.transform = transform
+        self.processes = processes
+
+    def __iter__(self):
+        tables = list(self.tables)
+        if not tables:
+            return
+        first_table, _ = tables[0]
+        header = (first_table if self.transform is None else self.transform(first_table)).header()
+        yield tuple(header)
+
+        processes = self.processes or os.cpu_count()
+        with Pool(processes) as pool:
+            window = 2 * processes
+            pending = deque()
+            for table, size in tables:
+                pending.append((pool.apply_async(_run_piece, ((table, self.transform),)), size))
+                if len(pending) >= window:
+                    yield from self._finish(pending.popleft())
+            while pending:
+                yield from self._finish(pending.popleft())
+
+    @staticmethod
+    def _finish(item):
+        result, size = item
+        rows, error_state = result.get()
+        # The workers read the file, so count its bytes here, for telemetry.
+        streams.bytes_read.add(size)
+        errors.collector.merge(error_state)
+        return rows
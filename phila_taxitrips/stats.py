@@ -0,0 +1,117 @@
+"""
+Summary statistics over streams of trips, kept in compact numpy arrays rather
+than Python sequences so that a full year of trips fits comfortably in memory.
+"""
+
+from itertools import combinations
+import numpy
+import petl
+
+
+class GrowableArray:
+    """
+    A one-dimensional numpy array that can be appended to, doubling its
+    capacity as needed.
+    """
+
+    def __init__(self, dtype=numpy.float64, capacity=1024):
+        self._data = numpy.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        if self._size == len(self._data):
+            self._data = numpy.resize(self._data, 2 * len(self._data))
+        self._data[self._size] = value
+        self._size += 1
+
+    @property
+    def values(self):
+        """A view of the values appended so far."""
+        return self._data[:self._size]
+
+
+def filter_outliers(values, scale=2):
+    """
+    Filtering outliers of a sample, particularly a non-symetric one, is fraught
+    with gotchas. For a comprehensive run down of the complications, see
+    http://eurekastatistics.com/using-the-median-absolute-deviation-to-find-outliers/.
+
+    Here, use a median absolute difference (MAD) approach, which should be good
+    enough to alert us of problems, even if it's not entirely rigorous.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    median = numpy.median(values)
+    dists = numpy.abs(values - median)
+    median_dist = numpy.median(dists)
+    return values[dists <= (median_dist * scale)]
+
+
+class TripLengthStats:
+    """
+    Accumulate trip lengths per data source, and check that the sources agree
+    with each other (see validate_trip_lengths).
+
+    Trip lengths are stored as dtype values in one growable array per source,
+    so memory use is a fixed number of bytes per trip (8 by default, or 4 with
+    numpy.float32).
+
+    The object can also be used as a sink for petl_ext.tee, in which case it
+    reads the trip length and data source from the length_field and
+    source_field of each row, skipping rows without a numeric trip length.
+    """
+
+    def __init__(self, length_field='Trip_Length', source_field='Data_Source',
+                 dtype=numpy.float64):
+        self.length_field = length_field
+        self.source_field = source_field
+        self.dtype = dtype
+        self.lengths = {}
+        self.skipped = 0
+
+    def add(self, source, length):
+        if source not in self.lengths:
+            self.lengths[source] = GrowableArray(self.dtype)
+        self.lengths[source].append(length)
+
+    def __call__(self, row):
+        try:
+            length = float(row[self.length_field])
+        except (TypeError, ValueError):
+            self.skipped += 1
+            return
+        self.add(row[self.source_field], length)
+
+    def table(self, scale=2):
+        """
+        Return a table of the mean and standard deviation of the trip lengths
+        for each data source, after filtering out outliers.
+        """
+        rows = [('Data_Source', 'mean', 'std')]
+        for source in sorted(self.lengths):
+            normal = filter_outliers(self.lengths[source].values, scale)
+            rows.append((source, float(numpy.mean(normal)), float(numpy.std(normal))))
+        return petl.wrap(rows)
+
+    def errors(self, table=None):
+        """
+        Return a list of messages for each pair of sources whose means are
+        farther apart than either of their standard deviations.
+        """
+        table = self.table() if table is None else table
+
+        errors = []
+        for source1, source2 in combinations(table.records(), 2):
+            # get the distance between the means
+            dist = abs(source1.mean - source2.mean)
+
+            # check that the distance is within the standard error (i.e. 1
+            # standard deviation) of each sample
+            if dist <= min(source1.std, source2.std):
+                continue
+            else:
+                errors.append('{} and {} samples are farther apart than expected'.format(source1.Data_Source, source2.Data_Source))
+
+        return errors
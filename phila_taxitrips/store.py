@@ -0,0 +1,353 @@
+"""
+A local, append-only, columnar store of trips (normalized or fuzzied), for
+answering ad-hoc questions -- one medallion's trips in March, the trips from
+one region -- without loading everything into the database or grepping CSVs.
+
+A store is a directory of chunks, partitioned by pickup month:
+
+    storedir/
+        zonemaps.json
+        2015-03/chunk-000000.npz
+        2015-03/chunk-000004.npz
+        2015-04/chunk-000001.npz
+        ...
+
+Each chunk holds up to CHUNK_ROWS trips, one numpy array per column, so a
+query only reads (and decompresses) the columns it needs. Numeric columns are
+kept as numbers (see COLUMN_TYPES), so that they compare as numbers: region
+IDs, whole numbers and money (in cents) as integers, and distances and
+coordinates as floats. Numbers that can't be read are stored as missing, and
+counted in errors.collector. Everything else is kept as text, which can only be
+compared for equality, apart from the datetimes, whose text sorts in time
+order.
+
+zonemaps.json lists the columns and the chunks, and for each chunk the minimum
+and maximum of each of the ZONE_MAP_COLUMNS it has. A query checks its
+predicates against these first, and only opens the chunks that could hold a
+matching trip. As with NULLs in SQL, missing values never match a predicate,
+and are left out of the zone maps.
+"""
+
+import json
+import operator
+import os
+import numpy
+from . import errors
+from . import petl_ext as petl
+from . import MONEY_COLUMNS_CSV
+from .partition import month_of
+
+import logging
+logger = logging.getLogger(__name__)
+
+ZONE_MAPS = 'zonemaps.json'
+CHUNK_ROWS = 100000
+
+ZONE_MAP_COLUMNS = ('Meter On Datetime', 'Meter Off Datetime', 'Medallion',
+                    'Pickup Region ID', 'Dropoff Region ID', 'Fare', 'Trip Length')
+DATETIME_COLUMNS = ('Meter On Datetime', 'Meter Off Datetime',
+                    'Pickup General Time', 'Dropoff General Time')
+
+# The type of each numeric column of normalized or fuzzied trips; the rest are
+# text. Stores made before the types were recorded only have region IDs.
+COLUMN_TYPES = {
+    'Pickup Region ID': 'region',
+    'Dropoff Region ID': 'region',
+    'Trip Duration (minutes)': 'integer',
+    'Pickup Year': 'integer',
+    'Pickup Month': 'integer',
+    'Pickup Day': 'integer',
+    'Pickup Hour': 'integer',
+    'Pickup DOW': 'integer',
+    'Dropoff Year': 'integer',
+    'Dropoff Month': 'integer',
+    'Dropoff Day': 'integer',
+    'Dropoff Hour': 'integer',
+    'Dropoff DOW': 'integer',
+    'Trip Length': 'float',
+    'Pickup Latitude': 'float',
+    'Pickup Longitude': 'float',
+    'Dropoff Latitude': 'float',
+    'Dropoff Longitude': 'float',
+    'Pickup Region Centroid Latitude': 'float',
+    'Pickup Region Centroid Longitude': 'float',
+    'Dropoff Region Centroid Latitude': 'float',
+    'Dropoff Region Centroid Longitude': 'float',
+}
+COLUMN_TYPES.update((column, 'cents') for column in MONEY_COLUMNS_CSV)
+LEGACY_TYPES = {'Pickup Region ID': 'region', 'Dropoff Region ID': 'region'}
+
+MISSING_INTEGER = -1
+MISSING_NUMBER = numpy.iinfo(numpy.int64).min
+
+OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+# For each type: the dtype of its arrays, the value that stands for a missing
+# one, how to read a (non-empty) value from a table, and how to turn one back.
+TYPES = {
+    'region': (numpy.int64, MISSING_INTEGER, int, int),
+    'integer': (numpy.int64, MISSING_NUMBER, int, int),
+    'cents': (numpy.int64, MISSING_NUMBER, lambda v: int(petl.asmoney(v)), petl.Cents),
+    'float': (numpy.float64, numpy.nan, float, float),
+    'text': (str, '', _text, str),
+}
+
+
+def _reader(column, kind):
+    """
+    How to read the column's values from a table: empty ones as the type's
+    missing value, and ones that can't be read the same, after counting them
+    (see errors).
+    """
+    _, missing, parse, _ = TYPES[kind]
+    if kind == 'text':
+        return parse
+    error_type = 'bad amount' if kind == 'cents' else 'bad number'
+
+    def _read(value):
+        if value is None or value == '':
+            return missing
+        try:
+            return parse(value)
+        except (TypeError, ValueError):
+            errors.record(column, error_type, value)
+            return missing
+    return _read
+
+
+def _present(values, kind):
+    """Which of an array of values of the given type aren't missing."""
+    if kind == 'float':
+        return ~numpy.isnan(values)
+    return values != TYPES[kind][1]
+
+
+class Predicate:
+    """
+    A comparison of a column with a value, like Medallion = 4128. The value is
+    read as the column's type when the predicate is bound to a store (see
+    bind).
+    """
+
+    def __init__(self, column, op, value):
+        if op not in OPERATORS:
+            raise ValueError('Unknown operator: {}'.format(op))
+        self.column = column
+        self.op = op
+        self.text = value
+        self.value = value
+        self.kind = 'text'
+
+    def bind(self, kind):
+        """
+        Read the value as the given column type. Text other than datetimes
+        doesn't sort the way the values do (e.g., '10' < '9'), so only = and !=
+        can be used on it.
+        """
+        if kind == 'text' and self.op not in ('=', '!=') and self.column not in DATETIME_COLUMNS:
+            raise ValueError('{} is text, and can only be compared with = or !='.format(self.column))
+        try:
+            value = TYPES[kind][2](self.text)
+        except (TypeError, ValueError):
+            value = TYPES[kind][1]
+        if kind != 'text' and not _present(numpy.array([value]), kind)[0]:
+            raise ValueError('Not a {} value for {}: {!r}'.format(kind, self.column, self.text))
+        self.kind = kind
+        self.value = value
+
+    @classmethod
+    def parse(cls, text):
+        """Parse a predicate written as COLUMN OP VALUE, e.g. 'Medallion=4128'."""
+        # Try the two-character operators first, so that <= isn't read as <.
+        for op in sorted(OPERATORS, key=len, reverse=True):
+            column, found, value = text.partition(op)
+            if found:
+                return cls(column.strip(), op, value.strip())
+        raise ValueError('Not a predicate: {!r}'.format(text))
+
+    def __repr__(self):
+        return '{} {} {!r}'.format(self.column, self.op, self.value)
+
+    def may_match(self, zone):
+        """
+        Whether a chunk with the given [min, max] zone for the column could
+        have a row that matches. A zone of None means every value is missing.
+        """
+        if zone is None:
+            return False
+        low, high = zone
+        value = self.value
+        if self.op == '=':
+            return low <= value <= high
+        if self.op == '!=':
+            return not (low == high == value)
+        if self.op in ('<', '<='):
+            return OPERATORS[self.op](low, value)
+        return OPERATORS[self.op](high, value)
+
+    def mask(self, values):
+        """Which of an array of the column's values match."""
+        return OPERATORS[self.op](values, self.value) & _present(values, self.kind)
+
+
+class TripStore:
+    """The store in the directory at path, which is created as needed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+        self.types = None
+        self.chunks = []
+        self.batches = []
+        zone_maps_path = os.path.join(path, ZONE_MAPS)
+        if os.path.exists(zone_maps_path):
+            with open(zone_maps_path) as infile:
+                state = json.load(infile)
+            self.columns = state['columns']
+            self.types = state.get('types') or \
+                {column: LEGACY_TYPES.get(column, 'text') for column in self.columns}
+            self.chunks = state['chunks']
+            self.batches = state['batches']
+
+    def __len__(self):
+        return sum(chunk['rows'] for chunk in self.chunks)
+
+    def append(self, table, batch, chunk_rows=CHUNK_ROWS, partition_of=month_of):
+        """
+        Add the trips in the table to the store, as the batch with the given
+        name, in new chunks of up to chunk_rows trips per month. Returns the
+        number of trips added.
+        """
+        if batch in self.batches:
+            raise ValueError('Batch {} has already been added to the store'.format(batch))
+        os.makedirs(self.path, exist_ok=True)
+        columns = list(table.fieldnames())
+        if self.columns is None:
+            self.columns = columns
+            self.types = {column: COLUMN_TYPES.get(column, 'text') for column in columns}
+        elif columns != self.columns:
+            raise ValueError('The table\'s columns don\'t match those of the store')
+
+        pending = {}
+        added = 0
+        for row in table.records():
+            month = partition_of(row)
+            rows = pending.setdefault(month, [])
+            rows.append(tuple(row))
+            if len(rows) == chunk_rows:
+                self._write_chunk(month, rows)
+                added += len(rows)
+                del pending[month]
+        for month, rows in sorted(pending.items()):
+            self._write_chunk(month, rows)
+            added += len(rows)
+
+        self.batches.append(batch)
+        self.save()
+        logger.info('Added {} trips in batch {}; the store now has {} chunks'.format(
+            added, batch, len(self.chunks)))
+        return added
+
+    def _write_chunk(self, month, rows):
+        name = os.path.join(month, 'chunk-{:06d}.npz'.format(len(self.chunks)))
+        os.makedirs(os.path.join(self.path, month), exist_ok=True)
+
+        arrays = {}
+        zones = {}
+        for i, column in enumerate(self.columns):
+            kind = self.types[column]
+            read = _reader(column, kind)
+            array = numpy.array([read(row[i]) for row in rows], dtype=TYPES[kind][0])
+            arrays['c{}'.format(i)] = array
+
+            if column in ZONE_MAP_COLUMNS:
+                # numpy can't take the min of text, so use Python's
+                present = array[_present(array, kind)].tolist()
+                zones[column] = [min(present), max(present)] if present else None
+
+        with open(os.path.join(self.path, name), 'wb') as outfile:
+            numpy.savez_compressed(outfile, **arrays)
+        self.chunks.append({'file': name, 'partition': month, 'rows': len(rows), 'zones': zones})
+
+    def save(self):
+        state = {
+            'columns': self.columns,
+            'types': self.types,
+            'batches': self.batches,
+            'chunks': self.chunks,
+        }
+        path = os.path.join(self.path, ZONE_MAPS)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(state, outfile)
+        os.replace(tmp_path, path)
+
+    def candidate_chunks(self, predicates):
+        """The chunks whose zone maps don't rule out any of the predicates."""
+        for chunk in self.chunks:
+            if all(predicate.may_match(chunk['zones'][predicate.column])
+                   for predicate in predicates
+                   if predicate.column in chunk['zones']):
+                yield chunk
+
+    def query(self, predicates=(), columns=None):
+        """
+        A table of the trips that match all of the predicates, with the given
+        columns (by default, all of them).
+        """
+        if self.columns is None:
+            raise ValueError('The store at {} is empty'.format(self.path))
+        return QueryView(self, predicates, columns or self.columns)
+
+
+class QueryView(petl.Table):
+
+    def __init__(self, store, predicates, columns):
+        for column in list(columns) + [p.column for p in predicates]:
+            if column not in store.columns:
+                raise ValueError('No such column: {}'.format(column))
+        for predicate in predicates:
+            predicate.bind(store.types[predicate.column])
+        self.store = store
+        self.predicates = predicates
+        self.columns = columns
+
+    def __iter__(self):
+        store = self.store
+        yield tuple(self.columns)
+
+        scanned = 0
+        for chunk in store.candidate_chunks(self.predicates):
+            scanned += 1
+            with numpy.load(os.path.join(store.path, chunk['file'])) as data:
+                def column(name):
+                    return data['c{}'.format(store.columns.index(name))]
+
+                mask = numpy.ones(chunk['rows'], dtype=bool)
+                for predicate in self.predicates:
+                    mask &= predicate.mask(column(predicate.column))
+                if not mask.any():
+                    continue
+
+                values = []
+                for name in self.columns:
+                    kind = store.types[name]
+                    selected = column(name)[mask]
+                    present = _present(selected, kind).tolist()
+                    convert = TYPES[kind][3]
+                    values.append([convert(v) if p else None
+                                   for v, p in zip(selected.tolist(), present)])
+            yield from zip(*values)
+        logger.info('Read {} of {} chunks'.format(scanned, len(store.chunks)))
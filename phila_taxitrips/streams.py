@@ -0,0 +1,351 @@
+"""
+Buffered, optionally compressed file streams for reading and writing the
+pipeline's CSV files.
+
+Files ending in .gz are read and written with gzip, and files ending in .zst
+or .zstd with Zstandard (which needs the zstandard package). Compression and
+decompression run on a background thread, fed through a bounded queue of
+large chunks, so that they overlap with parsing and formatting the CSV rows.
+A filename of None or '-' means stdin or stdout.
+
+The bytes read from and written to files through these streams (before
+decompression and after compression) are totalled in bytes_read and
+bytes_written, for reporting throughput (see telemetry).
+
+StreamSource wraps all of this up as a petl source, so that petl_ext.fromcsv
+and petl_ext.tocsv work on compressed files as well as plain ones. petl opens
+a source more than once (for the header, and again for the rows), so stdin is
+copied to a temporary file the first time it is read, and read from there.
+"""
+
+from contextlib import contextmanager
+import gzip
+import io
+from queue import Queue, Empty
+import shutil
+import sys
+import tempfile
+from threading import Lock, Thread
+
+BUFFER_SIZE = 1024 * 1024
+QUEUE_SIZE = 4
+
+EXTENSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+
+def infer_compression(filename):
+    """Guess the compression of a file from its extension."""
+    if filename is None or filename == '-':
+        return None
+    for extension, compression in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return compression
+    return None
+
+
+class ByteCounter:
+    """A running total of bytes, safe to add to from several threads."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.value += n
+
+
+bytes_read = ByteCounter()
+bytes_written = ByteCounter()
+
+
+class CountingIO(io.RawIOBase):
+    """
+    A raw file that adds the number of bytes read from or written to it to a
+    ByteCounter. Wrap it in a buffered reader or writer, so that it is called
+    once per buffer-full rather than once per line.
+    """
+
+    def __init__(self, file, counter):
+        self._file = file
+        self._counter = counter
+
+    def readable(self):
+        return self._file.readable()
+
+    def writable(self):
+        return self._file.writable()
+
+    def seekable(self):
+        return self._file.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def isatty(self):
+        return self._file.isatty()
+
+    def readinto(self, b):
+        n = self._file.readinto(b)
+        if n:
+            self._counter.add(n)
+        return n
+
+    def write(self, b):
+        n = self._file.write(b)
+        if n:
+            self._counter.add(n)
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._file.close()
+        finally:
+            super().close()
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('Reading or writing .zst files requires the zstandard package')
+    return zstandard
+
+
+class ThreadedWriter(io.RawIOBase):
+    """
+    A write-only stream that hands each chunk written to it to a background
+    thread, which writes it on to the given file (typically a compressing
+    one). Wrap it in an io.BufferedWriter so that the chunks are large.
+    """
+
+    def __init__(self, file, queue_size=QUEUE_SIZE):
+        self._file = file
+        self._queue = Queue(queue_size)
+        self._error = None
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is None:
+                try:
+                    self._file.write(chunk)
+                except BaseException as exc:
+                    # Keep taking chunks so the writer never blocks on a full
+                    # queue; the error is raised on its next write.
+                    self._error = exc
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._check()
+        self._queue.put(bytes(b))
+        return len(b)
+
+    def close(self):
+        if self.closed or sys.is_finalizing():
+            # The thread may already have been stopped at interpreter exit.
+            return
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._file.close()
+        finally:
+            super().close()
+        self._check()
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    A read-only stream whose data is read from the given file (typically a
+    decompressing one) on a background thread, up to queue_size chunks ahead.
+    Wrap it in an io.BufferedReader for efficient small reads.
+    """
+
+    def __init__(self, file, chunk_size=BUFFER_SIZE, queue_size=QUEUE_SIZE):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._queue = Queue(queue_size)
+        self._error = None
+        self._stopping = False
+        self._eof = False
+        self._buffer = memoryview(b'')
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping:
+                chunk = self._file.read(self._chunk_size)
+                if not chunk:
+                    break
+                self._queue.put(chunk)
+        except BaseException as exc:
+            self._error = exc
+        self._queue.put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            if self._eof:
+                return 0
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+                if self._error is not None:
+                    raise self._error
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if self.closed or sys.is_finalizing():
+            # The thread may already have been stopped at interpreter exit,
+            # possibly in the middle of a read.
+            return
+        # Stop the reading thread, emptying the queue in case it's waiting on
+        # room to put another chunk.
+        self._stopping = True
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except Empty:
+                pass
+        self._thread.join()
+        try:
+            self._file.close()
+        finally:
+            super().close()
+
+
+def open_stream(filename, mode='rb', compression=None, buffer_size=BUFFER_SIZE):
+    """
+    Open a binary stream for reading (mode 'rb') or writing (mode 'wb') a file,
+    with buffer_size bytes of buffering. The compression is 'gzip', 'zstd', or
+    'none'; by default it is inferred from the filename. A filename of None or
+    '-' opens stdin or stdout, which are left open when the stream is closed.
+    """
+    if mode not in ('rb', 'wb'):
+        raise ValueError('Streams can only be opened in rb or wb mode')
+    reading = mode == 'rb'
+
+    if compression is None:
+        compression = infer_compression(filename)
+    if compression == 'none':
+        compression = None
+    if compression not in (None, 'gzip', 'zstd'):
+        raise ValueError('Unknown compression: {}'.format(compression))
+
+    if filename is None or filename == '-':
+        if reading:
+            fileno = sys.stdin.fileno()
+        else:
+            sys.stdout.flush()
+            fileno = sys.stdout.fileno()
+        file = io.FileIO(fileno, mode[0], closefd=False)
+    else:
+        file = io.FileIO(filename, mode[0])
+    if reading:
+        raw = io.BufferedReader(CountingIO(file, bytes_read), buffer_size)
+    else:
+        raw = io.BufferedWriter(CountingIO(file, bytes_written), buffer_size)
+
+    if compression is None:
+        return raw
+
+    if compression == 'gzip':
+        compressed = gzip.GzipFile(fileobj=raw, mode=mode)
+    else:
+        zstandard = _zstandard()
+        if reading:
+            compressed = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            compressed = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+
+    if reading:
+        return io.BufferedReader(ThreadedReader(_Closing(compressed, raw)), buffer_size)
+    else:
+        return io.BufferedWriter(ThreadedWriter(_Closing(compressed, raw)), buffer_size)
+
+
+class _Closing:
+    """
+    A compressed file that also closes its underlying file (GzipFile doesn't
+    close a file object it was given).
+    """
+
+    def __init__(self, compressed, raw):
+        self.compressed = compressed
+        self.raw = raw
+
+    def read(self, size):
+        return self.compressed.read(size)
+
+    def write(self, b):
+        return self.compressed.write(b)
+
+    def close(self):
+        try:
+            self.compressed.close()
+        finally:
+            if not self.raw.closed:
+                self.raw.close()
+
+
+class StreamSource:
+    """
+    A petl source for a file opened with open_stream. Stdin (a filename of
+    None or '-') is spooled to a temporary file the first time it's opened
+    for reading, so that it can be read again.
+    """
+
+    def __init__(self, filename=None, compression=None, buffer_size=BUFFER_SIZE):
+        self.filename = filename
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self._spool = None
+
+    def _spooled(self):
+        if self._spool is None:
+            self._spool = tempfile.NamedTemporaryFile(prefix='stdin-')
+            with io.FileIO(sys.stdin.fileno(), 'r', closefd=False) as stdin:
+                shutil.copyfileobj(stdin, self._spool, self.buffer_size)
+            self._spool.flush()
+        return self._spool.name
+
+    @contextmanager
+    def open(self, mode='rb'):
+        filename = self.filename
+        if mode == 'rb' and (filename is None or filename == '-'):
+            filename = self._spooled()
+        stream = open_stream(filename, mode, self.compression, self.buffer_size)
+        try:
+            yield stream
+        finally:
+            stream.close()
@@ -0,0 +1,223 @@
+"""
+Throughput metrics for the steps of the process, reported periodically so that
+a scheduler can alert when a run is slower than usual.
+
+A Monitor counts the rows that pass through a table (see Monitor.view), and
+every `interval` seconds reports:
+
+* the rows processed so far, and the rows per second since the last report,
+* the bytes read and written through petl_ext.fromcsv/tocsv (see streams),
+* the estimated time remaining, from how much of the input has been read,
+* the resident memory of the process, and
+* the number of database batches sent, and how long they took.
+
+The step reports once more, with done set, by calling Monitor.report(done=True)
+when it has finished -- after its output is closed and its last batch sent to
+the database, so that the final totals are complete.
+
+Reports go to a JSON-lines file (one JSON object per report, appended), to a
+Prometheus textfile (rewritten in place with each report, for node_exporter's
+textfile collector), or as a line of text to stderr.
+"""
+
+from glob import glob
+import json
+import os
+import resource
+import sys
+from threading import Lock
+from time import perf_counter, time
+from petl import Table
+from . import streams
+
+import logging
+logger = logging.getLogger(__name__)
+
+FORMATS = ('jsonl', 'prometheus', 'text')
+
+
+def rss_bytes():
+    """The resident memory of this process, in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not on Linux; fall back to the peak, which is in KB (or bytes, on
+        # macOS).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def input_size(filepatterns):
+    """The total size, in bytes, of the files matching the patterns."""
+    return sum(os.path.getsize(f)
+               for pattern in filepatterns
+               for f in glob(pattern))
+
+
+class Monitor:
+    """
+    Collect and report the throughput of one step. The path is where to write
+    the reports (stderr if None), in one of FORMATS. If input_bytes (the size of
+    the step's input) is given, reports include an estimate of the time left.
+    """
+
+    def __init__(self, stage, path=None, format='jsonl', interval=10.0, input_bytes=None):
+        if format not in FORMATS:
+            raise ValueError('Unknown metrics format: {}'.format(format))
+        self.stage = stage
+        self.path = path
+        self.format = format if path else 'text'
+        self.interval = interval
+        self.input_bytes = input_bytes
+
+        self.rows = 0
+        self.db_batches = 0
+        self.db_rows = 0
+        self.db_seconds = 0.0
+        self.db_last_seconds = None
+        self.lock = Lock()
+
+        self.started = perf_counter()
+        self.last_report = self.started
+        self.last_rows = 0
+        self.read_at_start = streams.bytes_read.value
+        self.written_at_start = streams.bytes_written.value
+
+    def view(self, table, check_every=1000):
+        """
+        Return a view of the table that counts its rows, checking whether a
+        report is due every check_every rows.
+        """
+        return MonitorView(table, self, check_every)
+
+    def record_batch(self, num_rows, seconds):
+        """Record that a batch of num_rows was sent to the database in seconds."""
+        with self.lock:
+            self.db_batches += 1
+            self.db_rows += num_rows
+            self.db_seconds += seconds
+            self.db_last_seconds = seconds
+
+    def tick(self):
+        if perf_counter() - self.last_report >= self.interval:
+            self.report()
+
+    def snapshot(self, done=False):
+        now = perf_counter()
+        elapsed = now - self.started
+        since_last = now - self.last_report
+        bytes_read = streams.bytes_read.value - self.read_at_start
+        bytes_written = streams.bytes_written.value - self.written_at_start
+
+        eta = None
+        if done:
+            eta = 0.0
+        elif self.input_bytes and bytes_read:
+            eta = max(0.0, (self.input_bytes - bytes_read) * elapsed / bytes_read)
+
+        with self.lock:
+            metrics = {
+                'timestamp': time(),
+                'stage': self.stage,
+                'done': done,
+                'elapsed_seconds': elapsed,
+                'rows': self.rows,
+                'rows_per_second': (self.rows - self.last_rows) / since_last if since_last else 0.0,
+                'bytes_read': bytes_read,
+                'bytes_written': bytes_written,
+                'input_bytes': self.input_bytes,
+                'eta_seconds': eta,
+                'rss_bytes': rss_bytes(),
+                'db_batches': self.db_batches,
+                'db_rows': self.db_rows,
+                'db_batch_seconds_avg': self.db_seconds / self.db_batches if self.db_batches else None,
+                'db_batch_seconds_last': self.db_last_seconds,
+            }
+        return metrics
+
+    def report(self, done=False):
+        metrics = self.snapshot(done)
+        self.last_report = perf_counter()
+        self.last_rows = self.rows
+
+        if self.format == 'jsonl':
+            with open(self.path, 'a') as outfile:
+                outfile.write(json.dumps(metrics) + '\n')
+        elif self.format == 'prometheus':
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as outfile:
+                outfile.write(prometheus_text(metrics))
+            os.replace(tmp_path, self.path)
+        else:
+            print(text_line(metrics), file=sys.stderr)
+        return metrics
+
+
+class MonitorView(Table):
+
+    def __init__(self, source, monitor, check_every=1000):
+        self.source = source
+        self.monitor = monitor
+        self.check_every = check_every
+
+    def __iter__(self):
+        monitor = self.monitor
+        check_every = self.check_every
+        it = iter(self.source)
+        yield next(it)
+
+        count = 0
+        for row in it:
+            count += 1
+            if count == check_every:
+                monitor.rows += count
+                count = 0
+                monitor.tick()
+            yield row
+        monitor.rows += count
+
+
+def text_line(metrics):
+    line = '{stage}: {rows} rows in {elapsed_seconds:.1f}s ({rows_per_second:.0f} rows/s), ' \
+           '{read:.1f} MB read, {written:.1f} MB written, {rss:.0f} MB RSS'.format(
+               read=metrics['bytes_read'] / 1e6, written=metrics['bytes_written'] / 1e6,
+               rss=metrics['rss_bytes'] / 1e6, **metrics)
+    if metrics['eta_seconds'] is not None and not metrics['done']:
+        line += ', ETA {:.0f}s'.format(metrics['eta_seconds'])
+    if metrics['db_batches']:
+        line += ', {} db batches ({:.3f}s avg)'.format(
+            metrics['db_batches'], metrics['db_batch_seconds_avg'])
+    return line
+
+
+PROMETHEUS_METRICS = [
+    # (metric name, metrics key, type, help)
+    ('taxitrips_rows_total', 'rows', 'counter', 'Rows processed'),
+    ('taxitrips_rows_per_second', 'rows_per_second', 'gauge', 'Rows processed per second since the last report'),
+    ('taxitrips_bytes_read_total', 'bytes_read', 'counter', 'Bytes read from input files'),
+    ('taxitrips_bytes_written_total', 'bytes_written', 'counter', 'Bytes written to output files'),
+    ('taxitrips_input_bytes', 'input_bytes', 'gauge', 'Total size of the input files'),
+    ('taxitrips_eta_seconds', 'eta_seconds', 'gauge', 'Estimated seconds until the input is all read'),
+    ('taxitrips_elapsed_seconds', 'elapsed_seconds', 'gauge', 'Seconds since the step started'),
+    ('taxitrips_rss_bytes', 'rss_bytes', 'gauge', 'Resident memory of the process'),
+    ('taxitrips_db_batches_total', 'db_batches', 'counter', 'Batches sent to the database'),
+    ('taxitrips_db_rows_total', 'db_rows', 'counter', 'Rows sent to the database'),
+    ('taxitrips_db_batch_seconds_avg', 'db_batch_seconds_avg', 'gauge', 'Average seconds per database batch'),
+    ('taxitrips_db_batch_seconds_last', 'db_batch_seconds_last', 'gauge', 'Seconds taken by the last database batch'),
+    ('taxitrips_done', 'done', 'gauge', 'Whether the step has finished'),
+    ('taxitrips_last_report_timestamp_seconds', 'timestamp', 'gauge', 'Time of the last report'),
+]
+
+
+def prometheus_text(metrics):
+    """Format a snapshot in the Prometheus text exposition format."""
+    lines = []
+    for name, key, kind, help in PROMETHEUS_METRICS:
+        value = metrics[key]
+        if value is None:
+            continue
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        lines.append('{}{{stage="{}"}} {}'.format(name, metrics['stage'], float(value)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,145 @@
+"""
+A compact lookup of the zip code, census block, street segment and hexbin for
+every point (rounded to 4 decimal places) in the XY_Zip_Block table.
+
+The table is built once from XY_Zip_Block.csv into a .npy file holding a
+structured array sorted by an integer key packed from the point's coordinates
+(see xy_keys). Loading the .npy file memory-maps it, so it is ready to use
+almost immediately, and many points can be looked up at once with a binary
+search over the keys.
+
+The columns of XY_Zip_Block.csv are, in order: xy_id, zip, block,
+lon_centroid, lat_centroid, lon_seg, lat_seg, seg_id and hexbin_id.
+"""
+
+import csv
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Philadelphia's latitudes always have 6 digits when multiplied by 10**4, so
+# the xy_id strings of XY_Zip_Block.csv (the longitude digits followed by the
+# latitude digits) are the same as these packed integers.
+LAT_DIGITS = 10 ** 6
+
+FLOAT_COLUMNS = ('lon_centroid', 'lat_centroid', 'lon_seg', 'lat_seg')
+INT_COLUMNS = ('seg_id', 'hexbin_id')
+
+
+def xy_keys(lngs, lats):
+    """
+    Pack arrays of longitudes and latitudes into integer keys. Points with
+    missing (NaN) coordinates get a key of -1, which matches nothing.
+    """
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    valid = ~(numpy.isnan(lngs) | numpy.isnan(lats))
+    keys = numpy.full(len(lngs), -1, dtype=numpy.int64)
+    keys[valid] = numpy.round(-lngs[valid] * 10000).astype(numpy.int64) * LAT_DIGITS \
+        + numpy.round(lats[valid] * 10000).astype(numpy.int64)
+    return keys
+
+
+def _toint(value):
+    try:
+        return int(value)
+    except ValueError:
+        return -1
+
+
+def _tofloat(value):
+    try:
+        return float(value)
+    except ValueError:
+        return numpy.nan
+
+
+def build(csvfile, npyfile):
+    """
+    Read XY_Zip_Block.csv and save it as a sorted structured array. Rows
+    without an integer xy_id (such as a header) are skipped, and if an xy_id
+    appears more than once, the last row wins. Missing integer values are
+    stored as -1 and missing floats as NaN.
+    """
+    rows = []
+    with open(csvfile, newline='') as f:
+        for row in csv.reader(f):
+            try:
+                key = int(row[0])
+            except (IndexError, ValueError):
+                continue
+            rows.append((key, row[1], row[2],
+                         _tofloat(row[3]), _tofloat(row[4]),
+                         _tofloat(row[5]), _tofloat(row[6]),
+                         _toint(row[7]), _toint(row[8])))
+
+    zip_width = max([len(r[1]) for r in rows] + [1])
+    block_width = max([len(r[2]) for r in rows] + [1])
+    dtype = numpy.dtype(
+        [('key', numpy.int64),
+         ('zip', 'U{}'.format(zip_width)), ('block', 'U{}'.format(block_width))] +
+        [(name, numpy.float64) for name in FLOAT_COLUMNS] +
+        [(name, numpy.int64) for name in INT_COLUMNS])
+    table = numpy.array(rows, dtype=dtype)
+
+    # Sort stably by key, and keep the last of any duplicates, as a dict would
+    order = numpy.argsort(table['key'], kind='stable')
+    table = table[order]
+    last = numpy.append(table['key'][1:] != table['key'][:-1], True)
+    table = table[last]
+
+    with open(npyfile, 'wb') as f:
+        numpy.save(f, table)
+    logger.info('Saved {} points to {}'.format(len(table), npyfile))
+    return table
+
+
+class XYLookup:
+    """
+    Look up points in a table saved by build. E.g., to add pickup zip codes to
+    batches of trips:
+
+        xy = XYLookup('XY_Zip_Block.npy')
+        def pickup_zips(rows):
+            lngs = [float(r['Pickup Longitude']) for r in rows]
+            lats = [float(r['Pickup Latitude']) for r in rows]
+            matches, found = xy.lookup(lngs, lats)
+            return (numpy.where(found, matches['zip'], ''),)
+        table.addbatchfields(('Pickup Zip',), pickup_zips)
+
+    """
+
+    def __init__(self, npyfile, mmap=True):
+        self.table = numpy.load(npyfile, mmap_mode='r' if mmap else None)
+        self.keys = self.table['key']
+
+    def __len__(self):
+        return len(self.table)
+
+    def find(self, keys):
+        """Return the index of each key in the table, or -1 if it's not there."""
+        keys = numpy.asarray(keys, dtype=numpy.int64)
+        if not len(self.keys):
+            return numpy.full(len(keys), -1, dtype=numpy.intp)
+        indexes = numpy.searchsorted(self.keys, keys)
+        indexes[indexes == len(self.keys)] = 0
+        found = self.keys[indexes] == keys
+        return numpy.where(found, indexes, -1)
+
+    def lookup(self, lngs, lats):
+        """
+        Look up arrays of points. Returns a pair of a structured array with a
+        row for each point, and a boolean array of whether each point was
+        found; the rows for points that were not found are meaningless.
+        """
+        indexes = self.find(xy_keys(lngs, lats))
+        found = indexes >= 0
+        if not len(self.table):
+            return numpy.zeros(len(indexes), dtype=self.table.dtype), found
+        return self.table[numpy.where(found, indexes, 0)], found
+
+    def get(self, lng, lat):
+        """Look up a single point, returning its row or None."""
+        matches, found = self.lookup([lng], [lat])
+        return matches[0] if found[0] else None
@@ -53,7 +53,7 @@ def distance(lon_1, lat_1, lon_2, lat_2):
     radius = 3959  # miles
     dlat = radians(lat_2 - lat_1)
     dlon = radians(lon_2 - lon_1)
-    a = sin(dlat / 2) * sin(dlat / 2) + cos(radians(lat_1)) * cos(radians(lat2)) * sin(dlon / 2) * sin(dlon / 2)
+    a = sin(dlat / 2) * sin(dlat / 2) + cos(radians(lat_1)) * cos(radians(lat_2)) * sin(dlon / 2) * sin(dlon / 2)
     c = 2 * atan2(sqrt(a), sqrt(1 - a))
     d = radius * c
 
@@ -129,7 +129,7 @@ class TaxiData:
 start = time.time()
 dir = os.path.dirname(os.path.realpath(__file__)) + "\\"
 j = 0
-ret_big = ''
+ret_big = []
 f_out = open(dir + 'taxiout.csv', 'w')
 header = 'rec_id,operator_name,medallion,chauffeur_id,pickup_datetime,dropoff_datetime,trip_distance,' \
          'xy_dist,heading,trip_minutes,pickup_latitude,pickup_longitude,pickup_latitude_seg,pickup_longitude_seg,pickup_latitude_centroid,pickup_longitude_centroid,pickup_seg_id,pickup_hexbin_id,pickup_zip,pickup_block,pickup_month,pickup_day,pickup_hr,pickup_dow,' \
@@ -402,11 +402,11 @@ try:
 
         j += 1
         i += 1
-        # not sure if this works but might go faster to write 1,000 lines at a time
-        ret_big = str.join('', (ret_big, ret))
+        # write 1,000 lines at a time
+        ret_big.append(ret)
         if j % 1000 == 0:
             f_out.writelines(ret_big)
-            ret_big = ''
+            ret_big = []
 
         if j % 100000 == 0:
             print(j)
@@ -17,74 +17,391 @@ Updates weekly.
 """
 
 import click
-from phila_taxitrips import (normalize, upload, update_anon, anonymize, fuzzy,
-    validate_trip_lengths,
-    RAW_COLUMNS_CSV, RAW_COLUMNS_DB, PUBLIC_COLUMNS_CSV, PUBLIC_COLUMNS_DB)
+from functools import partial
 import sys
 
+# The phila_taxitrips modules are imported within each command, so that only
+# the dependencies a command needs are loaded (and --help loads none of them).
+
+
+# (raw table column, anonymization table) pairs, for update_anon
+ANONYMIZATION_TABLES = [
+    ('Chauffeur_No', 'chauffeur_no_ids'),
+    ('Medallion', 'medallion_ids'),
+]
+
+# (CSV field, anonymization table, table column) tuples, for anonymize
+ANONYMIZED_FIELDS = [
+    ('Chauffeur #', 'chauffeur_no_ids', 'Chauffeur_No'),
+    ('Medallion', 'medallion_ids', 'Medallion'),
+]
+
+
+def parse_group_size(value):
+    return value if value == 'auto' else int(value)
+
 
 @click.group()
-def cli():
-    pass
+@click.option('--metrics', type=click.Path(), help='File to write throughput metrics to. Default is a line of progress on stderr every --metrics-interval seconds')
+@click.option('--metrics-format', type=click.Choice(['jsonl', 'prometheus']), help='jsonl appends a JSON object per report; prometheus rewrites a node_exporter textfile. Default is jsonl')
+@click.option('--metrics-interval', type=float, help='Seconds between metrics reports. Default is 10')
+@click.pass_context
+def cli(ctx, metrics, metrics_format, metrics_interval):
+    ctx.obj = {
+        'metrics': metrics,
+        'metrics_format': metrics_format,
+        'metrics_interval': metrics_interval,
+    }
+
+
+def make_monitor(stage, inputs=()):
+    """
+    A telemetry Monitor for a command, reporting as set by the --metrics
+    options. inputs are the command's input files, for estimating the time
+    left.
+    """
+    from phila_taxitrips.telemetry import Monitor, input_size
+    options = click.get_current_context().obj
+    return Monitor(stage,
+                   path=options['metrics'],
+                   format=options['metrics_format'] or 'jsonl',
+                   interval=options['metrics_interval'] or 10.0,
+                   input_bytes=input_size(inputs) or None)
+
+
+def no_metrics(what):
+    """
+    Refuse the --metrics options for a command (or mode of one) that doesn't
+    report metrics, rather than silently ignoring them.
+    """
+    options = click.get_current_context().obj
+    if any(options[name] is not None for name in ('metrics', 'metrics_format', 'metrics_interval')):
+        raise click.UsageError('{} doesn\'t report metrics; leave out the --metrics options'.format(what))
 
 
 @cli.command(name='normalize')
 @click.option('--verifone', '-v', type=click.Path(), multiple=True, help='Verifone data files')
 @click.option('--cmt', '-c', type=click.Path(), multiple=True, help='CMT data files')
-def normalize_cmd(verifone, cmt):
-    normalize(verifone, cmt)\
-        .progress()\
-        .tocsv()
+@click.option('--validate', is_flag=True, help='Also validate the trip lengths (see the validate command) in the same pass, reporting to stderr')
+@click.option('--geometry', is_flag=True, help='Add the straight-line distance, heading and cardinal direction of each trip')
+@click.option('--partition-by', type=click.Choice(['month']), help='Write the output into a directory (given with -o) with one partition per pickup month, and a manifest.json')
+@click.option('--months', '-m', multiple=True, help='With --partition-by, only (re-)write these months (YYYY-MM)')
+@click.option('--processes', '-p', type=int, help='Number of processes to use. With --partition-by, the files are normalized in parallel (default is the number of CPUs); otherwise, each file is split into pieces that are normalized in parallel (default is 1)')
+@click.option('--rejects', type=click.Path(), help='File to write the rows that can\'t be normalized to (e.g., with the wrong number of fields), each after the reason it was left out')
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def normalize_cmd(verifone, cmt, validate, geometry, partition_by, months, processes, rejects, output):
+    from phila_taxitrips import errors, normalize, normalize_partitioned
+    # Bad values and rows are counted, with a summary logged now and then
+    # rather than a warning for each one.
+    errors.collector = errors.ErrorCollector(reject_path=rejects)
+    if partition_by:
+        if not output or validate:
+            raise click.UsageError('--partition-by needs an output directory (-o), and can\'t be combined with --validate')
+        no_metrics('--partition-by')
+        normalize_partitioned(verifone, cmt, output, months=months, geometry=geometry, processes=processes)
+        errors.collector.close()
+        return
+
+    sinks = []
+    if validate:
+        from phila_taxitrips.stats import TripLengthStats
+        stats = TripLengthStats('Trip Length', 'Data Source')
+        sinks.append(stats)
+    monitor = make_monitor('normalize', verifone + cmt)
+    monitor.view(normalize(verifone, cmt, geometry=geometry, processes=processes).tee(*sinks))\
+        .tocsv(output)
+    errors.collector.close()
+    monitor.report(done=True)
+
+    if validate:
+        table = stats.table()
+        length_errors = stats.errors(table)
+        print(table.lookall(), file=sys.stderr)
+        print('\n'.join(length_errors), file=sys.stderr)
+        sys.exit(1 if length_errors else 0)
+
+
+@cli.command(name='sample')
+@click.option('--verifone', '-v', type=click.Path(), multiple=True, help='Verifone data files')
+@click.option('--cmt', '-c', type=click.Path(), multiple=True, help='CMT data files')
+@click.option('--size', '-n', type=int, default=1000, help='Number of trips to draw from each stratum. Default is 1000')
+@click.option('--by', type=click.Choice(['month', 'vendor']), default='month', help='Stratify the sample by month of the meter-on time, or by vendor. Default is month')
+@click.option('--seed', type=int, default=0, help='Random seed; the same seed gives the same sample of the same files. Default is 0')
+@click.option('--log', '-l', help='Log level. Default is debug')
+@click.argument('outdir', type=click.Path())
+def sample_cmd(verifone, cmt, size, by, seed, log, outdir):
+    from phila_taxitrips.sample import write_sample
+    no_metrics('sample')
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    written = write_sample(verifone, cmt, outdir, size, by=by, seed=seed)
+    for vendor, count in written.items():
+        print('{}: {} trips'.format(vendor, count), file=sys.stderr)
 
 
 @cli.command(name='uploadraw')
 @click.option('--database', '-d', help='The database connection string')
+@click.option('--pipeline', type=int, default=0, help='Number of row groups to prepare ahead of the database on a background thread. Default is 0 (no pipelining)')
+@click.option('--connections', type=int, default=1, help='Number of database connections to upload over in parallel. Default is 1')
+@click.option('--skip-unchanged', type=click.Path(), help='Index file of previously uploaded rows; rows that have not changed since are not sent again')
+@click.option('--checkpoint-every', type=int, default=0, help='Commit and record progress every this many row groups. Default is 0 (commit only at the end)')
+@click.option('--resume', is_flag=True, help='Resume a checkpointed upload after the last committed row')
+@click.option('--group-size', default='100000', help='Number of rows to send to the database at a time, or "auto" to adjust it based on throughput. Default is 100000')
+@click.option('--dedupe', type=click.Choice(['first', 'last']), help='Sort the rows on the trip\'s identifying columns and upload only the first or last row read for each trip')
+@click.option('--sort-buffer', type=int, help='With --dedupe, the number of rows to sort in memory before spilling to temporary files. Default is 100000')
+@click.option('--typed-money', is_flag=True, help='Send the money columns as numbers rather than text, for NUMBER(10,2) columns (see SCHEMA.md)')
+@click.option('--log', '-l', help='Log level. Default is debug')
 @click.argument('csvfile', type=click.Path())
-def uploadraw_cmd(csvfile, database):
-    upload(csvfile, database, 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB, wrap_table=lambda t: t.progress())
-    update_anon(database, 'taxi_trips', [
-        ('Chauffeur_No', 'chauffeur_no_ids'),
-        ('Medallion', 'medallion_ids'),
-    ])
+def uploadraw_cmd(csvfile, database, pipeline, connections, skip_unchanged, checkpoint_every, resume, group_size, dedupe, sort_buffer, typed_money, log):
+    from phila_taxitrips import errors, upload, update_anon, RAW_COLUMNS_CSV, RAW_COLUMNS_DB
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    if resume and not checkpoint_every:
+        raise click.UsageError('--resume needs the --checkpoint-every of the upload being resumed')
+    if pipeline and connections > 1:
+        raise click.UsageError('--pipeline can\'t be combined with --connections, which already reads ahead')
+    monitor = make_monitor('uploadraw', [csvfile])
+    upload(csvfile, database, 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB, wrap_table=monitor.view, monitor=monitor, pipeline=pipeline, connections=connections, index_file=skip_unchanged, checkpoint_every=checkpoint_every, resume=resume, group_size=parse_group_size(group_size), dedupe=dedupe, sort_buffersize=sort_buffer, typed_money=typed_money)
+    errors.collector.close()
+    monitor.report(done=True)
+    update_anon(database, 'taxi_trips', ANONYMIZATION_TABLES)
 
 
 @cli.command(name='anonymize')
 @click.option('--database', '-d', help='The database connection string')
 @click.option('--log', '-l', help='Log level. Default is debug')
 @click.argument('csvfile', type=click.Path())
-def anonymize_cmd(csvfile, database, log):
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def anonymize_cmd(csvfile, database, log, output):
+    from phila_taxitrips import anonymize
     if log:
         import logging
         logging.basicConfig(level=getattr(logging, log.upper()))
-    anonymize(csvfile, database, [
-        ('Chauffeur #', 'chauffeur_no_ids', 'Chauffeur_No'),
-        ('Medallion', 'medallion_ids', 'Medallion'),
-    ])\
-        .progress(10000)\
-        .tocsv()
+    monitor = make_monitor('anonymize', [csvfile])
+    monitor.view(anonymize(csvfile, database, ANONYMIZED_FIELDS))\
+        .tocsv(output)
+    monitor.report(done=True)
 
 @cli.command(name='fuzzy')
 @click.argument('csvfile', type=click.Path())
 @click.option('--regions', '-r', type=click.File('r'), help='Shapes to be used for binning trips inside of the City')
-def fuzzy_cmd(csvfile, regions):
-    fuzzy(csvfile, regions)\
-        .progress()\
-        .tocsv()
+@click.option('--geometry', is_flag=True, help='Add the straight-line distance, heading and cardinal direction of each trip, before the exact locations are removed')
+@click.option('--partition-by', type=click.Choice(['month']), help='Write the output into a directory (given with -o) with one partition per pickup month, and a manifest.json')
+@click.option('--months', '-m', multiple=True, help='With --partition-by, only (re-)write these months (YYYY-MM)')
+@click.option('--processes', '-p', type=int, help='With --partition-by, the number of processes to use. Default is the number of CPUs')
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def fuzzy_cmd(csvfile, regions, geometry, partition_by, months, processes, output):
+    from phila_taxitrips import fuzzy, fuzzy_partitioned
+    if partition_by:
+        if not output:
+            raise click.UsageError('--partition-by needs an output directory (-o)')
+        no_metrics('--partition-by')
+        fuzzy_partitioned(csvfile, regions.name, output, months=months, geometry=geometry, processes=processes)
+        return
+
+    monitor = make_monitor('fuzzy', [csvfile])
+    monitor.view(fuzzy(csvfile, regions, geometry=geometry))\
+        .tocsv(output)
+    monitor.report(done=True)
+
+@cli.command(name='run')
+@click.option('--verifone', '-v', type=click.Path(), multiple=True, help='Verifone data files')
+@click.option('--cmt', '-c', type=click.Path(), multiple=True, help='CMT data files')
+@click.option('--database', '-d', help='The database connection string')
+@click.option('--regions', '-r', type=click.Path(exists=True), required=True, help='Shapes to be used for binning trips inside of the City')
+@click.option('--geometry', is_flag=True, help='Add the straight-line distance, heading and cardinal direction of each trip')
+@click.option('--upload-raw', is_flag=True, help='First upload the normalized trips and update the anonymization tables, as uploadraw does. Otherwise, the trips must already have been uploaded')
+@click.option('--normalized', type=click.Path(), help='Also write the normalized trips to this file')
+@click.option('--anonymized', type=click.Path(), help='Also write the anonymized trips to this file')
+@click.option('--parallel', is_flag=True, help='Run normalize, anonymize and fuzzy in separate processes at the same time')
+@click.option('--rejects', type=click.Path(), help='File to write the rows that can\'t be normalized to (e.g., with the wrong number of fields), each after the reason it was left out')
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+@click.option('--log', '-l', help='Log level. Default is debug')
+def run_cmd(verifone, cmt, database, regions, geometry, upload_raw, normalized, anonymized, parallel, rejects, output, log):
+    from phila_taxitrips import (errors, normalize, upload, update_anon, anonymize, fuzzy,
+        echo, RAW_COLUMNS_CSV, RAW_COLUMNS_DB)
+    from phila_taxitrips.pipeline import pipeline, chain
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    if upload_raw:
+        # The same problems are found again in the pass below, and reported
+        # there, so don't report them here.
+        errors.collector = errors.ErrorCollector(interval=None)
+        monitor = make_monitor('uploadraw', verifone + cmt)
+        upload(normalize(verifone, cmt), database, 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB,
+               wrap_table=monitor.view, monitor=monitor)
+        monitor.report(done=True)
+        update_anon(database, 'taxi_trips', ANONYMIZATION_TABLES)
+
+    # As in normalize; with --parallel, the steps' problems are passed back
+    # along the pipeline.
+    errors.collector = errors.ErrorCollector(reject_path=rejects)
+
+    # Normalize, anonymize and fuzzy the trips in one streaming pass, without
+    # writing and re-reading the intermediate files.
+    source = partial(normalize, verifone, cmt, geometry=geometry)
+    anonymize_step = partial(anonymize, db_conn_str=database, field_tuples=ANONYMIZED_FIELDS)
+    fuzzy_step = partial(fuzzy, regionfile=regions)
+    if normalized:
+        anonymize_step = chain(partial(echo, filename=normalized), anonymize_step)
+    if anonymized:
+        fuzzy_step = chain(partial(echo, filename=anonymized), fuzzy_step)
+
+    if parallel:
+        table = pipeline(source, anonymize_step, fuzzy_step)
+    else:
+        table = chain(anonymize_step, fuzzy_step)(source())
+    monitor = make_monitor('run', verifone + cmt)
+    monitor.view(table)\
+        .tocsv(output)
+    errors.collector.close()
+    monitor.report(done=True)
 
 @cli.command(name='validate')
 @click.argument('csvfile', type=click.Path())
-def validate_cmd(csvfile):
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def validate_cmd(csvfile, output):
+    from phila_taxitrips import validate_trip_lengths
+    no_metrics('validate')
     table, errors = validate_trip_lengths(csvfile)
-    table.tocsv()
+    table.tocsv(output)
     print('\n'.join(errors), file=sys.stderr)
     sys.exit(1 if errors else 0)
 
+@cli.command(name='profile')
+@click.argument('csvfiles', type=click.Path(), nargs=-1, required=True)
+@click.option('--approximate', '-a', multiple=True, help='Columns to count approximately. Default is the high-cardinality columns of the normalized data (medallions, chauffeurs, times and locations)')
+@click.option('--exact', is_flag=True, help='Count every column exactly')
+@click.option('--top', type=int, default=10, help='Number of most common values to list per column. Default is 10')
+@click.option('--processes', '-p', type=int, help='Number of files to profile in parallel. Default is the number of CPUs')
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def profile_cmd(csvfiles, approximate, exact, top, processes, output):
+    from phila_taxitrips.profiling import profile_files, HIGH_CARDINALITY_COLUMNS
+    no_metrics('profile')
+    if exact:
+        approximate = []
+    elif not approximate:
+        approximate = HIGH_CARDINALITY_COLUMNS
+    profile_files(csvfiles, approximate, top, processes)\
+        .table()\
+        .tocsv(output)
+
+@cli.command(name='buildxy')
+@click.argument('csvfile', type=click.Path(exists=True))
+@click.argument('npyfile', type=click.Path())
+def buildxy_cmd(csvfile, npyfile):
+    from phila_taxitrips.xylookup import build as build_xy_lookup
+    no_metrics('buildxy')
+    build_xy_lookup(csvfile, npyfile)
+
+@cli.command(name='cube')
+@click.argument('csvfile', type=click.Path(exists=True))
+@click.argument('cubefile', type=click.Path())
+@click.option('--batch', '-b', help='Name of this batch of trips, so that it isn\'t added twice. Default is the name of the CSV file')
+@click.option('--log', '-l', help='Log level. Default is debug')
+def cube_cmd(csvfile, cubefile, batch, log):
+    import os
+    from phila_taxitrips import as_table
+    from phila_taxitrips.cube import Cube
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    cube = Cube(cubefile)
+    batch = batch or os.path.basename(csvfile)
+    if batch in cube.batches:
+        raise click.UsageError('Batch {} has already been added to {}'.format(batch, cubefile))
+    monitor = make_monitor('cube', [csvfile])
+    cube.add(monitor.view(as_table(csvfile)), batch)
+    cube.save()
+    monitor.report(done=True)
+
+@cli.command(name='store')
+@click.argument('csvfile', type=click.Path(exists=True))
+@click.argument('storedir', type=click.Path())
+@click.option('--batch', '-b', help='Name of this batch of trips, so that it isn\'t added twice. Default is the name of the CSV file')
+@click.option('--log', '-l', help='Log level. Default is debug')
+def store_cmd(csvfile, storedir, batch, log):
+    import os
+    from phila_taxitrips import as_table, errors
+    from phila_taxitrips.store import TripStore
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    store = TripStore(storedir)
+    batch = batch or os.path.basename(csvfile)
+    if batch in store.batches:
+        raise click.UsageError('Batch {} has already been added to {}'.format(batch, storedir))
+    monitor = make_monitor('store', [csvfile])
+    store.append(monitor.view(as_table(csvfile)), batch)
+    errors.collector.close()
+    monitor.report(done=True)
+
+@cli.command(name='query')
+@click.argument('storedir', type=click.Path(exists=True))
+@click.option('--where', '-w', multiple=True, help='A condition on a column, like "Medallion=4128" or "Meter On Datetime>=2015-03-01"; the operators are = != < <= > >=, but text columns other than the datetimes only take = and !=. Trips must meet all of them')
+@click.option('--columns', '-c', multiple=True, help='Columns to output. Default is all of them')
+@click.option('--log', '-l', help='Log level. Default is debug')
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def query_cmd(storedir, where, columns, log, output):
+    from phila_taxitrips.store import TripStore, Predicate
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    try:
+        predicates = [Predicate.parse(text) for text in where]
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint='--where')
+    try:
+        table = TripStore(storedir).query(predicates, columns)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+    monitor = make_monitor('query')
+    monitor.view(table)\
+        .tocsv(output)
+    monitor.report(done=True)
+
+@cli.command(name='rollup')
+@click.argument('cubefile', type=click.Path(exists=True))
+@click.option('--by', multiple=True, type=click.Choice(['pickup_region', 'dropoff_region', 'hour', 'dow']), help='Dimensions to keep; the cube is summed over the rest. Default is all of them')
+@click.option('--output', '-o', type=click.Path(), help='File to write to, compressed if it ends in .gz or .zst. Default is stdout')
+def rollup_cmd(cubefile, by, output):
+    from phila_taxitrips.cube import Cube, rollup_table, DIMENSIONS
+    no_metrics('rollup')
+    rollup_table(Cube(cubefile), by or DIMENSIONS)\
+        .tocsv(output)
+
 @cli.command(name='uploadpublic')
 @click.option('--database', '-d', help='The database connection string')
+@click.option('--pipeline', type=int, default=0, help='Number of row groups to prepare ahead of the database on a background thread. Default is 0 (no pipelining)')
+@click.option('--connections', type=int, default=1, help='Number of database connections to upload over in parallel. Default is 1')
+@click.option('--skip-unchanged', type=click.Path(), help='Index file of previously uploaded rows; rows that have not changed since are not sent again')
+@click.option('--checkpoint-every', type=int, default=0, help='Commit and record progress every this many row groups. Default is 0 (commit only at the end)')
+@click.option('--resume', is_flag=True, help='Resume a checkpointed upload after the last committed row')
+@click.option('--group-size', default='100000', help='Number of rows to send to the database at a time, or "auto" to adjust it based on throughput. Default is 100000')
+@click.option('--dedupe', type=click.Choice(['first', 'last']), help='Sort the rows and upload each distinct row only once')
+@click.option('--sort-buffer', type=int, help='With --dedupe, the number of rows to sort in memory before spilling to temporary files. Default is 100000')
+@click.option('--typed-money', is_flag=True, help='Send the money columns as numbers rather than text, for NUMBER(10,2) columns (see SCHEMA.md)')
+@click.option('--strategy', type=click.Choice(['merge', 'swap']), default='merge', help='merge upserts the rows into the table; swap replaces its contents, by loading a shadow copy, indexing it and swapping it in. Default is merge')
+@click.option('--log', '-l', help='Log level. Default is debug')
 @click.argument('csvfile', type=click.Path())
-def uploadpublic_cmd(csvfile, database):
-    upload(csvfile, database, 'public_taxi_trips', PUBLIC_COLUMNS_CSV, PUBLIC_COLUMNS_DB, wrap_table=lambda t: t.progress(10000))\
-        .tocsv()
+def uploadpublic_cmd(csvfile, database, pipeline, connections, skip_unchanged, checkpoint_every, resume, group_size, dedupe, sort_buffer, typed_money, strategy, log):
+    from phila_taxitrips import errors, upload, PUBLIC_COLUMNS_CSV, PUBLIC_COLUMNS_DB, PUBLIC_INDEXES
+    if log:
+        import logging
+        logging.basicConfig(level=getattr(logging, log.upper()))
+    if strategy == 'swap' and (connections > 1 or skip_unchanged or checkpoint_every):
+        raise click.UsageError('--strategy swap can\'t be combined with --connections, --skip-unchanged or --checkpoint-every')
+    if resume and not checkpoint_every:
+        raise click.UsageError('--resume needs the --checkpoint-every of the upload being resumed')
+    if pipeline and connections > 1:
+        raise click.UsageError('--pipeline can\'t be combined with --connections, which already reads ahead')
+    monitor = make_monitor('uploadpublic', [csvfile])
+    upload(csvfile, database, 'public_taxi_trips', PUBLIC_COLUMNS_CSV, PUBLIC_COLUMNS_DB, wrap_table=monitor.view, monitor=monitor, pipeline=pipeline, connections=connections, index_file=skip_unchanged, checkpoint_every=checkpoint_every, resume=resume, group_size=parse_group_size(group_size), dedupe=dedupe, sort_buffersize=sort_buffer, typed_money=typed_money, strategy=strategy, indexes=PUBLIC_INDEXES, echo='-')
+    errors.collector.close()
+    monitor.report(done=True)
 
 
 if __name__ == '__main__':
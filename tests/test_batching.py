@@ -0,0 +1,44 @@
+from phila_taxitrips.batching import AdaptiveBatchSize, FixedBatchSize, batches
+
+
+def simulate(sizer, seconds_for, num_batches=60):
+    """Feed the sizer the times of a simulated server, returning the sizes used."""
+    sizes = []
+    for _ in range(num_batches):
+        sizes.append(sizer.size)
+        sizer.record(sizer.size, seconds_for(sizer.size))
+    return sizes
+
+
+def test_batches_follow_the_sizer():
+    assert [''.join(b) for b in batches(FixedBatchSize(3), 'ABCDEFG')] == ['ABC', 'DEF', 'G']
+
+
+def test_grows_while_round_trips_dominate():
+    # A fixed 10ms round trip and a tiny cost per row: bigger is always faster.
+    sizer = AdaptiveBatchSize(initial=100, maximum=20000)
+    sizes = simulate(sizer, lambda n: 0.01 + 1e-7 * n)
+    assert sizes[-1] == 20000
+
+
+def test_settles_near_the_fastest_size():
+    # Rows get slower to send past 5000 per batch (e.g., the server starts to
+    # spill), so throughput peaks there.
+    def seconds_for(n):
+        return 0.01 + 1e-6 * n + (1e-9 * (n - 5000) ** 2 if n > 5000 else 0)
+    sizer = AdaptiveBatchSize(initial=100, maximum=200000)
+    sizes = simulate(sizer, seconds_for, num_batches=150)
+    assert all(4000 <= size <= 8000 for size in sizes[-30:])
+
+
+def test_memory_budget_caps_the_size():
+    sizer = AdaptiveBatchSize(initial=100000, max_bytes=1024 * 1024)
+    sizer.fit([('x' * 100,) * 10] * 10)
+    assert sizer.size == sizer.maximum < 1024 * 1024 // 1000
+
+
+def test_short_last_batch_is_left_out_of_the_history():
+    sizer = AdaptiveBatchSize(initial=100)
+    sizer.record(100, 0.1)
+    sizer.record(37, 0.05)
+    assert [size for size, _, _, _ in sizer.report()] == [100]
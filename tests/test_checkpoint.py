@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import petl
+import pytest
+from phila_taxitrips import RAW_COLUMNS_CSV, RAW_COLUMNS_DB, normalize, upload
+
+
+@pytest.fixture
+def trips_csv(tmp_path):
+    path = str(tmp_path / 'trips.csv')
+    normalize([], ['testdata/cmt1.csv']).head(50).tocsv(path)
+    return path
+
+
+class Crash(Exception):
+    pass
+
+
+def crash_after(num_rows, seen):
+    """A wrap_table that fails the upload after num_rows rows."""
+    def wrap(table):
+        def check(row):
+            seen.append(row)
+            if len(seen) > num_rows:
+                raise Crash()
+            return True
+        return table.select(check)
+    return wrap
+
+
+def _upload(csvfile, db_path, **kwargs):
+    upload(csvfile, 'sqlite:' + db_path, 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB,
+           group_size=10, checkpoint_every=1, **kwargs)
+
+
+def _count(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute('SELECT COUNT(*) FROM taxi_trips').fetchone()[0]
+
+
+def test_resume_starts_after_the_last_commit(tmp_path, trips_csv):
+    db_path = str(tmp_path / 'trips.db')
+    with pytest.raises(Crash):
+        _upload(trips_csv, db_path, wrap_table=crash_after(25, []))
+    assert _count(db_path) == 20
+    assert os.path.exists(trips_csv + '.checkpoint')
+
+    seen = []
+    _upload(trips_csv, db_path, resume=True, wrap_table=crash_after(50, seen))
+    assert len(seen) == 30
+    assert _count(db_path) == 50
+    assert not os.path.exists(trips_csv + '.checkpoint')
+
+
+def test_resume_refuses_a_changed_file(tmp_path, trips_csv):
+    db_path = str(tmp_path / 'trips.db')
+    with pytest.raises(Crash):
+        _upload(trips_csv, db_path, wrap_table=crash_after(25, []))
+    with open(trips_csv, 'a') as outfile:
+        outfile.write(open(trips_csv).readlines()[-1])
+    with pytest.raises(ValueError, match='changed'):
+        _upload(trips_csv, db_path, resume=True)
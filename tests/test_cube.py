@@ -0,0 +1,45 @@
+import random
+from collections import Counter, defaultdict
+import petl
+import pytest
+from phila_taxitrips.cube import Cube, rollup_table
+
+HEADER = ('Pickup Region ID', 'Dropoff Region ID', 'Pickup Hour', 'Pickup DOW',
+          'Fare', 'Tips', 'Trip Total')
+
+
+def random_trips(n, seed):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        fare = rng.randrange(300, 5000)
+        tips = rng.randrange(0, 1000)
+        rows.append((rng.choice(['', '0', '12', '345']), rng.choice(['', '7', '12']),
+                     str(rng.randrange(24)), str(rng.randrange(7)),
+                     '{:.2f}'.format(fare / 100), '{:.2f}'.format(tips / 100),
+                     '{:.2f}'.format((fare + tips) / 100)))
+    return rows
+
+
+def test_rollups_match_a_plain_count(tmp_path):
+    first, second = random_trips(500, 1), random_trips(300, 2)
+    no_hour = ('12', '7', '', '3', '1.00', '0.00', '1.00')
+    path = str(tmp_path / 'cube.npz')
+
+    cube = Cube(path)
+    assert cube.add(petl.wrap([HEADER] + first + [no_hour]), 'week1', batch_size=64) == 500
+    cube.save()
+    cube = Cube(path)
+    cube.add(petl.wrap([HEADER] + second), 'week2', batch_size=64)
+    with pytest.raises(ValueError):
+        cube.add(petl.wrap([HEADER] + second), 'week2')
+
+    trips, fares = Counter(), defaultdict(int)
+    for pickup, _, hour, _, fare, _, _ in first + second:
+        key = (int(pickup) if pickup else None, int(hour))
+        trips[key] += 1
+        fares[key] += round(float(fare) * 100)
+
+    table = rollup_table(cube, ('pickup_region', 'hour'))
+    rolled = {(row[0], row[1]): (row[2], int(row[3])) for row in table.data()}
+    assert rolled == {key: (trips[key], fares[key]) for key in trips}
@@ -0,0 +1,62 @@
+import csv
+import pytest
+from phila_taxitrips import errors, normalize
+
+TESTDATA = 'testdata/'
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = errors.ErrorCollector(interval=None, keep_rejects=True)
+    monkeypatch.setattr(errors, 'collector', collector)
+    return collector
+
+
+@pytest.fixture
+def bad_cmt(tmp_path):
+    """A CMT file with some rows cut short, some too long, and a bad date."""
+    with open(TESTDATA + 'cmt1.csv', newline='') as infile:
+        rows = list(csv.reader(infile))
+    header, rows = rows[0], rows[1:101]
+    rows[3] = rows[3][:10]
+    rows[7] = rows[7] + ['extra', 'fields']
+    rows[11][6] = '13/45/2015 99:99'
+    path = tmp_path / 'cmt_bad.csv'
+    with open(path, 'w', newline='') as outfile:
+        csv.writer(outfile).writerows([header] + rows)
+    return str(path)
+
+
+def test_malformed_rows_next_to_good_files_are_rejected(collector, bad_cmt):
+    table = normalize([TESTDATA + 'verifone1.csv'], [TESTDATA + 'cmt1.csv', bad_cmt])
+    header = table.header()
+    # Not list(table.data()): it asks petl for the length first, which
+    # reads the whole table (and counts its problems) an extra time.
+    rows = [row for row in table.data()]
+
+    # 1499 Verifone trips (the first row is taken by the header), 1500 CMT
+    # trips from the good file, and 98 of the 100 from the bad one.
+    assert len(rows) == 1499 + 1500 + 98
+    assert all(len(row) == len(header) for row in rows)
+    assert collector.counts == {
+        ('(row)', errors.WRONG_LENGTH): 2,
+        ('Meter On Datetime', 'bad date'): 1,
+    }
+    assert [len(row) for row in collector.rejected] == [1 + 10, 1 + 25]
+
+
+def test_parallel_normalize_matches_serial(monkeypatch, bad_cmt):
+    verifone = [TESTDATA + 'verifone1.csv']
+    cmt = [TESTDATA + 'cmt1.csv', bad_cmt, TESTDATA + 'cmt2.csv']
+    results = []
+    for processes in (None, 2):
+        collector = errors.ErrorCollector(interval=None, keep_rejects=True)
+        monkeypatch.setattr(errors, 'collector', collector)
+        rows = [row for row in normalize(verifone, cmt, processes=processes)]
+        results.append((rows, collector.counts, collector.rejected))
+
+    serial, parallel = results
+    assert parallel[0] == serial[0]
+    assert parallel[1] == serial[1]
+    assert sorted(parallel[2]) == sorted(serial[2])
+    assert serial[1][('(row)', errors.WRONG_LENGTH)] == 2
@@ -0,0 +1,50 @@
+import os
+import petl
+from phila_taxitrips import normalize, normalize_partitioned
+from phila_taxitrips.partition import Manifest, UNKNOWN, write_partitions
+
+TRIPS = petl.wrap([
+    ('Pickup Year', 'Pickup Month', 'Fare'),
+    ('2015', '6', '1.00'),
+    ('2015', '7', '2.00'),
+    ('2015', '6', '3.00'),
+    ('', '', '4.00'),
+])
+
+
+def test_rows_go_to_the_partition_of_their_month(tmp_path):
+    outdir = str(tmp_path)
+    counts = write_partitions(TRIPS, outdir, 'part-0000')
+    assert counts == {'2015-06': 2, '2015-07': 1, UNKNOWN: 1}
+    june = petl.fromcsv(os.path.join(outdir, '2015-06', 'part-0000.csv'))
+    assert list(june.values('Fare')) == ['1.00', '3.00']
+
+    counts = write_partitions(TRIPS, outdir, 'part-0001', months={'2015-07'})
+    assert counts == {'2015-07': 1}
+
+
+def test_manifest_clears_only_the_months_rewritten(tmp_path):
+    outdir = str(tmp_path)
+    manifest = Manifest(outdir)
+    manifest.add('part-0000', write_partitions(TRIPS, outdir, 'part-0000'))
+    manifest.save()
+
+    manifest = Manifest(outdir)
+    assert manifest.months() == ['2015-06', '2015-07', UNKNOWN]
+    june = manifest.files('2015-06')
+    manifest.clear(['2015-07'])
+    assert not os.path.exists(os.path.join(outdir, '2015-07', 'part-0000.csv'))
+    assert all(os.path.exists(path) for path in june)
+    assert manifest.months() == ['2015-06', UNKNOWN]
+
+
+def test_normalize_partitioned_writes_every_trip(tmp_path):
+    verifone, cmt = ['testdata/verifone1.csv'], ['testdata/cmt1.csv', 'testdata/cmt2.csv']
+    outdir = str(tmp_path)
+    normalize_partitioned(verifone, cmt, outdir, processes=2)
+
+    manifest = Manifest(outdir)
+    expected = normalize(verifone, cmt).nrows()
+    assert sum(p['rows'] for p in manifest.partitions.values()) == expected
+    assert sum(petl.fromcsv(path).nrows()
+               for month in manifest.months() for path in manifest.files(month)) == expected
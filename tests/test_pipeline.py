@@ -0,0 +1,47 @@
+import os
+from functools import partial
+import petl
+import pytest
+from phila_taxitrips import errors, streams
+from phila_taxitrips.petl_ext import fromcsv
+from phila_taxitrips.pipeline import PipelineError, chain, pipeline
+
+
+def numbers(n):
+    return petl.wrap([('n',)] + [(str(i),) for i in range(n)])
+
+
+def double(table):
+    return table.convert('n', errors.checked(lambda v: int(v) * 2, 'n', 'bad number'))
+
+
+def add_bad(table):
+    return petl.cat(table, petl.wrap([('n',), ('x',)]))
+
+
+def die(table):
+    for row in table:
+        os._exit(3)
+    return table
+
+
+def test_rows_and_problems_come_through(monkeypatch):
+    collector = errors.ErrorCollector(interval=None)
+    monkeypatch.setattr(errors, 'collector', collector)
+    table = pipeline(partial(numbers, 2500), chain(add_bad, double), batch_size=100)
+    assert [row for row in table] == [('n',)] + [(i * 2,) for i in range(2500)] + [(None,)]
+    assert collector.counts == {('n', 'bad number'): 1}
+
+
+def test_bytes_read_by_the_steps_are_counted():
+    path = 'testdata/cmt1.csv'
+    before = streams.bytes_read.value
+    rows = [row for row in pipeline(partial(fromcsv, path), chain(), batch_size=100)]
+    assert len(rows) == 1501
+    assert streams.bytes_read.value - before >= os.path.getsize(path)
+
+
+def test_a_step_that_dies_is_an_error():
+    table = pipeline(partial(numbers, 10), die, double)
+    with pytest.raises(PipelineError, match='Step 2 .* code 3'):
+        table.header()
@@ -0,0 +1,35 @@
+import petl
+import pytest
+from phila_taxitrips.profiling import HyperLogLog, TableProfile, profile_files, profile_table
+
+
+def test_hyperloglog_is_within_a_few_percent():
+    for n in (100, 10000, 200000):
+        hll = HyperLogLog()
+        for i in range(n):
+            hll.add(i)
+        assert abs(hll.count() - n) <= 0.03 * n
+
+
+def test_merged_profiles_count_like_one(tmp_path):
+    rows = [(str(i % 50), str(i), '' if i % 10 == 0 else 'x') for i in range(3000)]
+    header = ('small', 'large', 'sparse')
+    paths = []
+    for part in range(3):
+        path = str(tmp_path / 'part{}.csv'.format(part))
+        petl.wrap([header] + rows[part::3]).tocsv(path)
+        paths.append(path)
+
+    # Everything but the top values, which tie here, and so come in any order.
+    whole = {row[0]: row[:6] for row in profile_table(petl.wrap([header] + rows), ['large']).table().data()}
+    merged = {row[0]: row[:6] for row in profile_files(paths, ['large'], processes=2).table().data()}
+
+    assert merged == whole
+    assert merged['small'][1:6] == (3000, 0, 0.0, 50, 'exact')
+    assert merged['sparse'][2:5] == (300, 0.1, 1)
+    assert merged['large'][4] == pytest.approx(3000, rel=0.03)
+
+
+def test_profiles_of_different_fields_dont_merge():
+    with pytest.raises(ValueError):
+        TableProfile(['a']).merge(TableProfile(['b']))
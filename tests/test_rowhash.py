@@ -0,0 +1,54 @@
+import sqlite3
+import petl
+import pytest
+from phila_taxitrips import RAW_COLUMNS_CSV, RAW_COLUMNS_DB, normalize, upload
+from phila_taxitrips.rowhash import RowHashIndex
+
+TESTDATA = 'testdata/'
+
+
+@pytest.fixture
+def trips_csv(tmp_path):
+    """Normalized trips, with the first trip delivered again with a new fare."""
+    table = normalize([], [TESTDATA + 'cmt1.csv']).head(50)
+    fare = table.header().index('Fare')
+    rows = list(table.data())
+    again = list(rows[0])
+    again[fare] = '99.99'
+    path = str(tmp_path / 'trips.csv')
+    petl.wrap([table.header()] + rows + [again]).tocsv(path)
+    return path
+
+
+def _upload(csvfile, db_path, index_file):
+    upload(csvfile, 'sqlite:' + db_path, 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB,
+           index_file=index_file)
+
+
+def _contents(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(conn.execute('SELECT * FROM taxi_trips').fetchall(), key=repr)
+
+
+def test_filter_skips_rows_already_uploaded(tmp_path):
+    index = RowHashIndex(str(tmp_path / 'index.npz'))
+    rows = [('a', 1), ('b', 2)]
+    assert index.filter(rows, [0]) == rows
+    index.save()
+
+    index = RowHashIndex(str(tmp_path / 'index.npz'))
+    assert len(index) == 2
+    assert index.filter([('a', 1), ('b', 3), ('c', 4)], [0]) == [('b', 3), ('c', 4)]
+
+
+def test_uploading_the_same_file_again_changes_nothing(tmp_path, trips_csv):
+    db_path = str(tmp_path / 'trips.db')
+    index_file = str(tmp_path / 'index.npz')
+
+    _upload(trips_csv, db_path, index_file)
+    first = _contents(db_path)
+    assert len(first) == 50
+    assert any('99.99' in row for row in first)
+
+    _upload(trips_csv, db_path, index_file)
+    assert _contents(db_path) == first
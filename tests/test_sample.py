@@ -0,0 +1,30 @@
+import os
+from phila_taxitrips import normalize
+from phila_taxitrips.sample import sample, write_sample
+
+VERIFONE = ['testdata/verifone*.csv']
+CMT = ['testdata/cmt*.csv']
+
+
+def test_sample_is_stratified_and_reproducible(tmp_path):
+    first, again = str(tmp_path / 'first'), str(tmp_path / 'again')
+    assert write_sample(VERIFONE, CMT, first, 50, by='vendor', seed=7) == {'verifone': 50, 'cmt': 50}
+    write_sample(VERIFONE, CMT, again, 50, by='vendor', seed=7)
+    for name in ('verifone.csv', 'cmt.csv'):
+        with open(os.path.join(first, name), 'rb') as a, open(os.path.join(again, name), 'rb') as b:
+            assert a.read() == b.read()
+
+    # The lines are whole trips from the files, which normalize can read.
+    table = normalize([os.path.join(first, 'verifone.csv')], [os.path.join(first, 'cmt.csv')])
+    assert table.nrows() == 49 + 50
+
+
+def test_lines_are_drawn_from_the_files_once_each():
+    lines = sample(VERIFONE, CMT, 40, by='vendor', seed=1)
+    assert len({(f.path, offset) for f, offset, _ in lines}) == len(lines) == 80
+    for vendor_file, offset, line in lines:
+        with open(vendor_file.path, 'rb') as infile:
+            infile.seek(offset)
+            assert infile.read(len(line)) == line
+    other = sample(VERIFONE, CMT, 40, by='vendor', seed=2)
+    assert [line for _, _, line in other] != [line for _, _, line in lines]
@@ -0,0 +1,46 @@
+import csv
+import petl
+from phila_taxitrips.splitcsv import ParallelPiecesView, piece_tables, record_ranges
+
+ROWS = [('id', 'note')] + [
+    (str(i), 'line one\nline "two", quoted' if i % 3 == 0 else 'plain')
+    for i in range(200)]
+
+
+def write_csv(path, rows=ROWS):
+    with open(path, 'w', newline='') as outfile:
+        csv.writer(outfile).writerows(rows)
+    return str(path)
+
+
+def test_ranges_cover_the_file_on_record_boundaries(tmp_path):
+    path = write_csv(tmp_path / 'notes.csv')
+    ranges = record_ranges(path, piece_size=100)
+    assert len(ranges) > 10
+    assert ranges[0][0] == 0
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+    # Each range parses to whole records, which together make up the file.
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    assert ranges[-1][1] == len(data)
+    rows = []
+    for start, end in ranges:
+        rows += [tuple(row) for row in csv.reader(data[start:end].decode().splitlines(True))]
+    assert rows == ROWS
+
+
+def test_empty_file_has_no_ranges(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_bytes(b'')
+    assert record_ranges(str(path)) == []
+
+
+def test_pieces_read_in_parallel_match_the_file(tmp_path):
+    path = write_csv(tmp_path / 'notes.csv')
+    pieces = list(piece_tables(path, piece_size=500))
+    assert len(pieces) > 3
+    assert all(piece.header() == ROWS[0] for piece, _ in pieces)
+
+    table = ParallelPiecesView(pieces, processes=2)
+    assert [row for row in table] == [row for row in petl.fromcsv(path)]
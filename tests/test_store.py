@@ -0,0 +1,43 @@
+import petl
+import pytest
+from phila_taxitrips import errors, normalize
+from phila_taxitrips.petl_ext import Cents
+from phila_taxitrips.store import Predicate, TripStore
+
+
+@pytest.fixture
+def trips():
+    rows = [list(row) for row in normalize([], ['testdata/cmt1.csv']).head(300)]
+    fare = rows[0].index('Fare')
+    rows[5][fare] = 'n/a'
+    return petl.wrap(rows)
+
+
+def test_queries_compare_numbers_as_numbers(tmp_path, trips, monkeypatch):
+    collector = errors.ErrorCollector(interval=None)
+    monkeypatch.setattr(errors, 'collector', collector)
+    store = TripStore(str(tmp_path / 'store'))
+    assert store.append(trips, 'batch1', chunk_rows=100) == 300
+    assert collector.counts == {('Fare', 'bad amount'): 1}
+
+    store = TripStore(str(tmp_path / 'store'))
+    fares = [f for f in trips.values('Fare') if f != 'n/a']
+    expected = sorted(f for f in fares if f > Cents(500))
+    found = [row[0] for row in store.query([Predicate.parse('Fare>5')], ['Fare']).data()]
+    assert sorted(found) == expected
+    # 10.00 > 5, though not as text.
+    assert any(f >= Cents(1000) for f in found)
+
+
+def test_batches_are_only_added_once(tmp_path, trips):
+    store = TripStore(str(tmp_path / 'store'))
+    store.append(trips, 'batch1')
+    with pytest.raises(ValueError, match='already'):
+        store.append(trips, 'batch1')
+
+
+def test_text_columns_only_take_equality(tmp_path, trips):
+    store = TripStore(str(tmp_path / 'store'))
+    store.append(trips, 'batch1')
+    with pytest.raises(ValueError, match='only be compared'):
+        store.query([Predicate.parse('Medallion>1')])
@@ -0,0 +1,25 @@
+import sys
+from phila_taxitrips import streams
+from phila_taxitrips.petl_ext import fromcsv, tocsv
+
+ROWS = [('a', 'b'), ('1', '2'), ('3', '4')]
+
+
+def test_compressed_round_trip(tmp_path):
+    path = str(tmp_path / 'rows.csv.gz')
+    before = streams.bytes_written.value
+    tocsv(ROWS, path)
+    assert streams.bytes_written.value > before
+    assert open(path, 'rb').read(2) == b'\x1f\x8b'
+    assert list(fromcsv(path)) == ROWS
+
+
+def test_stdin_can_be_read_more_than_once(tmp_path, monkeypatch):
+    path = tmp_path / 'rows.csv'
+    path.write_text('a,b\n1,2\n3,4\n')
+    with open(path) as stdin:
+        monkeypatch.setattr(sys, 'stdin', stdin)
+        table = fromcsv('-')
+        assert table.header() == ROWS[0]
+        assert list(table) == ROWS
+        assert list(table) == ROWS
@@ -0,0 +1,48 @@
+import sqlite3
+import petl
+import pytest
+from phila_taxitrips import PUBLIC_COLUMNS_CSV, PUBLIC_COLUMNS_DB, PUBLIC_INDEXES, upload
+
+
+def _public_csv(path, num_rows, fare):
+    rows = [[str(i)] + ['0'] * (len(PUBLIC_COLUMNS_CSV) - 1) for i in range(num_rows)]
+    for row in rows:
+        row[PUBLIC_COLUMNS_CSV.index('Fare')] = fare
+    petl.wrap([PUBLIC_COLUMNS_CSV] + rows).tocsv(str(path))
+    return str(path)
+
+
+def _swap(csvfile, db_path):
+    upload(csvfile, 'sqlite:' + db_path, 'public_taxi_trips', PUBLIC_COLUMNS_CSV,
+           PUBLIC_COLUMNS_DB, strategy='swap', indexes=PUBLIC_INDEXES)
+
+
+def _fares(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [fare for fare, in conn.execute('SELECT Fare FROM public_taxi_trips')]
+
+
+def _names(db_path, kind):
+    with sqlite3.connect(db_path) as conn:
+        return {name for name, in conn.execute(
+            'SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+
+
+def test_swap_replaces_the_table(tmp_path):
+    db_path = str(tmp_path / 'trips.db')
+    _swap(_public_csv(tmp_path / 'first.csv', 10, '1.00'), db_path)
+    _swap(_public_csv(tmp_path / 'second.csv', 5, '2.00'), db_path)
+
+    assert _fares(db_path) == ['2.00'] * 5
+    tables = _names(db_path, 'table')
+    assert 'public_taxi_trips_shadow' not in tables
+    assert 'public_taxi_trips_old' not in tables
+    assert {name for name, _ in PUBLIC_INDEXES} <= _names(db_path, 'index')
+
+
+def test_empty_input_leaves_the_table_alone(tmp_path):
+    db_path = str(tmp_path / 'trips.db')
+    _swap(_public_csv(tmp_path / 'first.csv', 10, '1.00'), db_path)
+    with pytest.raises(ValueError, match='No rows'):
+        _swap(_public_csv(tmp_path / 'empty.csv', 0, '2.00'), db_path)
+    assert _fares(db_path) == ['1.00'] * 10
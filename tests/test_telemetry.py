@@ -0,0 +1,35 @@
+import json
+import petl
+from phila_taxitrips import streams
+from phila_taxitrips.telemetry import Monitor
+
+
+def test_reports_count_rows_bytes_and_batches(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    monitor = Monitor('test', path=path, interval=3600, input_bytes=1000)
+    table = petl.wrap([('n',)] + [(i,) for i in range(2500)])
+    assert sum(1 for _ in monitor.view(table, check_every=100).data()) == 2500
+    streams.bytes_read.add(250)
+    monitor.record_batch(100, 0.5)
+    monitor.record_batch(100, 1.5)
+    monitor.report(done=True)
+
+    with open(path) as infile:
+        metrics = [json.loads(line) for line in infile]
+    assert len(metrics) == 1
+    report = metrics[0]
+    assert report['rows'] == 2500
+    assert report['bytes_read'] == 250
+    assert report['done'] and report['eta_seconds'] == 0.0
+    assert report['db_batches'] == 2 and report['db_batch_seconds_avg'] == 1.0
+
+
+def test_prometheus_textfile_is_rewritten(tmp_path):
+    path = str(tmp_path / 'taxitrips.prom')
+    monitor = Monitor('upload', path=path, format='prometheus')
+    monitor.report()
+    monitor.report(done=True)
+    with open(path) as infile:
+        text = infile.read()
+    assert text.count('taxitrips_done{stage="upload"}') == 1
+    assert 'taxitrips_done{stage="upload"} 1.0' in text
@@ -0,0 +1,88 @@
+import logging
+import sqlite3
+import petl
+import pytest
+from phila_taxitrips import RAW_COLUMNS_CSV, RAW_COLUMNS_DB, errors, normalize, upload
+from phila_taxitrips.petl_ext import UPSERT_ID_COLUMNS, todb_upsert_partitioned
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.rolled_back = False
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakeCursor:
+
+    def __init__(self):
+        self.connection = FakeConnection()
+        self.rows = []
+
+    def executemany(self, sql, rows):
+        self.rows.extend(rows)
+
+
+class FakeDB:
+    """Just enough of a database connection for todb_upsert_partitioned."""
+    dialect = 'sqlite'
+
+    def __init__(self, fail_save=False):
+        self._c = FakeCursor()
+        self.fail_save = fail_save
+        self.saved = False
+
+    def save(self):
+        if self.fail_save:
+            raise RuntimeError('commit failed')
+        self.saved = True
+
+
+def _trips(n):
+    return petl.wrap([UPSERT_ID_COLUMNS + ('Fare',)] +
+                     [(str(i), 'c', 'on', 'off', '1.00') for i in range(n)])
+
+
+def test_partitions_are_all_sent_and_committed():
+    dbs = [FakeDB(), FakeDB(), FakeDB()]
+    todb_upsert_partitioned(_trips(300), 'taxi_trips', dbs, group_size=10)
+    assert all(db.saved for db in dbs)
+    assert sorted(row[0] for db in dbs for row in db._c.rows) == sorted(str(i) for i in range(300))
+    assert all(db._c.rows for db in dbs)
+
+
+def test_a_failed_commit_rolls_back_the_rest(caplog):
+    dbs = [FakeDB(), FakeDB(fail_save=True), FakeDB()]
+    with caplog.at_level(logging.WARNING), pytest.raises(RuntimeError):
+        todb_upsert_partitioned(_trips(300), 'taxi_trips', dbs, group_size=10)
+    assert dbs[0].saved and not dbs[0]._c.connection.rolled_back
+    assert dbs[1]._c.connection.rolled_back and dbs[2]._c.connection.rolled_back
+    assert not dbs[2].saved
+    assert 'not atomic' in caplog.text
+
+
+def test_connections_cannot_be_pipelined():
+    with pytest.raises(ValueError, match='pipeline'):
+        upload('unused.csv', 'sqlite:', 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB,
+               pipeline=2, connections=2)
+
+
+def test_typed_money_sends_bad_amounts_as_null(tmp_path, monkeypatch):
+    collector = errors.ErrorCollector(interval=None)
+    monkeypatch.setattr(errors, 'collector', collector)
+    rows = [list(row) for row in normalize([], ['testdata/cmt1.csv']).head(10)]
+    rows[2][rows[0].index('Fare')] = 'n/a'
+    csvfile = str(tmp_path / 'trips.csv')
+    petl.wrap(rows).tocsv(csvfile)
+    db_path = str(tmp_path / 'trips.db')
+
+    upload(csvfile, 'sqlite:' + db_path, 'taxi_trips', RAW_COLUMNS_CSV, RAW_COLUMNS_DB,
+           typed_money=True)
+
+    with sqlite3.connect(db_path) as conn:
+        fares = [fare for fare, in conn.execute('SELECT Fare FROM taxi_trips')]
+    assert len(fares) == 10
+    assert fares.count(None) == 1
+    assert collector.counts == {('Fare', 'bad amount'): 1}